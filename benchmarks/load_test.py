@@ -0,0 +1,131 @@
+"""
+Concurrent load generator for the Nextflow launcher API.
+
+Fires a fixed number of requests against one endpoint with a bounded number of requests in flight and reports
+latency percentiles and throughput. Pass several --base-url values (e.g. the current release and a candidate
+build) to compare them side by side under the same load:
+
+    python -m benchmarks.load_test --endpoint run --concurrency 100 --requests 2000 --token $TOKEN \\
+        --base-url http://launcher-old:8000/nextflow --base-url http://launcher-new:8000/nextflow
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Optional
+
+import httpx
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def build_request(endpoint: str, analysis_id: str, input_location: str) -> tuple[str, str, Optional[dict]]:
+    if endpoint == 'run':
+        return "POST", "/run", {'analysis_id': analysis_id,
+                                'pipeline_name': "nextflow-io/hello",
+                                'run_args': [],
+                                'keycloak_token': "keycloak_token",
+                                'input_location': input_location}
+    elif endpoint == 'conclude':
+        return "POST", "/conclude", {'run_id': f"nf-run-{uuid.uuid4()}",
+                                     'run_status': "succeeded",
+                                     'storage_location': "/workspace/missing"}
+    elif endpoint == 'stop':
+        return "POST", f"/stop/{analysis_id}", None
+    elif endpoint == 'healthz':
+        return "GET", "/healthz", None
+    else:
+        raise ValueError(f"Unsupported endpoint: {endpoint}")
+
+
+async def drive(client: httpx.AsyncClient, requests: list[tuple[str, str, Optional[dict]]], concurrency: int) -> dict:
+    """
+    Sends the (method, path, json body) requests with at most concurrency of them in flight.
+    :return: Throughput, latency percentiles in ms, status code counts and transport errors.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, status_codes, errors = [], {}, 0
+
+    async def one_request(method: str, path: str, body: Optional[dict]) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(one_request(*request) for request in requests))
+    wall_time = time.perf_counter() - wall_start
+
+    return {'requests': len(requests),
+            'concurrency': concurrency,
+            'throughput': len(requests) / wall_time,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p90_ms': percentile(latencies, 90) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': max(latencies) * 1000 if latencies else float('nan'),
+            'status_codes': status_codes,
+            'errors': errors}
+
+
+async def run_load(base_url: str,
+                   endpoint: str,
+                   concurrency: int,
+                   n_requests: int,
+                   token: Optional[str],
+                   analysis_id: str,
+                   input_location: str,
+                   timeout: float) -> dict:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    requests = [build_request(endpoint, analysis_id, input_location) for _ in range(n_requests)]
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=timeout) as client:
+        return {'base_url': base_url, **await drive(client, requests, concurrency)}
+
+
+def print_report(results: list[dict]) -> None:
+    print(f"{'base_url':<45} {'req/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}  status codes")
+    for r in results:
+        print(f"{r['base_url']:<45} {r['throughput']:>9.1f} {r['p50_ms']:>9.1f} {r['p90_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['max_ms']:>9.1f}  {r['status_codes']} (transport errors: {r['errors']})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the FLAME Nextflow launcher API.")
+    parser.add_argument('--base-url', action='append', dest='base_urls',
+                        help="Launcher API prefix, may be given several times to compare deployments "
+                             "(default: http://localhost:8000/nextflow)")
+    parser.add_argument('--endpoint', choices=['run', 'conclude', 'stop', 'healthz'], default='healthz')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--token', default=None, help="Bearer token for the authenticated endpoints")
+    parser.add_argument('--analysis-id', default="benchmark-analysis")
+    parser.add_argument('--input-location', default="input_location")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    args = parser.parse_args()
+
+    results = []
+    for base_url in args.base_urls or ["http://localhost:8000/nextflow"]:
+        results.append(asyncio.run(run_load(base_url,
+                                            args.endpoint,
+                                            args.concurrency,
+                                            args.requests,
+                                            args.token,
+                                            args.analysis_id,
+                                            args.input_location,
+                                            args.timeout)))
+    print_report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""
+Offline benchmark of the Nextflow launcher: runs the unmodified launcher against a fake Kubernetes API, a fake
+result service, analysis hub and JWKS, and a SQLite database, all on loopback, and drives its hot paths at a
+configurable concurrency and payload size. Needs no cluster, Keycloak or network:
+
+    python -m benchmarks.offline --scenario submit --scenario conclude --runs 500 --concurrency 50 \\
+        --input-bytes 10485760 --result-bytes 10485760 --json results.json
+
+Scenarios:
+    submit     POST /run, then waits until the scheduler staged the input and created the Job of every run
+    conclude   POST /conclude for running runs: result upload, analysis hub inform, Job and run dir cleanup
+    stop       POST /stop/{analysis_id} for analyses with running runs
+    lifecycle  submit, Jobs complete after --job-seconds and are concluded through the Job watch, reports the time
+               until each run was cleaned up
+
+Each scenario reports request throughput and latency percentiles, and the peak RSS of the launcher process.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import Callable, Optional
+
+import httpx
+import uvicorn
+
+from benchmarks.load_test import drive, percentile
+from benchmarks.offline.fake_k8s import FakeKubernetes
+from benchmarks.offline.fake_services import FakeServices
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SCENARIOS = ['submit', 'conclude', 'stop', 'lifecycle']
+NAMESPACE = 'default'
+# Runs per /runs:batch request when preparing a scenario
+SETUP_BATCH_SIZE = 500
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve_in_thread(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    threading.Thread(target=server.run, name=f"fake-{port}", daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def _peak_rss(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss(pid: int) -> None:
+    # lets every scenario report its own peak instead of the peak since startup
+    try:
+        with open(f"/proc/{pid}/clear_refs", 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+async def _wait_for(condition: Callable[[], bool], timeout: float, what: str) -> float:
+    """
+    :return: Monotonic time at which the condition was first seen to hold.
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out after {timeout}s waiting for {what}")
+        await asyncio.sleep(0.02)
+    return time.monotonic()
+
+
+class Benchmark:
+    def __init__(self, args: argparse.Namespace, work_path: str) -> None:
+        self.args = args
+        self.workspace_path = os.path.join(work_path, 'workspace')
+        self.log_path = os.path.join(work_path, 'launcher.log')
+        os.makedirs(self.workspace_path)
+        self.database_url = args.database_url or f"sqlite:///{os.path.join(work_path, 'launcher.db')}"
+        self.k8s = FakeKubernetes(self.workspace_path, result_bytes=args.result_bytes,
+                                  tasks_per_run=args.tasks_per_run)
+        self.services = FakeServices(input_bytes=args.input_bytes)
+        self.token = self.services.mint_token()
+        self.analysis_ids = {scenario: [f"bench-{scenario}-{i}" for i in range(args.analyses)]
+                             for scenario in SCENARIOS}
+        self._servers: list[uvicorn.Server] = []
+        self.launcher: Optional[subprocess.Popen] = None
+        self.launcher_url: Optional[str] = None
+
+    def start(self) -> None:
+        self.k8s.add_object(NAMESPACE, 'services',
+                            {'metadata': {'name': "flame-result-service",
+                                          'labels': {'component': "flame-result-service"}}})
+        for analysis_ids in self.analysis_ids.values():
+            for analysis_id in analysis_ids:
+                self.k8s.add_object(NAMESPACE, 'services',
+                                    {'metadata': {'name': f"analysis-nginx-{analysis_id}-0",
+                                                  'labels': {'component': "flame-analysis-nginx"}}})
+        k8s_port, services_port, launcher_port = _free_port(), _free_port(), _free_port()
+        self._servers = [_serve_in_thread(self.k8s.app, k8s_port),
+                         _serve_in_thread(self.services.app, services_port)]
+
+        env = {**os.environ,
+               'BENCH_K8S_URL': f"http://127.0.0.1:{k8s_port}",
+               'BENCH_SERVICES_URL': f"http://127.0.0.1:{services_port}",
+               'BENCH_DATABASE_URL': self.database_url,
+               'KEYCLOAK_URL': f"http://127.0.0.1:{services_port}",
+               'NF_WORKSPACE_PATH': self.workspace_path}
+        # scheduler limits and the reconciler would distort throughput, unless asked for explicitly
+        for name, value in [('NF_MAX_CONCURRENT_RUNS', "0"),
+                            ('NF_MAX_RUNS_PER_ANALYSIS', "0"),
+                            ('NF_RECONCILE_INTERVAL', "0")]:
+            env.setdefault(name, value)
+        with open(self.log_path, 'w') as log_file:
+            self.launcher = subprocess.Popen([sys.executable, "-m", "uvicorn", "benchmarks.offline.launcher:create_app",
+                                              "--factory", "--host", "127.0.0.1", "--port", str(launcher_port),
+                                              "--log-level", "warning"],
+                                             cwd=ROOT_PATH, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+        self.launcher_url = f"http://127.0.0.1:{launcher_port}/nextflow"
+
+        deadline = time.monotonic() + 60
+        while True:
+            if self.launcher.poll() is not None:
+                raise RuntimeError(f"Launcher exited with code {self.launcher.returncode}, see {self.log_path}")
+            try:
+                # ready once migrated and warmed up, so that cold start costs stay out of the measurements
+                if httpx.get(f"{self.launcher_url}/readyz", timeout=5).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Launcher did not become ready, see {self.log_path}")
+            time.sleep(0.1)
+
+    def stop(self) -> None:
+        if (self.launcher is not None) and (self.launcher.poll() is None):
+            self.launcher.terminate()
+            try:
+                self.launcher.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.launcher.kill()
+        for server in self._servers:
+            server.should_exit = True
+
+    def _run_spec(self, scenario: str, index: int) -> dict:
+        return {'analysis_id': self.analysis_ids[scenario][index % self.args.analyses],
+                'pipeline_name': "nextflow-io/hello",
+                'run_args': [],
+                'keycloak_token': self.token,
+                # distinct inputs, so that submissions are not deduplicated
+                'input_location': f"{scenario}-{index}"}
+
+    async def _prepare_runs(self, client: httpx.AsyncClient, scenario: str) -> list[str]:
+        # untimed: submits the runs in batches and waits until all of them are running
+        run_ids = []
+        for start in range(0, self.args.runs, SETUP_BATCH_SIZE):
+            specs = [self._run_spec(scenario, i) for i in range(start, min(start + SETUP_BATCH_SIZE, self.args.runs))]
+            response = await client.post("/runs:batch", json=specs)
+            response.raise_for_status()
+            run_ids += [run['run_id'] for run in response.json()['runs']]
+        await _wait_for(lambda: all(run_id in self.k8s.jobs_created for run_id in run_ids),
+                        self.args.timeout, f"{len(run_ids)} runs to start")
+        return run_ids
+
+    async def submit(self, client: httpx.AsyncClient) -> dict:
+        jobs_before = len(self.k8s.jobs_created)
+        start = time.monotonic()
+        result = await drive(client,
+                             [("POST", "/run", self._run_spec('submit', i)) for i in range(self.args.runs)],
+                             self.args.concurrency)
+        # runs are started by the scheduler after the response: input staging and Job creation
+        launched = await _wait_for(lambda: len(self.k8s.jobs_created) >= jobs_before + self.args.runs,
+                                   self.args.timeout, "submitted runs to start")
+        result['notes'] = f"all runs started after {launched - start:.2f}s " \
+                          f"({self.args.runs / (launched - start):.1f} runs/s)"
+        return result
+
+    async def conclude(self, client: httpx.AsyncClient) -> dict:
+        run_ids = await self._prepare_runs(client, 'conclude')
+        uploads_before = self.services.stats['uploads']
+        result = await drive(client,
+                             [("POST", "/conclude", {'run_id': run_id,
+                                                     'run_status': "succeeded",
+                                                     'storage_location': os.path.join(self.workspace_path, run_id)})
+                              for run_id in run_ids],
+                             self.args.concurrency)
+        result['notes'] = f"{self.services.stats['uploads'] - uploads_before} results uploaded"
+        return result
+
+    async def stop_runs(self, client: httpx.AsyncClient) -> dict:
+        run_ids = await self._prepare_runs(client, 'stop')
+        result = await drive(client,
+                             [("POST", f"/stop/{analysis_id}", None) for analysis_id in self.analysis_ids['stop']],
+                             min(self.args.concurrency, self.args.analyses))
+        stopped = sum(run_id in self.k8s.jobs_deleted for run_id in run_ids)
+        result['notes'] = f"{stopped} of {len(run_ids)} Jobs deleted"
+        return result
+
+    async def lifecycle(self, client: httpx.AsyncClient) -> dict:
+        self.k8s.job_seconds = self.args.job_seconds
+        deleted_before = set(self.k8s.jobs_deleted)
+        try:
+            start = time.monotonic()
+            submitted = await drive(client,
+                                    [("POST", "/run", self._run_spec('lifecycle', i)) for i in range(self.args.runs)],
+                                    self.args.concurrency)
+            await _wait_for(lambda: len(self.k8s.jobs_deleted) >= len(deleted_before) + self.args.runs,
+                            self.args.timeout, "runs to be concluded")
+        finally:
+            self.k8s.job_seconds = None
+        # time from the start of the scenario until each run's Job was deleted by its conclusion
+        done = [deleted - start for run_id, deleted in self.k8s.jobs_deleted.items() if run_id not in deleted_before]
+        return {'requests': self.args.runs,
+                'concurrency': self.args.concurrency,
+                'throughput': len(done) / max(done),
+                'p50_ms': percentile(done, 50) * 1000,
+                'p90_ms': percentile(done, 90) * 1000,
+                'p99_ms': percentile(done, 99) * 1000,
+                'max_ms': max(done) * 1000,
+                'status_codes': submitted['status_codes'],
+                'errors': submitted['errors'],
+                'notes': f"latency is submit to cleanup, Jobs run {self.args.job_seconds}s; "
+                         f"/run p50 {submitted['p50_ms']:.1f} ms, p99 {submitted['p99_ms']:.1f} ms"}
+
+    async def run(self, scenarios: list[str]) -> list[dict]:
+        limits = httpx.Limits(max_connections=self.args.concurrency, max_keepalive_connections=self.args.concurrency)
+        results = []
+        async with httpx.AsyncClient(base_url=self.launcher_url,
+                                     headers={"Authorization": f"Bearer {self.token}"},
+                                     limits=limits,
+                                     timeout=self.args.request_timeout) as client:
+            for scenario in scenarios:
+                _reset_peak_rss(self.launcher.pid)
+                scenario_func = {'submit': self.submit,
+                                 'conclude': self.conclude,
+                                 'stop': self.stop_runs,
+                                 'lifecycle': self.lifecycle}[scenario]
+                result = {'scenario': scenario, **await scenario_func(client)}
+                result['peak_rss_bytes'] = _peak_rss(self.launcher.pid)
+                results.append(result)
+        return results
+
+
+def print_report(results: list[dict]) -> None:
+    print(f"{'scenario':<10} {'requests':>8} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9} {'RSS MiB':>8}  status codes")
+    for r in results:
+        rss = f"{r['peak_rss_bytes'] / 1024 ** 2:.0f}" if r['peak_rss_bytes'] is not None else "n/a"
+        print(f"{r['scenario']:<10} {r['requests']:>8} {r['concurrency']:>5} {r['throughput']:>9.1f} "
+              f"{r['p50_ms']:>9.1f} {r['p90_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f} {rss:>8}  "
+              f"{r['status_codes']} (transport errors: {r['errors']})")
+        if r.get('notes'):
+            print(f"{'':<10} {r['notes']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the FLAME Nextflow launcher against fake dependencies.")
+    parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIOS,
+                        help="Scenario to run, may be given several times (default: all, in order)")
+    parser.add_argument('--runs', type=int, default=200, help="Runs submitted and concluded per scenario")
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--analyses', type=int, default=10, help="Analyses the runs are spread over")
+    parser.add_argument('--input-bytes', type=int, default=1024 ** 2, help="Size of each run's input download")
+    parser.add_argument('--result-bytes', type=int, default=1024 ** 2, help="Size of each run's result upload")
+    parser.add_argument('--tasks-per-run', type=int, default=10, help="Tasks in each run's trace")
+    parser.add_argument('--job-seconds', type=float, default=1.0, help="Duration of the Jobs of the lifecycle")
+    parser.add_argument('--database-url', default=None,
+                        help="SQLAlchemy URL of the launcher database, e.g. a local Postgres "
+                             "(default: a fresh SQLite file)")
+    parser.add_argument('--timeout', type=float, default=300.0, help="Seconds to wait for runs to start or finish")
+    parser.add_argument('--request-timeout', type=float, default=60.0)
+    parser.add_argument('--json', default=None, help="Also write the results to this file")
+    parser.add_argument('--keep', action='store_true', help="Keep the work dir with launcher log and database")
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp(prefix="nf-bench-")
+    benchmark = Benchmark(args, work_path)
+    try:
+        benchmark.start()
+        results = asyncio.run(benchmark.run(args.scenarios or SCENARIOS))
+    finally:
+        benchmark.stop()
+        if args.keep:
+            print(f"Launcher log and database kept in {work_path}")
+        else:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'config': vars(args), 'results': results}, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
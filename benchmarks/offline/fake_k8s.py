@@ -0,0 +1,268 @@
+"""
+In-memory stand-in for the parts of the Kubernetes API server the launcher uses: list, watch, get, create, replace,
+delete and delete-collection of namespaced resources (Jobs, Pods, Services, PVCs, Leases, ...), served with the
+same paths and JSON shapes as the real API so that the unmodified kubernetes client can talk to it.
+
+Jobs play the part of Nextflow runs: on creation they write a result file and a trace into their run dir on the
+workspace, and after job_seconds they report a Complete condition (they keep running if job_seconds is None).
+"""
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import bisect
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+# Watch events kept for watches resuming from an older resourceVersion, older ones get 410 Gone
+EVENT_LOG_SIZE = 10000
+TRACE_HEADER = "\t".join(["task_id", "name", "process", "status", "exit", "submit", "complete", "cpus", "memory",
+                          "realtime", "%cpu", "peak_rss", "rchar", "wchar"])
+
+_REQUIREMENT_SET = re.compile(r'\s*([\w./-]+)\s+(in|notin)\s+\(([^)]*)\)\s*')
+_REQUIREMENT_EQUALITY = re.compile(r'\s*([\w./-]+)\s*(==|=|!=)\s*([\w./-]*)\s*')
+_REQUIREMENT_EXISTS = re.compile(r'\s*(!?)([\w./-]+)\s*')
+
+
+def label_selector_matches(selector: Optional[str], labels: Optional[dict[str, str]]) -> bool:
+    """
+    Evaluates equality (a=b, a!=b), set (a in (b,c), a notin (b)) and existence (a, !a) requirements.
+    """
+    labels = labels or {}
+    for requirement in re.split(r',(?![^()]*\))', selector or ''):
+        if not requirement.strip():
+            continue
+        if match := _REQUIREMENT_SET.fullmatch(requirement):
+            key, operator, values = match.groups()
+            found = labels.get(key) in {value.strip() for value in values.split(',')}
+            if found != (operator == 'in'):
+                return False
+        elif match := _REQUIREMENT_EQUALITY.fullmatch(requirement):
+            key, operator, value = match.groups()
+            if (labels.get(key) == value) != (operator != '!='):
+                return False
+        elif match := _REQUIREMENT_EXISTS.fullmatch(requirement):
+            negated, key = match.groups()
+            if (key in labels) == bool(negated):
+                return False
+        else:
+            raise ValueError(f"Unsupported label selector: {selector}")
+    return True
+
+
+def _timestamp() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _status(code: int, reason: str, message: str) -> JSONResponse:
+    return JSONResponse({'kind': "Status", 'apiVersion': "v1", 'metadata': {}, 'status': "Failure",
+                         'message': message, 'reason': reason, 'code': code}, status_code=code)
+
+
+class FakeKubernetes:
+    def __init__(self,
+                 workspace_path: Optional[str] = None,
+                 job_seconds: Optional[float] = None,
+                 result_bytes: int = 1024 ** 2,
+                 tasks_per_run: int = 10) -> None:
+        self.workspace_path = workspace_path
+        self.job_seconds = job_seconds
+        self.result_bytes = result_bytes
+        self.tasks_per_run = tasks_per_run
+        self._objects: dict[tuple[str, str], dict[str, dict]] = {}
+        self._resource_version = 0
+        # (resourceVersion, namespace, resource, labels, serialized event), ordered by resourceVersion
+        self._events: list[tuple[int, str, str, dict[str, str], bytes]] = []
+        self._event_versions: list[int] = []
+        self._changed = asyncio.Event()
+        # monotonic creation and deletion times of Jobs, by name
+        self.jobs_created: dict[str, float] = {}
+        self.jobs_deleted: dict[str, float] = {}
+        self.requests = 0
+
+        app = FastAPI(title="Fake Kubernetes API")
+        for prefix in ["/api/{version}", "/apis/{group}/{version}"]:
+            app.add_api_route(prefix + "/namespaces/{namespace}/{resource}", self.collection_call,
+                              methods=["GET", "POST", "DELETE"])
+            app.add_api_route(prefix + "/namespaces/{namespace}/{resource}/{name}", self.object_call,
+                              methods=["GET", "PUT", "PATCH", "DELETE"])
+        app.add_api_route("/api/v1/namespaces/{namespace}/pods/{name}/log", self.pod_log_call, methods=["GET"])
+        app.add_api_route("/version", self.version_call, methods=["GET"])
+        self.app = app
+
+    def add_object(self, namespace: str, resource: str, obj: dict) -> dict:
+        """
+        Seeds an object, e.g. the result service and analysis nginx Services, before the launcher starts.
+        """
+        return self._store(namespace, resource, obj, 'ADDED')
+
+    def _store(self, namespace: str, resource: str, obj: dict, event_type: str) -> dict:
+        self._resource_version += 1
+        metadata = obj.setdefault('metadata', {})
+        metadata['namespace'] = namespace
+        metadata['resourceVersion'] = str(self._resource_version)
+        metadata.setdefault('uid', str(uuid.uuid4()))
+        metadata.setdefault('creationTimestamp', _timestamp())
+        objects = self._objects.setdefault((namespace, resource), {})
+        if event_type == 'DELETED':
+            objects.pop(metadata['name'], None)
+        else:
+            objects[metadata['name']] = obj
+
+        event = json.dumps({'type': event_type, 'object': obj}).encode() + b'\n'
+        self._events.append((self._resource_version, namespace, resource, metadata.get('labels') or {}, event))
+        self._event_versions.append(self._resource_version)
+        if len(self._events) > 2 * EVENT_LOG_SIZE:
+            del self._events[:EVENT_LOG_SIZE]
+            del self._event_versions[:EVENT_LOG_SIZE]
+        # wakes all watches, later watches wait on a fresh event
+        self._changed.set()
+        self._changed = asyncio.Event()
+        return obj
+
+    def _list(self, namespace: str, resource: str, label_selector: Optional[str]) -> list[dict]:
+        return [obj for obj in self._objects.get((namespace, resource), {}).values()
+                if label_selector_matches(label_selector, obj['metadata'].get('labels'))]
+
+    @staticmethod
+    def _list_body(items: list[dict], resource_version: int) -> dict:
+        return {'kind': "List", 'apiVersion': "v1", 'metadata': {'resourceVersion': str(resource_version)},
+                'items': items}
+
+    async def collection_call(self, request: Request, namespace: str, resource: str):
+        self.requests += 1
+        label_selector = request.query_params.get('labelSelector')
+        if request.method == "GET":
+            if request.query_params.get('watch') in ('true', '1', 'True'):
+                return StreamingResponse(self._watch(namespace,
+                                                     resource,
+                                                     label_selector,
+                                                     request.query_params.get('resourceVersion'),
+                                                     float(request.query_params.get('timeoutSeconds') or 300)),
+                                         media_type="application/json")
+            return self._list_body(self._list(namespace, resource, label_selector), self._resource_version)
+        elif request.method == "POST":
+            obj = await request.json()
+            name = obj.setdefault('metadata', {}).get('name')
+            if name is None:
+                name = obj['metadata']['name'] = obj['metadata'].get('generateName', "obj-") + uuid.uuid4().hex[:5]
+            if name in self._objects.get((namespace, resource), {}):
+                return _status(409, "AlreadyExists", f"{resource} \"{name}\" already exists")
+            obj.setdefault('status', {})
+            self._store(namespace, resource, obj, 'ADDED')
+            if resource == 'jobs':
+                await self._start_job(namespace, name)
+            return JSONResponse(obj, status_code=201)
+        else:
+            deleted = [self._delete(namespace, resource, obj['metadata']['name'])
+                       for obj in self._list(namespace, resource, label_selector)]
+            return self._list_body(deleted, self._resource_version)
+
+    async def object_call(self, request: Request, namespace: str, resource: str, name: str):
+        self.requests += 1
+        obj = self._objects.get((namespace, resource), {}).get(name)
+        if obj is None:
+            return _status(404, "NotFound", f"{resource} \"{name}\" not found")
+        if request.method == "GET":
+            return obj
+        elif request.method == "DELETE":
+            self._delete(namespace, resource, name)
+            return {'kind': "Status", 'apiVersion': "v1", 'metadata': {}, 'status': "Success",
+                    'details': {'name': name, 'kind': resource}}
+        body = await request.json()
+        if request.method == "PATCH":
+            # merge patch of the top level fields, enough for labels, annotations and specs
+            for key, value in body.items():
+                obj[key] = {**obj.get(key, {}), **value} if isinstance(value, dict) else value
+            return self._store(namespace, resource, obj, 'MODIFIED')
+        expected = body.get('metadata', {}).get('resourceVersion')
+        if expected and (expected != obj['metadata']['resourceVersion']):
+            return _status(409, "Conflict", f"Operation cannot be fulfilled on {resource} \"{name}\": "
+                                            f"the object has been modified")
+        body.setdefault('metadata', {})['name'] = name
+        body['metadata']['uid'] = obj['metadata']['uid']
+        body['metadata']['creationTimestamp'] = obj['metadata']['creationTimestamp']
+        return self._store(namespace, resource, body, 'MODIFIED')
+
+    async def pod_log_call(self, namespace: str, name: str):
+        if name not in self._objects.get((namespace, 'pods'), {}):
+            return _status(404, "NotFound", f"pods \"{name}\" not found")
+        return PlainTextResponse("N E X T F L O W  ~  version 24.04.0\n")
+
+    async def version_call(self):
+        return {'major': "1", 'minor': "28", 'gitVersion': "v1.28.0-fake", 'gitCommit': "fake", 'gitTreeState': "clean",
+                'buildDate': "2024-01-01T00:00:00Z", 'goVersion': "go1.21", 'compiler': "gc", 'platform': "linux/amd64"}
+
+    def _delete(self, namespace: str, resource: str, name: str) -> dict:
+        obj = self._objects[(namespace, resource)][name]
+        if resource == 'jobs':
+            self.jobs_deleted[name] = time.monotonic()
+        return self._store(namespace, resource, obj, 'DELETED')
+
+    async def _watch(self,
+                     namespace: str,
+                     resource: str,
+                     label_selector: Optional[str],
+                     resource_version: Optional[str],
+                     timeout: float) -> AsyncIterator[bytes]:
+        deadline = time.monotonic() + timeout
+        # without a resourceVersion the watch starts from now
+        cursor = int(resource_version) if resource_version else self._resource_version
+        if self._event_versions and (cursor < self._event_versions[0] - 1):
+            gone = {'kind': "Status", 'apiVersion': "v1", 'status': "Failure", 'reason': "Expired", 'code': 410,
+                    'message': f"too old resource version: {cursor}"}
+            yield json.dumps({'type': "ERROR", 'object': gone}).encode() + b'\n'
+            return
+        while True:
+            changed = self._changed
+            start = bisect.bisect_right(self._event_versions, cursor)
+            for version, event_namespace, event_resource, labels, event in self._events[start:]:
+                cursor = version
+                if (event_namespace == namespace) and (event_resource == resource) \
+                        and label_selector_matches(label_selector, labels):
+                    yield event
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return
+
+    async def _start_job(self, namespace: str, name: str) -> None:
+        self.jobs_created[name] = time.monotonic()
+        if self.workspace_path is not None:
+            await asyncio.to_thread(self._write_run_output, os.path.join(self.workspace_path, name))
+        if self.job_seconds is not None:
+            asyncio.get_running_loop().call_later(self.job_seconds, self._finish_job, namespace, name)
+
+    def _write_run_output(self, run_dir: str) -> None:
+        # what a finished pipeline leaves behind: its results and the trace of its tasks
+        os.makedirs(os.path.join(run_dir, 'results'), exist_ok=True)
+        os.makedirs(os.path.join(run_dir, '.nextflow'), exist_ok=True)
+        with open(os.path.join(run_dir, 'results', 'output.bin'), 'wb') as result_file:
+            chunk = b'\0' * min(self.result_bytes, 1024 ** 2)
+            for offset in range(0, self.result_bytes, len(chunk) or 1):
+                result_file.write(chunk[:self.result_bytes - offset])
+        now_ms = int(time.time() * 1000)
+        with open(os.path.join(run_dir, '.nextflow', 'trace.txt'), 'w') as trace_file:
+            trace_file.write(TRACE_HEADER + '\n')
+            for task_id in range(1, self.tasks_per_run + 1):
+                trace_file.write(f"{task_id}\tBENCH ({task_id})\tBENCH\tCOMPLETED\t0\t{now_ms}\t{now_ms + 1000}\t"
+                                 f"2\t{2 * 1024 ** 3}\t1000\t95.0%\t{256 * 1024 ** 2}\t1024\t1024\n")
+
+    def _finish_job(self, namespace: str, name: str) -> None:
+        job = self._objects.get((namespace, 'jobs'), {}).get(name)
+        if job is None:
+            return
+        now = _timestamp()
+        job['status'] = {'startTime': job['metadata']['creationTimestamp'],
+                         'completionTime': now,
+                         'succeeded': 1,
+                         'conditions': [{'type': "Complete", 'status': "True", 'lastTransitionTime': now}]}
+        self._store(namespace, 'jobs', job, 'MODIFIED')
@@ -0,0 +1,85 @@
+"""
+Stand-ins for the HTTP services around the launcher: the result service storage API (input downloads with a
+configurable payload size, result uploads), the analysis nginx hub that is informed about concluded runs, and the
+Keycloak JWKS endpoint serving an HS256 key that bench tokens are signed with.
+"""
+import time
+import uuid
+import base64
+import hashlib
+from typing import AsyncIterator, Optional
+
+import jwt
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+
+KEY_ID = "bench"
+CHUNK_SIZE = 1024 ** 2
+
+
+class FakeServices:
+    def __init__(self, input_bytes: int = 1024 ** 2, secret: Optional[bytes] = None) -> None:
+        self.input_bytes = input_bytes
+        self.secret = secret or uuid.uuid4().bytes * 2
+        self._chunk = bytes(range(256)) * (CHUNK_SIZE // 256)
+        self.input_sha256 = self._payload_sha256()
+        self.stats = {'downloads': 0, 'download_bytes': 0, 'uploads': 0, 'upload_bytes': 0, 'informs': 0,
+                      'jwks_fetches': 0}
+
+        app = FastAPI(title="Fake result service, analysis hub and JWKS")
+        app.add_api_route("/storage/local/{storage_id}", self.download_call, methods=["GET"])
+        app.add_api_route("/storage/local/", self.upload_call, methods=["PUT"])
+        app.add_api_route("/analysis/nextflow", self.inform_call, methods=["POST"])
+        app.add_api_route("/realms/flame/protocol/openid-connect/certs", self.jwks_call, methods=["GET"])
+        self.app = app
+
+    def mint_token(self, ttl: float = 24 * 3600) -> str:
+        return jwt.encode({'sub': "benchmark", 'exp': int(time.time() + ttl)},
+                          self.secret,
+                          algorithm='HS256',
+                          headers={'kid': KEY_ID})
+
+    def _payload_sha256(self) -> str:
+        digest = hashlib.sha256()
+        for offset in range(0, self.input_bytes, CHUNK_SIZE):
+            digest.update(self._chunk[:self.input_bytes - offset])
+        return digest.hexdigest()
+
+    async def _payload(self, offset: int) -> AsyncIterator[bytes]:
+        position = offset
+        while position < self.input_bytes:
+            start = position % CHUNK_SIZE
+            chunk = self._chunk[start:start + self.input_bytes - position]
+            position += len(chunk)
+            yield chunk
+
+    async def download_call(self, request: Request, storage_id: str):
+        self.stats['downloads'] += 1
+        offset = 0
+        range_header = request.headers.get('Range', '')
+        if range_header.startswith('bytes='):
+            offset = int(range_header[len('bytes='):].split('-')[0])
+            if offset >= self.input_bytes:
+                return Response(status_code=416)
+        self.stats['download_bytes'] += self.input_bytes - offset
+        return StreamingResponse(self._payload(offset),
+                                 status_code=206 if offset else 200,
+                                 media_type="application/octet-stream",
+                                 headers={'X-Checksum-SHA256': self.input_sha256,
+                                          'Content-Length': str(self.input_bytes - offset)})
+
+    async def upload_call(self, request: Request):
+        self.stats['uploads'] += 1
+        async for chunk in request.stream():
+            self.stats['upload_bytes'] += len(chunk)
+        return {'id': str(uuid.uuid4())}
+
+    async def inform_call(self, request: Request):
+        self.stats['informs'] += 1
+        await request.body()
+        return {'status': "ok"}
+
+    async def jwks_call(self):
+        self.stats['jwks_fetches'] += 1
+        key = base64.urlsafe_b64encode(self.secret).rstrip(b'=').decode()
+        return {'keys': [{'kty': "oct", 'kid': KEY_ID, 'alg': "HS256", 'use': "sig", 'k': key}]}
@@ -0,0 +1,37 @@
+"""
+App factory of the launcher under benchmark, run by uvicorn in a process of its own:
+
+    BENCH_K8S_URL=... BENCH_SERVICES_URL=... BENCH_DATABASE_URL=... KEYCLOAK_URL=... \\
+        python -m uvicorn benchmarks.offline.launcher:create_app --factory
+
+The launcher code is unmodified, only its surroundings are replaced: the kubernetes client talks to the fake API
+server, the database is SQLite (or any BENCH_DATABASE_URL), and the result service and analysis nginx clients,
+whose base URLs are built from discovered Service names, are routed to the fake services.
+"""
+import os
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import FastAPI
+from kubernetes import client
+
+from src.api.api import FlameNextflowAPI
+from src.k8s.api_clients import init_api_client
+from src.resources.clients import analysis_client, http_pool, storage_client
+from src.resources.database.entity import Database
+
+
+def _routed_http_client(base_url: str) -> httpx.AsyncClient:
+    # http://<service name>:<port>/storage -> <BENCH_SERVICES_URL>/storage, still pooled by the launcher's http_pool
+    return http_pool.get_http_client(os.environ['BENCH_SERVICES_URL'] + urlsplit(base_url).path)
+
+
+def create_app() -> FastAPI:
+    configuration = client.Configuration()
+    configuration.host = os.environ['BENCH_K8S_URL']
+    client.Configuration.set_default(configuration)
+    init_api_client()
+
+    storage_client.get_http_client = _routed_http_client
+    analysis_client.get_http_client = _routed_http_client
+    return FlameNextflowAPI(database=Database(os.environ['BENCH_DATABASE_URL'], migrate=False), namespace='default').app
@@ -1,12 +1,48 @@
-import uvicorn
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
 
-from fastapi import APIRouter, FastAPI, Depends
+from fastapi import APIRouter, FastAPI, Depends, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
-from src.resources.database.entity import Database
-from src.api.oauth import valid_access_token
-from src.resources.nextflow_run.entity import NextflowRunEntity, CreateNextflowRun, ConcludeNextflowRun
+from src.k8s.kubernetes import JOB_WATCH_ENABLED, WEBLOG_ENABLED
+from src.k8s.discovery import SERVICE_WATCH_ENABLED, get_service_endpoints
+from src.k8s.warm_pool import (IMAGE_PREPULL_ENABLED, PREFETCH_PIPELINES, create_pipeline_prefetch_job,
+                               ensure_image_prepull, parse_prefetch_pipeline)
+from src.k8s.executor import EXECUTOR_RBAC_ENABLED, ensure_executor_rbac
+from src.k8s.leader import LEADER_ELECTION_ENABLED, LeaderElector
+from src.k8s.logs import LogStreams, find_run_pod
+from src.k8s.run_state import PodWatcher, RunStateStore
+from src.k8s.watcher import JobWatcher
+from src.resources.clients.http_pool import close_http_clients
+from src.resources.database.db_models import NextflowRunDB, RunStatus
+from src.resources.database.entity import DB_MIGRATE_ON_STARTUP, Database
+from src.api.oauth import auth_cache_stats, jwks_cache, valid_access_token
+from src.api.metrics import (RUN_DURATION_SECONDS, RUN_TIME_TO_FIRST_TASK_SECONDS, RUNS_CONCLUDED, STARTUP_SECONDS,
+                             gauge_lines, process_uptime, registry)
+from src.api.readiness import DependencyChecks
+from src.k8s.api_clients import request_stats, version_api
+from src.resources.clients.http_pool import http_pool_stats
+from src.api.concurrency import EndpointLimiter, run_blocking, run_k8s
+from src.resources.nextflow_run.entity import (NextflowRunEntity, CreateNextflowRun, ConcludeNextflowRun,
+                                               NextflowWeblogEvent)
+from src.resources.nextflow_run.reconciler import Reconciler
+from src.resources.nextflow_run.scheduler import RunScheduler
+from src.resources.nextflow_run.task_metrics import (FINISHED_TASK_STATUSES, NF_TASK_STATS_WINDOW, TaskRecordBuffer,
+                                                     finished_task_rows, summarize_tasks, task_row)
+from src.resources.nextflow_run.timings import read_run_progress, read_run_timings, read_run_trace
+from src.resources.nextflow_run.work_cache import NF_CACHE_ENABLED, assets_key
+
+# Number of concluded run ids remembered to deduplicate webhook and Job watch conclusions
+CONCLUDED_RUNS_MEMORY = 4096
+MAX_BATCH_SIZE = int(os.getenv("NF_MAX_BATCH_SIZE", "1000"))
+# Pooled database connections opened during warm-up
+DB_WARM_CONNECTIONS = int(os.getenv("DB_WARM_CONNECTIONS", "4"))
+# Seconds between attempts to warm up an unreachable dependency
+WARM_UP_RETRY_INTERVAL = float(os.getenv("WARM_UP_RETRY_INTERVAL", "5"))
 
 
 class FlameNextflowAPI:
@@ -14,6 +50,21 @@ class FlameNextflowAPI:
         self.database = database
 
         self.namespace = namespace
+        self.endpoint_limits = EndpointLimiter()
+        self.job_watcher: Optional[JobWatcher] = None
+        self.pod_watcher: Optional[PodWatcher] = None
+        self.run_states = RunStateStore()
+        self.log_streams = LogStreams(namespace)
+        self.scheduler: Optional[RunScheduler] = None
+        self.leader: Optional[LeaderElector] = None
+        self.reconciler: Optional[Reconciler] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.task_records = TaskRecordBuffer(database)
+        self.readiness = DependencyChecks({'database': self._check_database,
+                                           'kubernetes': self._check_kubernetes,
+                                           'jwks': jwks_cache.ensure_loaded})
+        self._warm_up_task: Optional[asyncio.Task] = None
+        self._concluded_runs: OrderedDict[str, None] = OrderedDict()
         app = FastAPI(title="FLAME Nextflow Job Launcher",
                       docs_url="/api/docs",
                       redoc_url="/api/redoc",
@@ -37,6 +88,25 @@ class FlameNextflowAPI:
                              dependencies=[Depends(valid_access_token)],
                              methods=["POST"],
                              response_class=JSONResponse)
+        router.add_api_route("/runs:batch",
+                             self.batch_run_call,
+                             dependencies=[Depends(valid_access_token)],
+                             methods=["POST"],
+                             response_class=JSONResponse)
+        router.add_api_route("/runs/{run_id}",
+                             self.run_status_call,
+                             dependencies=[Depends(valid_access_token)],
+                             methods=["GET"],
+                             response_class=JSONResponse)
+        router.add_api_route("/runs/{run_id}/logs",
+                             self.run_logs_call,
+                             dependencies=[Depends(valid_access_token)],
+                             methods=["GET"])
+        router.add_api_route("/analysis/{analysis_id}/runs",
+                             self.analysis_runs_call,
+                             dependencies=[Depends(valid_access_token)],
+                             methods=["GET"],
+                             response_class=JSONResponse)
         router.add_api_route("/stop/{analysis_id}",
                              self.interrupt_call,
                              dependencies=[Depends(valid_access_token)],
@@ -47,35 +117,462 @@ class FlameNextflowAPI:
                              #dependencies=[Depends(valid_access_token)], #TODO decide on auth for this endpoint
                              methods=["POST"],
                              response_class=JSONResponse)
+        router.add_api_route("/weblog/{run_id}",
+                             self.weblog_call,
+                             # called by the runs' Nextflow like /conclude
+                             methods=["POST"],
+                             response_class=JSONResponse)
+        router.add_api_route("/pipelines/task-stats",
+                             self.task_stats_call,
+                             dependencies=[Depends(valid_access_token)],
+                             methods=["GET"],
+                             response_class=JSONResponse)
+        router.add_api_route("/reconcile",
+                             self.reconcile_call,
+                             dependencies=[Depends(valid_access_token)],
+                             methods=["POST"],
+                             response_class=JSONResponse)
         router.add_api_route("/healthz",
                              self.health_call,
                              methods=["GET"],
                              response_class=JSONResponse)
+        router.add_api_route("/readyz",
+                             self.ready_call,
+                             methods=["GET"],
+                             response_class=JSONResponse)
 
         app.include_router(
             router,
             prefix="/nextflow",
         )
+        app.add_api_route("/metrics",
+                          self.metrics_call,
+                          methods=["GET"],
+                          response_class=PlainTextResponse)
+        registry.process_lines = self._stats_metric_lines
+        app.add_event_handler("startup", self.task_records.start)
+        app.add_event_handler("startup", registry.start_flushing)
+        app.add_event_handler("startup", self._start_warm_up)
+        app.add_event_handler("shutdown", registry.stop_flushing)
+        app.add_event_handler("shutdown", self._stop_warm_up)
+        app.add_event_handler("shutdown", self._stop_leader_election)
+        app.add_event_handler("shutdown", self._stop_task_records)
+        app.add_event_handler("shutdown", self._stop_job_watcher)
+        self.app = app
+
+    async def run_call(self, body: CreateNextflowRun, idempotency_key: Optional[str] = Header(None)):
+        async with self.endpoint_limits('run'):
+            nf_run = self._new_run(body)
+            if idempotency_key is not None:
+                nf_run.idempotency_key = idempotency_key
+            duplicate = await nf_run.submit(self.database)
+            if duplicate is not None:
+                response = {'status': duplicate.status, 'run_id': duplicate.run_id, 'duplicate': True}
+                if duplicate.status == RunStatus.QUEUED:
+                    response['queue_position'] = await run_blocking(self.database.get_queue_position,
+                                                                    duplicate.run_id)
+                return response
+            self._wake_scheduler()
+            return {'status': "queued",
+                    'run_id': nf_run.run_id,
+                    'queue_position': await run_blocking(self.database.get_queue_position, nf_run.run_id)}
+
+    async def batch_run_call(self, body: list[CreateNextflowRun]):
+        async with self.endpoint_limits('run'):
+            if len(body) > MAX_BATCH_SIZE:
+                raise HTTPException(status_code=413,
+                                    detail=f"Batch of {len(body)} runs exceeds the maximum of {MAX_BATCH_SIZE}.")
+            nf_runs, results = [], []
+            for run_spec in body:
+                nf_run = self._new_run(run_spec)
+                try:
+                    nf_run.validate()
+                except HTTPException as e:
+                    results.append({'status': "rejected", 'detail': e.detail})
+                    continue
+                nf_runs.append(nf_run)
+                results.append({'status': "queued", 'run_id': nf_run.run_id})
+
+            if nf_runs:
+                duplicates, rejected = await NextflowRunEntity.submit_all(self.database, nf_runs)
+                self._wake_scheduler()
+                for result in results:
+                    if result.get('run_id') in rejected:
+                        result['detail'] = rejected[result.pop('run_id')]
+                        result['status'] = "rejected"
+                    elif result.get('run_id') in duplicates:
+                        result['run_id'], result['status'] = duplicates[result['run_id']]
+                        result['duplicate'] = True
+                positions = await run_blocking(self.database.get_queue_positions,
+                                               [result['run_id'] for result in results if 'run_id' in result])
+                for result in results:
+                    if ('run_id' in result) and (positions[result['run_id']] is not None):
+                        result['queue_position'] = positions[result['run_id']]
+            return {'runs': results}
+
+    @staticmethod
+    def _new_run(body: CreateNextflowRun) -> NextflowRunEntity:
+        return NextflowRunEntity(analysis_id=body.analysis_id,
+                                 pipeline_name=body.pipeline_name,
+                                 run_args=body.run_args,
+                                 keycloak_token=body.keycloak_token,
+                                 input_location=body.input_location,
+                                 input_checksum=body.input_checksum,
+                                 resources=body.resources.model_dump() if body.resources else None,
+                                 executor=body.executor,
+                                 idempotency_key=body.idempotency_key)
+
+    async def run_status_call(self, run_id: str):
+        nf_run = await run_blocking(self.database.get_nf_run_by_run_id, run_id)
+        if nf_run is None:
+            raise HTTPException(status_code=404, detail=f"Nextflow run with id={run_id} not found.")
+        queue_positions = {}
+        if nf_run.status == RunStatus.QUEUED:
+            queue_positions = await run_blocking(self.database.get_queue_positions, [run_id])
+        status = self._run_status(nf_run, queue_positions.get(run_id))
+        if nf_run.status in RunStatus.ACTIVE:
+            status['progress'] = await run_blocking(read_run_progress, run_id)
+        return status
+
+    async def analysis_runs_call(self, analysis_id: str):
+        nf_runs = await run_blocking(self.database.get_nf_runs_by_analysis_id, analysis_id)
+        queue_positions = await run_blocking(self.database.get_queue_positions,
+                                             [nf_run.run_id for nf_run in nf_runs
+                                              if nf_run.status == RunStatus.QUEUED])
+        return {'analysis_id': analysis_id,
+                'runs': [self._run_status(nf_run, queue_positions.get(nf_run.run_id)) for nf_run in nf_runs]}
+
+    def _run_status(self, nf_run: NextflowRunDB, queue_position: Optional[int]) -> dict:
+        # Job and Pod state come from the watches, no request to the API server per status call
+        status = {'run_id': nf_run.run_id,
+                  'analysis_id': nf_run.analysis_id,
+                  'pipeline_name': nf_run.pipeline_name,
+                  'status': nf_run.status,
+                  'time_created': nf_run.time_created,
+                  'time_started': nf_run.time_started,
+                  'time_first_task': nf_run.time_first_task,
+                  **self.run_states.get(nf_run.run_id)}
+        if queue_position is not None:
+            status['queue_position'] = queue_position
+        return status
 
-        uvicorn.run(app, host="0.0.0.0", port=8000)
+    async def run_logs_call(self, run_id: str, request: Request):
+        pod_name = self.run_states.pod_name(run_id)
+        if pod_name is None:
+            pod_name = await run_k8s(find_run_pod, run_id, self.namespace)
+        if pod_name is None:
+            raise HTTPException(status_code=404, detail=f"No pod found for Nextflow run with id={run_id}.")
+        event_stream = 'text/event-stream' in request.headers.get('accept', '')
+        broadcaster = self.log_streams.get(run_id, pod_name)
+        queue = broadcaster.subscribe()
 
-    def run_call(self, body: CreateNextflowRun):
-        nf_run = NextflowRunEntity(analysis_id=body.analysis_id,
-                                   pipeline_name=body.pipeline_name,
-                                   run_args=body.run_args,
-                                   keycloak_token=body.keycloak_token)
-        return nf_run.start(self.database, body.input_location)
+        async def stream_log():
+            try:
+                while True:
+                    line = await queue.get()
+                    if line is None:
+                        break
+                    yield f"data: {line}\n\n" if event_stream else f"{line}\n"
+            finally:
+                self.log_streams.release(run_id, broadcaster, queue)
 
-    def conclude_call(self, body: ConcludeNextflowRun):
-        nf_run = NextflowRunEntity.from_database(run_id=body.run_id, database=self.database)
-        nf_run.conclude(body.run_status, body.storage_location)
-        return {'status': f"Nextflow run with id={body.run_id} concluded."}
+        return StreamingResponse(stream_log(), media_type='text/event-stream' if event_stream else 'text/plain')
 
-    def interrupt_call(self, analysis_id: str):
-        for nf_db in self.database.get_nf_runs_by_analysis_id(analysis_id):
-            nf_run = NextflowRunEntity.from_database(run_id=nf_db.run_id, database=self.database)
-            nf_run.stop()
-        return {'status': f"Nextflow runs for analysis_id={analysis_id} interrupted."}
+    async def weblog_call(self, run_id: str, body: NextflowWeblogEvent):
+        # Only finished tasks are kept, the other events are acknowledged without touching the database
+        if (body.event != 'process_completed') or (body.trace is None) \
+                or (body.trace.get('status') not in FINISHED_TASK_STATUSES):
+            return {'status': "ignored"}
+        nf_run = await run_blocking(self.database.get_nf_run_by_run_id, run_id)
+        if nf_run is None:
+            raise HTTPException(status_code=404, detail=f"Nextflow run with id={run_id} not found.")
+        self.task_records.add([task_row(run_id, nf_run.pipeline_name, body.trace)], source='weblog')
+        return {'status': "accepted"}
 
-    def health_call(self):
+    async def task_stats_call(self, pipeline_name: str):
+        nf_tasks = await run_blocking(self.database.get_nf_tasks_by_pipeline, pipeline_name, NF_TASK_STATS_WINDOW)
+        return {'pipeline_name': pipeline_name,
+                'tasks': len(nf_tasks),
+                'processes': summarize_tasks(nf_tasks)}
+
+    async def reconcile_call(self, dry_run: bool = True):
+        # On demand pass, e.g. to preview what the periodic reconciler of the leader would reclaim
+        if dry_run:
+            return await Reconciler(self.database, self.conclude_run, self.namespace, dry_run=True).reconcile()
+        # reclaiming is left to the leader's reconciler, whose passes do not race its scheduler or each other
+        if (self.leader is not None) and not self.leader.is_leader:
+            raise HTTPException(status_code=409, detail="This launcher process is not the leader, reconcile passes "
+                                                        "that reclaim resources only run on the leader.")
+        if self.reconciler is None:
+            raise HTTPException(status_code=503, detail="The reconciler has not started yet.")
+        return await self.reconciler.reconcile(dry_run=False)
+
+    async def conclude_call(self, body: ConcludeNextflowRun):
+        async with self.endpoint_limits('conclude'):
+            if await self.conclude_run(body.run_id, body.run_status):
+                return {'status': f"Nextflow run with id={body.run_id} concluded."}
+            return {'status': f"Nextflow run with id={body.run_id} already concluded."}
+
+    async def interrupt_call(self, analysis_id: str):
+        async with self.endpoint_limits('stop'):
+            outcomes = await NextflowRunEntity.stop_all(self.database, analysis_id)
+            self._wake_scheduler()
+            return {'status': f"Nextflow runs for analysis_id={analysis_id} interrupted.",
+                    'runs': outcomes}
+
+    async def conclude_run(self, run_id: str, run_status: str) -> bool:
+        # Both the conclude webhook and the Job watch report finished runs, to any launcher process. The first one
+        # to claim the run in the database concludes it, the in-process memory only saves repeated claims.
+        if run_id in self._concluded_runs:
+            return False
+        nf_run = await NextflowRunEntity.from_database(run_id=run_id, database=self.database)
+        if not await run_blocking(self.database.update_nf_run_status,
+                                  run_id,
+                                  RunStatus.CONCLUDING,
+                                  expected_status=RunStatus.CONCLUDABLE,
+                                  claimed_by=self.database.instance_id,
+                                  time_claimed=time.time()):
+            # concluded, being concluded or stopped by another process
+            return False
+        self._concluded_runs[run_id] = None
+        while len(self._concluded_runs) > CONCLUDED_RUNS_MEMORY:
+            self._concluded_runs.popitem(last=False)
+        try:
+            # read before conclude() removes the run dir
+            timings = await run_blocking(read_run_timings, run_id)
+            if not WEBLOG_ENABLED:
+                trace = await run_blocking(read_run_trace, run_id)
+                self.task_records.add(finished_task_rows(run_id, nf_run.pipeline_name, trace), source='trace')
+            await nf_run.conclude(run_status)
+            final_status = RunStatus.SUCCEEDED if run_status == 'succeeded' else RunStatus.FAILED
+            await run_blocking(self.database.update_nf_run_status, run_id, final_status,
+                               expected_status=(RunStatus.CONCLUDING,), **timings)
+            RUNS_CONCLUDED.inc(status=final_status)
+            self._report_startup(nf_run, timings)
+        except Exception:
+            self._concluded_runs.pop(run_id, None)
+            # hand the run back, so that a retried webhook or the reconciler concludes it
+            try:
+                await run_blocking(self.database.update_nf_run_status, run_id, RunStatus.RUNNING,
+                                   expected_status=(RunStatus.CONCLUDING,), claimed_by=None, time_claimed=None)
+            except Exception as e:
+                print(f"Error: Releasing the conclusion of run_id={run_id} failed: {repr(e)}")
+            raise
+        self._wake_scheduler()
+        return True
+
+    @staticmethod
+    def _report_startup(nf_run: NextflowRunEntity, timings: dict[str, Optional[float]]) -> None:
+        if nf_run.time_started is None:
+            return
+        RUN_DURATION_SECONDS.observe(time.time() - nf_run.time_started)
+        if timings['time_container_started'] is not None:
+            print(f"Run {nf_run.run_id}: container started "
+                  f"{timings['time_container_started'] - nf_run.time_started:.1f}s after Job creation")
+        if timings['time_first_task'] is not None:
+            RUN_TIME_TO_FIRST_TASK_SECONDS.observe(timings['time_first_task'] - nf_run.time_started)
+            print(f"Run {nf_run.run_id}: time to first task {timings['time_first_task'] - nf_run.time_started:.1f}s")
+
+    def _wake_scheduler(self) -> None:
+        if self.scheduler is not None:
+            self.scheduler.wake()
+
+    async def _on_job_finished(self, run_id: str, run_status: str) -> None:
+        async with self.endpoint_limits('conclude'):
+            await self.conclude_run(run_id, run_status)
+
+    async def _start_job_watcher(self) -> None:
+        if JOB_WATCH_ENABLED:
+            # every process keeps its run state store current, only the leader concludes finished Jobs
+            self.job_watcher = JobWatcher(self.namespace, self._on_job_finished, asyncio.get_running_loop(),
+                                          state_store=self.run_states,
+                                          dispatch=not LEADER_ELECTION_ENABLED)
+            self.job_watcher.start()
+            self.pod_watcher = PodWatcher(self.namespace, self.run_states)
+            self.pod_watcher.start()
+        if SERVICE_WATCH_ENABLED:
+            get_service_endpoints().start()
+
+    async def _stop_job_watcher(self) -> None:
+        if self.job_watcher is not None:
+            self.job_watcher.stop()
+        if self.pod_watcher is not None:
+            self.pod_watcher.stop()
+        self.log_streams.close()
+        get_service_endpoints().stop()
+        await close_http_clients()
+
+    async def _start_warm_up(self) -> None:
+        # not awaited, the server accepts requests (and liveness probes) right away and /readyz reports readiness
+        self._warm_up_task = asyncio.create_task(self._warm_up())
+
+    async def _stop_warm_up(self) -> None:
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+            await asyncio.gather(self._warm_up_task, return_exceptions=True)
+
+    async def _warm_up(self) -> None:
+        # DB pool, JWKS and k8s client connections are opened concurrently instead of by the first requests
+        others = asyncio.gather(self._warm_up_dependency('jwks', lambda: run_blocking(jwks_cache.refresh)),
+                                self._warm_up_dependency('kubernetes', lambda: run_k8s(self._check_kubernetes)))
+        try:
+            await self._warm_up_dependency('database', self._warm_up_database)
+            # the watchers conclude finished Jobs and the background duties need the schema, neither needs the JWKS
+            try:
+                await self._start_job_watcher()
+                await self._start_leader_election()
+            except Exception as e:
+                print(f"Error: Starting the watchers and background duties failed: {repr(e)}")
+            await others
+        finally:
+            others.cancel()
+        jwks_cache.start()
+
+        while not self.readiness.ready:
+            await self.readiness.check(force=True)
+            if not self.readiness.ready:
+                await asyncio.sleep(WARM_UP_RETRY_INTERVAL)
+        STARTUP_SECONDS.observe(process_uptime(), phase='ready')
+        print(f"Launcher ready {process_uptime():.1f}s after process start")
+
+    @staticmethod
+    async def _warm_up_dependency(name: str, warm_up: Callable[[], Awaitable[Any]]) -> None:
+        while True:
+            try:
+                await warm_up()
+                STARTUP_SECONDS.observe(process_uptime(), phase=f"warmup_{name}")
+                return
+            except Exception as e:
+                print(f"Error: Warming up {name} failed, retrying in {WARM_UP_RETRY_INTERVAL}s: {repr(e)}")
+                await asyncio.sleep(WARM_UP_RETRY_INTERVAL)
+
+    async def _warm_up_database(self) -> None:
+        if DB_MIGRATE_ON_STARTUP and not self.database.migrated:
+            await run_blocking(self.database.migrate)
+        # concurrent pings leave as many open connections in the pool
+        await asyncio.gather(*(run_blocking(self.database.ping) for _ in range(DB_WARM_CONNECTIONS)))
+        self.database.start_listener()
+
+    def _check_database(self) -> None:
+        if DB_MIGRATE_ON_STARTUP and not self.database.migrated:
+            raise RuntimeError("Schema migrations pending")
+        self.database.ping()
+
+    @staticmethod
+    def _check_kubernetes() -> None:
+        version_api().get_code()
+
+    async def _start_leader_election(self) -> None:
+        if LEADER_ELECTION_ENABLED:
+            self.leader = LeaderElector(self.namespace, self._start_leader_duties, self._stop_leader_duties)
+            await self.leader.start()
+        else:
+            await self._start_leader_duties()
+
+    async def _stop_leader_election(self) -> None:
+        if self.leader is not None:
+            await self.leader.stop()
+        else:
+            await self._stop_leader_duties()
+
+    async def _start_leader_duties(self) -> None:
+        # Background duties run in a single launcher process: the Lease holder, or every process without election
+        self._loop = asyncio.get_running_loop()
+        if LEADER_ELECTION_ENABLED and (self.job_watcher is not None):
+            self.job_watcher.set_dispatch(True)
+        self.scheduler = RunScheduler(self.database)
+        await self.scheduler.start()
+        # runs submitted to or concluded by other processes free or take slots without waiting for the next poll
+        self.database.listeners.append(self._on_database_change)
+        if EXECUTOR_RBAC_ENABLED:
+            try:
+                await run_k8s(ensure_executor_rbac, self.namespace)
+            except Exception as e:
+                print(f"Error: Creating the RBAC of the k8s executor failed: {repr(e)}")
+        self.reconciler = Reconciler(self.database, self.conclude_run, self.namespace)
+        await self.reconciler.start()
+        await self._start_warm_pool()
+
+    async def _stop_leader_duties(self) -> None:
+        if self._on_database_change in self.database.listeners:
+            self.database.listeners.remove(self._on_database_change)
+        if LEADER_ELECTION_ENABLED and (self.job_watcher is not None):
+            self.job_watcher.set_dispatch(False)
+        if self.reconciler is not None:
+            await self.reconciler.stop()
+            self.reconciler = None
+        if self.scheduler is not None:
+            await self.scheduler.stop()
+            self.scheduler = None
+
+    def _on_database_change(self, message: dict[str, Any]) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake_scheduler)
+
+    async def _stop_task_records(self) -> None:
+        try:
+            await self.task_records.stop()
+        except Exception as e:
+            print(f"Error: Inserting Nextflow task records on shutdown failed: {repr(e)}")
+
+    async def _start_warm_pool(self) -> None:
+        try:
+            if IMAGE_PREPULL_ENABLED:
+                await run_k8s(ensure_image_prepull, self.namespace)
+            if PREFETCH_PIPELINES:
+                if not NF_CACHE_ENABLED:
+                    print("Warning: NF_PREFETCH_PIPELINES requires NF_CACHE_ENABLED, pipelines are not prefetched")
+                    return
+                pipelines = []
+                for pipeline_name, revision in map(parse_prefetch_pipeline, PREFETCH_PIPELINES):
+                    run_args = ['-r', revision] if revision else []
+                    pipelines.append((pipeline_name, revision, assets_key(pipeline_name, run_args)))
+                await run_k8s(create_pipeline_prefetch_job, pipelines, self.namespace)
+        except Exception as e:
+            print(f"Error: Preparing image prepull or pipeline prefetch failed: {repr(e)}")
+
+    async def metrics_call(self):
+        runs_by_status = await run_blocking(self.database.count_nf_runs_by_status)
+        # merging the files of several workers reads and writes the metrics dir
+        text = await run_blocking(registry.render, gauge_lines(
+            "runs", "Nextflow runs in the database by status.",
+            {(('status', status or 'unknown'),): count for status, count in runs_by_status.items()}))
+        return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+    def _stats_metric_lines(self) -> list[str]:
+        # Statistics collected by the caches and clients of this process, collected at scrape time and with every
+        # flush of the metrics of several workers
+        k8s_requests = request_stats.snapshot()
+        pools = http_pool_stats()
+        lines = gauge_lines("auth_cache_events_total", "JWKS and token cache events.",
+                             {(('event', event),): count for event, count in auth_cache_stats().items()}, "counter")
+        lines += gauge_lines("run_cache_events_total", "Run cache events.",
+                             {(('event', event),): count for event, count in self.database.run_cache.stats.items()},
+                             "counter")
+        lines += gauge_lines("k8s_requests_total", "Kubernetes API requests.",
+                             {(('resource', resource), ('verb', verb)): stats['count']
+                              for (verb, resource), stats in k8s_requests.items()}, "counter")
+        lines += gauge_lines("k8s_request_errors_total", "Failed Kubernetes API requests.",
+                             {(('resource', resource), ('verb', verb)): stats['errors']
+                              for (verb, resource), stats in k8s_requests.items()}, "counter")
+        lines += gauge_lines("k8s_request_seconds_total", "Time spent in Kubernetes API requests.",
+                             {(('resource', resource), ('verb', verb)): stats['sum']
+                              for (verb, resource), stats in k8s_requests.items()}, "counter")
+        lines += gauge_lines("k8s_client_throttled_seconds_total",
+                             "Time Kubernetes API requests waited for the client rate limit.",
+                             {(): request_stats.throttled_seconds}, "counter")
+        for stat, metric_type in [('requests', "counter"), ('retries', "counter"), ('wait_seconds', "counter"),
+                                  ('in_flight', "gauge"), ('connections', "gauge"), ('idle', "gauge")]:
+            name = f"http_pool_{stat}_total" if metric_type == "counter" else f"http_pool_{stat}"
+            lines += gauge_lines(name, f"HTTP connection pool {stat.replace('_', ' ')} per base URL.",
+                                 {(('base_url', base_url),): stats[stat] for base_url, stats in pools.items()},
+                                 metric_type)
+        return lines
+
+    async def health_call(self):
         return {'status': "ok"}
+
+    async def ready_call(self):
+        checks = await self.readiness.check()
+        return JSONResponse({'status': "ready" if self.readiness.ready else "not ready", 'checks': checks},
+                            status_code=200 if self.readiness.ready else 503)
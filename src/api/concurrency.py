@@ -0,0 +1,60 @@
+import os
+import asyncio
+import functools
+from typing import Any, Callable, Optional, TypeVar
+
+import anyio.to_thread
+from anyio import CapacityLimiter
+
+T = TypeVar('T')
+
+# Threads reserved for blocking calls (SQLAlchemy, kubernetes client, file I/O) made from the async request path,
+# kept separate from Starlette's default threadpool so that a burst on one endpoint cannot starve the others
+BLOCKING_IO_THREADS = int(os.getenv("BLOCKING_IO_THREADS", "64"))
+# Threads for Kubernetes API calls, which wait for the client-side rate limit (K8S_CLIENT_QPS) in their thread. Kept
+# apart so that a burst of API calls held back by the rate limit cannot starve database and file I/O.
+K8S_IO_THREADS = int(os.getenv("K8S_IO_THREADS", "16"))
+
+# Maximum number of requests processed concurrently per endpoint, further requests wait for a free slot
+ENDPOINT_CONCURRENCY_LIMITS = {
+    'run': int(os.getenv("RUN_CONCURRENCY_LIMIT", "32")),
+    'conclude': int(os.getenv("CONCLUDE_CONCURRENCY_LIMIT", "32")),
+    'stop': int(os.getenv("STOP_CONCURRENCY_LIMIT", "8")),
+}
+
+_blocking_limiter: Optional[CapacityLimiter] = None
+_k8s_limiter: Optional[CapacityLimiter] = None
+
+
+def _get_blocking_limiter() -> CapacityLimiter:
+    global _blocking_limiter
+    if _blocking_limiter is None:
+        _blocking_limiter = CapacityLimiter(BLOCKING_IO_THREADS)
+    return _blocking_limiter
+
+
+def _get_k8s_limiter() -> CapacityLimiter:
+    global _k8s_limiter
+    if _k8s_limiter is None:
+        _k8s_limiter = CapacityLimiter(K8S_IO_THREADS)
+    return _k8s_limiter
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs),
+                                          limiter=_get_blocking_limiter())
+
+
+async def run_k8s(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    # for calls to the Kubernetes API, see K8S_IO_THREADS
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs),
+                                          limiter=_get_k8s_limiter())
+
+
+class EndpointLimiter:
+    def __init__(self, limits: Optional[dict[str, int]] = None) -> None:
+        limits = ENDPOINT_CONCURRENCY_LIMITS if limits is None else limits
+        self._semaphores = {name: asyncio.Semaphore(limit) for name, limit in limits.items()}
+
+    def __call__(self, endpoint: str) -> asyncio.Semaphore:
+        return self._semaphores[endpoint]
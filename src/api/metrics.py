@@ -0,0 +1,291 @@
+import os
+import abc
+import time
+import tempfile
+import threading
+import contextlib
+from typing import Callable, Iterator, Optional
+
+from src.k8s.leader import WORKERS
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+# Wrap run stages in OpenTelemetry spans carrying the run_id, needs opentelemetry-api and a configured SDK
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").lower() == "true"
+METRICS_PREFIX = "nf_launcher"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+# Every worker process keeps its own metrics, a scrape reaches one of them. With several workers, each one writes its
+# metrics to a file in this directory every METRICS_FLUSH_INTERVAL seconds, and a scrape answers with the sum over all
+# of them. Cleared by main() before the workers start, clear it likewise when starting the workers otherwise.
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR",
+                                  os.path.join(tempfile.gettempdir(), "nf-launcher-metrics") if WORKERS > 1 else "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric(abc.ABC):
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+
+    @abc.abstractmethod
+    def render(self) -> list[str]:
+        pass
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        super().__init__(name, documentation)
+        self._values: dict[tuple[tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation)
+        self.buckets = buckets
+        self._values: dict[tuple[tuple[str, str], ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            # per bucket counts, then count and sum
+            counts = self._values.setdefault(key, [0] * len(self.buckets) + [0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, counts in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', repr(float(bound))),))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {counts[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {counts[-2]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(counts[-1])}")
+        return lines
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge_lines(families: dict[str, dict], lines: list[str], alive: bool) -> None:
+    # sums the samples of each series into families, by metric name in the order first seen
+    family = None
+    for line in lines:
+        if line.startswith(('# HELP ', '# TYPE ')):
+            _, kind, name, text = line.split(' ', 3)
+            family = families.setdefault(name, {'HELP': '', 'TYPE': 'untyped', 'samples': {}})
+            family[kind] = text
+        elif line and (family is not None):
+            # counters and histograms of exited workers still count, their gauges are gone with them
+            if (not alive) and (family['TYPE'] == 'gauge'):
+                continue
+            series, value = line.rsplit(' ', 1)
+            family['samples'][series] = family['samples'].get(series, 0.0) + float(value)
+
+
+class MetricsRegistry:
+    """
+    Metrics of this process in the Prometheus text format, summed with those of the other workers given a
+    multiproc_dir.
+    """
+    def __init__(self, multiproc_dir: str = "", flush_interval: float = METRICS_FLUSH_INTERVAL) -> None:
+        """
+        :param multiproc_dir: Directory shared by the worker processes for their metrics files.
+        """
+        self._metrics: list[Metric] = []
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        # lines of values kept elsewhere in this process (e.g. cache and client statistics), summed like the metrics
+        self.process_lines: Optional[Callable[[], list[str]]] = None
+        self._stop_event = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self) -> list[str]:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        if self.process_lines is not None:
+            lines.extend(self.process_lines())
+        return lines
+
+    def render(self, extra_lines: Optional[list[str]] = None) -> str:
+        # extra_lines are the same in every process (e.g. counts from the database), rendered as they are
+        lines = self._collect_workers() if self.multiproc_dir else self.collect()
+        lines.extend(extra_lines or [])
+        return "\n".join(lines) + "\n"
+
+    def flush(self) -> None:
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        path = os.path.join(self.multiproc_dir, f"{os.getpid()}.prom")
+        with open(f"{path}.tmp", 'w') as metrics_file:
+            metrics_file.write("\n".join(self.collect()) + "\n")
+        os.replace(f"{path}.tmp", path)
+
+    def _collect_workers(self) -> list[str]:
+        self.flush()
+        families = {}
+        for file_name in sorted(os.listdir(self.multiproc_dir)):
+            pid = file_name.removesuffix('.prom')
+            if (not file_name.endswith('.prom')) or not pid.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.multiproc_dir, file_name)) as metrics_file:
+                    lines = metrics_file.read().splitlines()
+            except OSError:
+                continue
+            _merge_lines(families, lines, _pid_alive(int(pid)))
+        lines = []
+        for name, family in families.items():
+            lines += [f"# HELP {name} {family['HELP']}", f"# TYPE {name} {family['TYPE']}"]
+            lines += [f"{series} {_format_value(value)}" for series, value in family['samples'].items()]
+        return lines
+
+    def start_flushing(self) -> None:
+        if self.multiproc_dir and (self._flusher is None):
+            self._stop_event.clear()
+            self._flusher = threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True)
+            self._flusher.start()
+
+    def stop_flushing(self) -> None:
+        self._stop_event.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+            self.flush()
+
+    def _flush_periodically(self) -> None:
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Writing metrics to {self.multiproc_dir} failed: {e}")
+
+
+def clear_multiproc_dir(multiproc_dir: str = METRICS_MULTIPROC_DIR) -> None:
+    """
+    Removes the metrics files of previous worker processes, call before starting the workers.
+    """
+    if multiproc_dir and os.path.isdir(multiproc_dir):
+        for file_name in os.listdir(multiproc_dir):
+            if file_name.endswith(('.prom', '.tmp')):
+                os.remove(os.path.join(multiproc_dir, file_name))
+
+
+def gauge_lines(name: str, documentation: str, values: dict[tuple[tuple[str, str], ...], float],
+                metric_type: str = "gauge") -> list[str]:
+    name = f"{METRICS_PREFIX}_{name}"
+    return ([f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+            + [f"{name}{_format_labels(key)} {_format_value(value)}" for key, value in values.items()])
+
+
+registry = MetricsRegistry(multiproc_dir=METRICS_MULTIPROC_DIR)
+
+RUN_STAGE_SECONDS = registry.register(Histogram(
+    "run_stage_seconds", "Duration of the stages of starting and concluding Nextflow runs."))
+RUN_QUEUE_SECONDS = registry.register(Histogram(
+    "run_queue_seconds", "Time from submission of a run until its Job was created."))
+RUN_TIME_TO_FIRST_TASK_SECONDS = registry.register(Histogram(
+    "run_time_to_first_task_seconds", "Time from Job creation until the first Nextflow task was submitted."))
+RUN_DURATION_SECONDS = registry.register(Histogram(
+    "run_duration_seconds", "Time from Job creation until the run was concluded."))
+RUNS_CONCLUDED = registry.register(Counter(
+    "runs_concluded_total", "Concluded Nextflow runs by status."))
+PAYLOAD_BYTES = registry.register(Counter(
+    "payload_bytes_total", "Bytes of run input downloaded and run results uploaded."))
+RECONCILE_ACTIONS = registry.register(Counter(
+    "reconcile_actions_total", "Orphaned Jobs, stale runs and work dirs handled by the reconciler, by action."))
+RECONCILE_RECLAIMED_BYTES = registry.register(Counter(
+    "reconcile_reclaimed_bytes_total", "Bytes of work dirs removed from the shared PVC by the reconciler."))
+RECONCILE_SECONDS = registry.register(Histogram(
+    "reconcile_seconds", "Duration of reconciler passes."))
+TASKS_INGESTED = registry.register(Counter(
+    "tasks_ingested_total", "Nextflow task records received from weblog events and trace files."))
+STARTUP_SECONDS = registry.register(Histogram(
+    "startup_seconds", "Time from process start until the app was built ('app'), a dependency was warmed up "
+                       "('warmup_<dependency>') and the launcher was first ready ('ready'), by phase."))
+
+_IMPORTED = time.monotonic()
+
+
+def process_uptime() -> float:
+    """
+    Seconds since this process was started, including interpreter start and imports where /proc is available.
+    """
+    try:
+        with open('/proc/self/stat') as stat_file:
+            # starttime is the 22nd field, the command name in parentheses may contain spaces
+            start_ticks = int(stat_file.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return max(uptime - start_ticks / os.sysconf('SC_CLK_TCK'), 0.0)
+    except (OSError, ValueError, IndexError):
+        return time.monotonic() - _IMPORTED
+
+
+@contextlib.contextmanager
+def run_stage(stage: str, run_id: str) -> Iterator[None]:
+    """
+    Times a stage of a run into RUN_STAGE_SECONDS and, with OTEL_ENABLED, wraps it in a span carrying the run_id.
+    """
+    span = contextlib.nullcontext()
+    if OTEL_ENABLED and (trace is not None):
+        span = trace.get_tracer(METRICS_PREFIX).start_as_current_span(f"nextflow_run.{stage}",
+                                                                      attributes={'run_id': run_id})
+    with span, RUN_STAGE_SECONDS.time(stage=stage):
+        yield
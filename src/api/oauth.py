@@ -1,26 +1,199 @@
 import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Annotated, Optional
+
+import httpx
+import jwt
 from fastapi import Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2AuthorizationCodeBearer
+from jwt import PyJWK, PyJWKSet
 
-from jwt import PyJWKClient
-import jwt
-from typing import Annotated
+JWKS_REFRESH_INTERVAL = float(os.getenv("JWKS_REFRESH_INTERVAL", "300"))
+JWKS_MIN_REFETCH_INTERVAL = float(os.getenv("JWKS_MIN_REFETCH_INTERVAL", "10"))
+JWKS_FETCH_TIMEOUT = float(os.getenv("JWKS_FETCH_TIMEOUT", "5"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+
+KEYCLOAK_REALM_PATH = "/realms/flame/protocol/openid-connect"
 
+# The URLs only end up in the OpenAPI docs, an unset KEYCLOAK_URL fails token validation instead of the import
 oauth2_scheme = OAuth2AuthorizationCodeBearer(
-    tokenUrl=os.getenv("KEYCLOAK_URL") + "/realms/flame/protocol/openid-connect/token",
-    authorizationUrl=os.getenv("KEYCLOAK_URL") + "/realms/flame/protocol/openid-connect/auth",
-    refreshUrl=os.getenv("KEYCLOAK_URL") + "/realms/flame/protocol/openid-connect/token",
+    tokenUrl=os.getenv("KEYCLOAK_URL", "") + KEYCLOAK_REALM_PATH + "/token",
+    authorizationUrl=os.getenv("KEYCLOAK_URL", "") + KEYCLOAK_REALM_PATH + "/auth",
+    refreshUrl=os.getenv("KEYCLOAK_URL", "") + KEYCLOAK_REALM_PATH + "/token",
 )
 
 
+class JWKSCache:
+    """
+    Process-wide cache of the Keycloak signing keys, indexed by kid.
+    Keys are refreshed by a background thread every refresh_interval seconds, an unknown kid triggers a single
+    refetch (rate limited by min_refetch_interval) so that key rotations are picked up without waiting for the TTL.
+    Without a jwks_url, the certs endpoint of KEYCLOAK_URL is resolved on the first fetch.
+    """
+    def __init__(self,
+                 jwks_url: Optional[str] = None,
+                 refresh_interval: float = JWKS_REFRESH_INTERVAL,
+                 min_refetch_interval: float = JWKS_MIN_REFETCH_INTERVAL) -> None:
+        self._jwks_url = jwks_url
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self._keys: dict[str, PyJWK] = {}
+        self._last_fetch = 0.0
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+        self.stats = {'key_hits': 0, 'key_misses': 0, 'refetches': 0, 'refresh_errors': 0}
+
+    @property
+    def jwks_url(self) -> Optional[str]:
+        if self._jwks_url is None and os.getenv("KEYCLOAK_URL"):
+            self._jwks_url = os.getenv("KEYCLOAK_URL") + KEYCLOAK_REALM_PATH + "/certs"
+        return self._jwks_url
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._keys)
+
+    def lookup(self, kid: Optional[str]) -> Optional[PyJWK]:
+        # counts every key needed to verify a token once, as hit or miss
+        self.start()
+        key = self._keys.get(kid)
+        self.stats['key_hits' if key is not None else 'key_misses'] += 1
+        return key
+
+    def get_signing_key(self, kid: Optional[str]) -> PyJWK:
+        key = self.lookup(kid)
+        if key is not None:
+            return key
+        return self.refetch_signing_key(kid)
+
+    def refetch_signing_key(self, kid: Optional[str]) -> PyJWK:
+        """
+        Refetches the key set for a kid that lookup() missed, at most once per min_refetch_interval.
+        """
+        with self._lock:
+            # another caller may have refetched while we were waiting for the lock
+            key = self._keys.get(kid)
+            if (key is None) and (time.monotonic() - self._last_fetch >= self.min_refetch_interval):
+                self._fetch()
+                key = self._keys.get(kid)
+        if key is None:
+            raise jwt.exceptions.PyJWKClientError(f"Unable to find a signing key that matches: {kid}")
+        return key
+
+    def refresh(self) -> None:
+        with self._lock:
+            self._fetch()
+
+    def ensure_loaded(self) -> None:
+        """
+        Fetches the key set unless it was fetched before, keys cached from an earlier fetch keep tokens verifiable
+        while Keycloak is unreachable.
+        :raises PyJWKClientError: If no keys could be fetched.
+        """
+        if not self.loaded:
+            self.refresh()
+        if not self.loaded:
+            raise jwt.exceptions.PyJWKClientError(f"No signing keys at {self.jwks_url}")
+
+    def start(self) -> None:
+        if (self._refresher is None) or (not self._refresher.is_alive()):
+            with self._start_lock:
+                if (self._refresher is None) or (not self._refresher.is_alive()):
+                    self._stop_event.clear()
+                    self._refresher = threading.Thread(target=self._refresh_loop, name="jwks-refresher", daemon=True)
+                    self._refresher.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _fetch(self) -> None:
+        if self.jwks_url is None:
+            raise jwt.exceptions.PyJWKClientError("KEYCLOAK_URL is not set")
+        response = httpx.get(self.jwks_url, timeout=JWKS_FETCH_TIMEOUT)
+        response.raise_for_status()
+        jwk_set = PyJWKSet.from_dict(response.json())
+        self._keys = {key.key_id: key for key in jwk_set.keys}
+        self._last_fetch = time.monotonic()
+        self.stats['refetches'] += 1
+
+    def _refresh_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except (httpx.HTTPError, jwt.exceptions.PyJWTError) as e:
+                self.stats['refresh_errors'] += 1
+                print(f"Error: Failed to refresh JWKS from {self.jwks_url}: {repr(e)}")
+            self._stop_event.wait(self.refresh_interval)
+
+
+class TokenCache:
+    """
+    Small LRU of decoded access tokens, keyed by the token's sha256 hash.
+    Entries are never served past the token's own exp claim.
+    """
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'token_hits': 0, 'token_misses': 0}
+
+    @staticmethod
+    def token_hash(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token_hash: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if (entry is not None) and (entry[1] > time.time()):
+                self._entries.move_to_end(token_hash)
+                self.stats['token_hits'] += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[token_hash]
+            self.stats['token_misses'] += 1
+            return None
+
+    def put(self, token_hash: str, claims: dict) -> None:
+        if (self.max_size <= 0) or ('exp' not in claims):
+            return
+        with self._lock:
+            self._entries[token_hash] = (claims, float(claims['exp']))
+            self._entries.move_to_end(token_hash)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+jwks_cache = JWKSCache()
+token_cache = TokenCache()
+
+
+def auth_cache_stats() -> dict[str, int]:
+    return {**jwks_cache.stats, **token_cache.stats}
+
+
 async def valid_access_token(token: Annotated[str, Depends(oauth2_scheme)]) -> dict:
-    url = os.getenv("KEYCLOAK_URL") + "/realms/flame/protocol/openid-connect/certs"
-    jwks_client = PyJWKClient(url)
+    token_hash = TokenCache.token_hash(token)
+    claims = token_cache.get(token_hash)
+    if claims is not None:
+        return claims
 
     try:
-        sig_key = jwks_client.get_signing_key_from_jwt(token)
-        return jwt.decode(token,
-                          key=sig_key,
-                          options={"verify_signature": True, "verify_aud": False, "exp": True})
-    except jwt.exceptions.InvalidTokenError:
+        kid = jwt.get_unverified_header(token).get('kid')
+        sig_key = jwks_cache.lookup(kid)
+        if sig_key is None:
+            # unknown kid, refetch the key set off the event loop
+            sig_key = await run_in_threadpool(jwks_cache.refetch_signing_key, kid)
+        claims = jwt.decode(token,
+                            key=sig_key,
+                            options={"verify_signature": True, "verify_aud": False, "exp": True})
+    except (jwt.exceptions.PyJWTError, httpx.HTTPError):
         raise HTTPException(status_code=401, detail="Not authenticated")
+
+    token_cache.put(token_hash, claims)
+    return claims
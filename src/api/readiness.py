@@ -0,0 +1,60 @@
+import os
+import time
+import asyncio
+from typing import Any, Callable, Optional
+
+from src.api.concurrency import run_blocking
+
+# Seconds a readiness result is served from cache, so that probes of every replica do not hit the dependencies
+READINESS_CACHE_TTL = float(os.getenv("READINESS_CACHE_TTL", "5"))
+# Seconds a dependency check may take before the dependency counts as unavailable
+READINESS_CHECK_TIMEOUT = float(os.getenv("READINESS_CHECK_TIMEOUT", "3"))
+
+
+class DependencyChecks:
+    """
+    Readiness of the launcher's dependencies. Each check is a blocking callable that raises if its dependency is
+    unavailable. All checks run concurrently off the event loop, their results are cached for cache_ttl and
+    concurrent probes share one pass.
+    """
+    def __init__(self,
+                 checks: dict[str, Callable[[], None]],
+                 cache_ttl: float = READINESS_CACHE_TTL,
+                 timeout: float = READINESS_CHECK_TIMEOUT) -> None:
+        self.checks = checks
+        self.cache_ttl = cache_ttl
+        self.timeout = timeout
+        self.results: dict[str, dict[str, Any]] = {name: {'ready': False, 'error': "not checked yet", 'seconds': None}
+                                                   for name in checks}
+        self._checked_at: Optional[float] = None
+        self._pass: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return all(result['ready'] for result in self.results.values())
+
+    async def check(self, force: bool = False) -> dict[str, dict[str, Any]]:
+        if not force and (self._checked_at is not None) and (time.monotonic() - self._checked_at < self.cache_ttl):
+            return self.results
+        if (self._pass is None) or self._pass.done():
+            self._pass = asyncio.create_task(self._check_all())
+        # a cancelled probe must not cancel the pass other probes wait for
+        await asyncio.shield(self._pass)
+        return self.results
+
+    async def _check_all(self) -> None:
+        names = list(self.checks)
+        results = await asyncio.gather(*(self._check_one(self.checks[name]) for name in names))
+        self.results = dict(zip(names, results))
+        self._checked_at = time.monotonic()
+
+    async def _check_one(self, check: Callable[[], None]) -> dict[str, Any]:
+        start = time.perf_counter()
+        error = None
+        try:
+            await asyncio.wait_for(run_blocking(check), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            error = f"timed out after {self.timeout}s"
+        except Exception as e:
+            error = repr(e)
+        return {'ready': error is None, 'error': error, 'seconds': round(time.perf_counter() - start, 4)}
@@ -0,0 +1,169 @@
+import os
+import time
+import socket
+import threading
+from typing import Optional
+
+from kubernetes import client
+from urllib3.connection import HTTPConnection
+
+# Size of the shared urllib3 connection pool to the API server
+K8S_CONNECTION_POOL_SIZE = int(os.getenv("K8S_CONNECTION_POOL_SIZE", "32"))
+# Client-side rate limit for API server requests (watches are exempt), 0 disables it
+K8S_CLIENT_QPS = float(os.getenv("K8S_CLIENT_QPS", "20"))
+K8S_CLIENT_BURST = int(os.getenv("K8S_CLIENT_BURST", "40"))
+
+_VERBS = {'POST': 'create', 'PUT': 'update', 'PATCH': 'patch'}
+
+
+class TokenBucket:
+    def __init__(self, qps: float, burst: int) -> None:
+        self.qps = qps
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Takes one token, blocking until it is available.
+        :return: Seconds spent waiting.
+        """
+        if self.qps <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.qps)
+            self._last = now
+            self._tokens -= 1
+            wait = -self._tokens / self.qps if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RequestStats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats: dict[tuple[str, str], dict[str, float]] = {}
+        self.throttled_seconds = 0.0
+
+    def observe(self, verb: str, resource: str, seconds: float, error: bool) -> None:
+        with self._lock:
+            stats = self._stats.setdefault((verb, resource), {'count': 0, 'errors': 0, 'sum': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['errors'] += int(error)
+            stats['sum'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+
+    def add_throttle(self, seconds: float) -> None:
+        with self._lock:
+            self.throttled_seconds += seconds
+
+    def snapshot(self) -> dict[tuple[str, str], dict[str, float]]:
+        with self._lock:
+            return {key: dict(stats) for key, stats in self._stats.items()}
+
+
+def _parse_request(resource_path: str, method: str, query_params: Optional[list]) -> tuple[str, str]:
+    # resource_path is the unformatted template, e.g. /apis/batch/v1/namespaces/{namespace}/jobs/{name}
+    segments = [segment for segment in resource_path.strip('/').split('/') if segment]
+    if '{namespace}' in segments:
+        segments = segments[segments.index('{namespace}') + 1:]
+    resource = next((segment for segment in segments if not segment.startswith('{')), resource_path)
+    named = '{name}' in segments
+    if method == 'GET':
+        if any((key == 'watch') and value for key, value in (query_params or [])):
+            verb = 'watch'
+        else:
+            verb = 'get' if named else 'list'
+    elif method == 'DELETE':
+        verb = 'delete' if named else 'deletecollection'
+    else:
+        verb = _VERBS.get(method, method.lower())
+    return verb, resource
+
+
+class MeteredApiClient(client.ApiClient):
+    """
+    ApiClient shared by all API groups: one urllib3 pool with TCP keep-alive, client-side QPS/burst limiting and
+    latency accounting per verb and resource.
+    """
+    def __init__(self, configuration: client.Configuration, rate_limiter: TokenBucket, stats: RequestStats) -> None:
+        super().__init__(configuration)
+        self.rate_limiter = rate_limiter
+        self.stats = stats
+        self.rest_client.pool_manager.connection_pool_kw['socket_options'] = \
+            HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+    def call_api(self, resource_path, method, path_params=None, query_params=None, *args, **kwargs):
+        verb, resource = _parse_request(resource_path, method, query_params)
+        if verb == 'watch':
+            return super().call_api(resource_path, method, path_params, query_params, *args, **kwargs)
+
+        self.stats.add_throttle(self.rate_limiter.acquire())
+        start = time.perf_counter()
+        error = True
+        try:
+            response = super().call_api(resource_path, method, path_params, query_params, *args, **kwargs)
+            error = False
+            return response
+        finally:
+            self.stats.observe(verb, resource, time.perf_counter() - start, error)
+
+
+_api_client: Optional[MeteredApiClient] = None
+_apis: dict[type, object] = {}
+_lock = threading.Lock()
+request_stats = RequestStats()
+
+
+def init_api_client() -> MeteredApiClient:
+    global _api_client
+    with _lock:
+        configuration = client.Configuration.get_default_copy()
+        configuration.connection_pool_maxsize = K8S_CONNECTION_POOL_SIZE
+        _api_client = MeteredApiClient(configuration, TokenBucket(K8S_CLIENT_QPS, K8S_CLIENT_BURST), request_stats)
+        _apis.clear()
+        return _api_client
+
+
+def get_api_client() -> MeteredApiClient:
+    if _api_client is None:
+        return init_api_client()
+    return _api_client
+
+
+def _get_api(api_type: type):
+    api = _apis.get(api_type)
+    if api is None:
+        api = _apis.setdefault(api_type, api_type(get_api_client()))
+    return api
+
+
+def core_v1() -> client.CoreV1Api:
+    return _get_api(client.CoreV1Api)
+
+
+def apps_v1() -> client.AppsV1Api:
+    return _get_api(client.AppsV1Api)
+
+
+def batch_v1() -> client.BatchV1Api:
+    return _get_api(client.BatchV1Api)
+
+
+def networking_v1() -> client.NetworkingV1Api:
+    return _get_api(client.NetworkingV1Api)
+
+
+def coordination_v1() -> client.CoordinationV1Api:
+    return _get_api(client.CoordinationV1Api)
+
+
+def rbac_authorization_v1() -> client.RbacAuthorizationV1Api:
+    return _get_api(client.RbacAuthorizationV1Api)
+
+
+def version_api() -> client.VersionApi:
+    return _get_api(client.VersionApi)
@@ -0,0 +1,96 @@
+import os
+import time
+import threading
+from typing import Any, Callable, Optional
+
+from kubernetes import client
+
+from src.k8s.api_clients import core_v1
+from src.k8s.utils import get_current_namespace
+from src.k8s.watcher import ResourceWatcher
+
+RESULT_SERVICE_COMPONENT = "flame-result-service"
+ANALYSIS_NGINX_COMPONENT = "flame-analysis-nginx"
+SERVICE_WATCH_ENABLED = os.getenv("SERVICE_DISCOVERY_WATCH", "true").lower() == "true"
+# Without a running Service watch, the cached Service list is refreshed after this many seconds
+SERVICE_DISCOVERY_TTL = float(os.getenv("SERVICE_DISCOVERY_TTL", "30"))
+
+
+def _service_count(name: str) -> int:
+    try:
+        return int(name.rsplit('-', 1)[-1])
+    except ValueError:
+        return -1
+
+
+class ServiceEndpointCache(ResourceWatcher):
+    """
+    Cache of the result service and analysis nginx Service names of the namespace. Kept current by a Service watch
+    once started, otherwise refreshed by a list after SERVICE_DISCOVERY_TTL. Lookups of the newest nginx Service per
+    analysis_id are memoized until a nginx Service is added or deleted.
+    """
+    thread_name = "service-discovery"
+
+    def __init__(self, namespace: Optional[str] = None, ttl: float = SERVICE_DISCOVERY_TTL) -> None:
+        super().__init__(namespace or get_current_namespace(),
+                         f"component in ({RESULT_SERVICE_COMPONENT},{ANALYSIS_NGINX_COMPONENT})")
+        self.ttl = ttl
+        self._services: dict[str, set[str]] = {RESULT_SERVICE_COMPONENT: set(), ANALYSIS_NGINX_COMPONENT: set()}
+        self._analysis_index: dict[str, Optional[str]] = {}
+        self._listed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def list_func(self) -> Callable[..., Any]:
+        return core_v1().list_namespaced_service
+
+    def on_list(self, items: list[client.V1Service]) -> None:
+        services = {RESULT_SERVICE_COMPONENT: set(), ANALYSIS_NGINX_COMPONENT: set()}
+        for service in items:
+            component = (service.metadata.labels or {}).get('component')
+            if component in services:
+                services[component].add(service.metadata.name)
+        with self._lock:
+            self._services = services
+            self._analysis_index.clear()
+            self._listed_at = time.monotonic()
+
+    def on_event(self, event_type: str, obj: client.V1Service) -> None:
+        component = (obj.metadata.labels or {}).get('component')
+        if component not in self._services:
+            return
+        with self._lock:
+            if event_type == 'DELETED':
+                self._services[component].discard(obj.metadata.name)
+            else:
+                self._services[component].add(obj.metadata.name)
+            if component == ANALYSIS_NGINX_COMPONENT:
+                self._analysis_index.clear()
+
+    def result_service(self) -> Optional[str]:
+        self._ensure_fresh()
+        with self._lock:
+            return min(self._services[RESULT_SERVICE_COMPONENT], default=None)
+
+    def analysis_nginx_service(self, analysis_id: str) -> Optional[str]:
+        self._ensure_fresh()
+        with self._lock:
+            if analysis_id not in self._analysis_index:
+                candidates = [name for name in self._services[ANALYSIS_NGINX_COMPONENT] if analysis_id in name]
+                self._analysis_index[analysis_id] = max(candidates, key=_service_count) if candidates else None
+            return self._analysis_index[analysis_id]
+
+    def _ensure_fresh(self) -> None:
+        if self.watching:
+            return
+        if (self._listed_at is None) or (time.monotonic() - self._listed_at > self.ttl):
+            self.relist()
+
+
+_service_endpoints: Optional[ServiceEndpointCache] = None
+
+
+def get_service_endpoints() -> ServiceEndpointCache:
+    global _service_endpoints
+    if _service_endpoints is None:
+        _service_endpoints = ServiceEndpointCache()
+    return _service_endpoints
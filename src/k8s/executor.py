@@ -0,0 +1,99 @@
+import os
+
+from kubernetes import client
+
+from src.k8s.api_clients import core_v1, rbac_authorization_v1
+from src.k8s.kubernetes import PVC_NAME, SERVICE_ACCOUNT, WORK_MOUNT_PATH
+
+# Default Nextflow executor of runs: 'local' runs every task inside the run's pod, 'k8s' runs each task in a pod of
+# its own, so that a run spreads across the nodes of the cluster
+EXECUTORS = ('local', 'k8s')
+NF_EXECUTOR = os.getenv("NF_EXECUTOR", "local")
+# Tasks pending or running at once per run with the k8s executor
+EXECUTOR_QUEUE_SIZE = int(os.getenv("NF_EXECUTOR_QUEUE_SIZE", "100"))
+# Defaults for processes the pipeline does not size itself
+TASK_CPUS = int(os.getenv("NF_TASK_CPUS", "1"))
+TASK_MEMORY = os.getenv("NF_TASK_MEMORY", "2 GB")
+TASK_SERVICE_ACCOUNT = os.getenv("NF_TASK_SERVICE_ACCOUNT", "default")
+# Create the Role and RoleBinding that let the run pods (NF_SERVICE_ACCOUNT) manage their task pods at startup,
+# requires the launcher itself to hold these permissions
+EXECUTOR_RBAC_ENABLED = os.getenv("NF_EXECUTOR_RBAC", "false").lower() == "true"
+EXECUTOR_ROLE_NAME = "nextflow-k8s-executor"
+TASK_COMPONENT = "flame-analysis-nf-task"
+
+
+def _groovy_string(value: str) -> str:
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def k8s_executor_config(run_id: str, analysis_id: str, namespace: str = 'default') -> str:
+    """
+    Nextflow config running the tasks of a run as pods next to it, sharing the work dir through PVC_NAME. Task pods
+    carry the run's run-id and analysis-id labels, so they can be deleted along with the run.
+    """
+    pod_labels = ", ".join(f"[label: {_groovy_string(name)}, value: {_groovy_string(value)}]"
+                           for name, value in [('component', TASK_COMPONENT),
+                                               ('run-id', run_id),
+                                               ('analysis-id', analysis_id)])
+    return "\n".join([
+        "process {",
+        "  executor = 'k8s'",
+        f"  cpus = {TASK_CPUS}",
+        f"  memory = {_groovy_string(TASK_MEMORY)}",
+        f"  pod = [{pod_labels}]",
+        "}",
+        "executor {",
+        f"  queueSize = {EXECUTOR_QUEUE_SIZE}",
+        "}",
+        "k8s {",
+        f"  namespace = {_groovy_string(namespace)}",
+        f"  serviceAccount = {_groovy_string(TASK_SERVICE_ACCOUNT)}",
+        f"  storageClaimName = {_groovy_string(PVC_NAME)}",
+        f"  storageMountPath = {_groovy_string(WORK_MOUNT_PATH)}",
+        "  cleanup = true",
+        "}",
+    ])
+
+
+def ensure_executor_rbac(namespace: str = 'default') -> None:
+    """
+    Creates or updates the Role and RoleBinding allowing NF_SERVICE_ACCOUNT to run the tasks of its run as pods.
+    """
+    role = client.V1Role(
+        metadata=client.V1ObjectMeta(name=EXECUTOR_ROLE_NAME, namespace=namespace),
+        rules=[
+            client.V1PolicyRule(api_groups=[""], resources=["pods"],
+                                verbs=["get", "list", "watch", "create", "delete"]),
+            client.V1PolicyRule(api_groups=[""], resources=["pods/log", "pods/status"], verbs=["get"]),
+            client.V1PolicyRule(api_groups=[""], resources=["persistentvolumeclaims"], verbs=["get", "list"]),
+            # k8s.computeResourceType = 'Job'
+            client.V1PolicyRule(api_groups=["batch"], resources=["jobs"],
+                                verbs=["get", "list", "watch", "create", "delete"]),
+        ],
+    )
+    role_binding = client.V1RoleBinding(
+        metadata=client.V1ObjectMeta(name=EXECUTOR_ROLE_NAME, namespace=namespace),
+        role_ref=client.V1RoleRef(api_group="rbac.authorization.k8s.io", kind="Role", name=EXECUTOR_ROLE_NAME),
+        subjects=[client.V1Subject(kind="ServiceAccount", name=SERVICE_ACCOUNT, namespace=namespace)],
+    )
+    rbac = rbac_authorization_v1()
+    for create, replace, body in [(rbac.create_namespaced_role, rbac.replace_namespaced_role, role),
+                                  (rbac.create_namespaced_role_binding, rbac.replace_namespaced_role_binding,
+                                   role_binding)]:
+        try:
+            create(namespace=namespace, body=body)
+        except client.exceptions.ApiException as e:
+            if e.status != 409:
+                raise
+            replace(name=EXECUTOR_ROLE_NAME, namespace=namespace, body=body)
+
+
+def delete_run_task_pods(run_id: str, namespace: str = 'default') -> None:
+    # Nextflow removes its task pods when it exits normally, not when its Job is deleted
+    core_v1().delete_collection_namespaced_pod(namespace=namespace,
+                                               label_selector=f"component={TASK_COMPONENT},run-id={run_id}")
+
+
+def delete_analysis_task_pods(analysis_id: str, namespace: str = 'default') -> None:
+    core_v1().delete_collection_namespaced_pod(namespace=namespace,
+                                               label_selector=f"component={TASK_COMPONENT},analysis-id={analysis_id}")
@@ -1,8 +1,11 @@
 import os
-from typing import Any, Optional
+import json
+from typing import Optional
 from kubernetes import client
 from fastapi import HTTPException
 
+from src.k8s.api_clients import batch_v1, core_v1
+
 
 # Load Nextflow Config from environment variables
 SERVICE_ACCOUNT  = os.getenv("NF_SERVICE_ACCOUNT", "nextflow-sa")
@@ -11,41 +14,138 @@ NF_IMAGE         = os.getenv("NF_IMAGE", "nextflow/nextflow:24.10.0")
 CONFIGMAP_NAME   = os.getenv("NF_CONFIGMAP", "nextflow-config")
 CONFIGMAP_KEY    = os.getenv("NF_CONFIGMAP_KEY", "nextflow.config")
 BACKOFF_LIMIT    = int(os.getenv("NF_BACKOFF_LIMIT", "0"))
+# Print the Nextflow version and config before each run, costs a JVM start
+WRAPPER_VERBOSE  = os.getenv("NF_WRAPPER_VERBOSE", "false").lower() == "true"
 
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "nextflow-service:8000") + "/nextflow/conclude"  # <-- set me
                            # <-- kubectl apply -f secret below
+# With the launcher watching Jobs, the conclude webhook is only a fast path and is tried once
+JOB_WATCH_ENABLED = os.getenv("NF_JOB_WATCH", "true").lower() == "true"
+# Report every task to the launcher while the run is going, otherwise tasks are read from the trace at conclusion
+WEBLOG_ENABLED = os.getenv("NF_WEBLOG", "false").lower() == "true"
+WEBLOG_URL = os.getenv("WEBHOOK_URL", "nextflow-service:8000") + "/nextflow/weblog"
+# Trace fields of every run, in raw mode times are epoch or duration milliseconds and sizes are bytes. These are defaults,
+# a trace scope in the pipeline's config overrides them except for the file, which the launcher reads from NXF_HOME.
+TRACE_FIELDS = "task_id,name,process,status,exit,submit,complete,cpus,memory,realtime,%cpu,peak_rss,rchar,wchar"
+WEBHOOK_RETRY_DELAYS = os.getenv("NF_WEBHOOK_RETRY_DELAYS", "0" if JOB_WATCH_ENABLED else "1 2 4 8 16")
+
+# Volume for the Nextflow task work dir: 'shared' uses a subdirectory of PVC_NAME, 'pvc' creates a PVC per run that is
+# deleted when the run is stopped, 'ephemeral' uses a generic ephemeral volume that lives as long as the run's pod.
+# Staged input and published results stay on PVC_NAME, where the launcher reads and writes them.
+RUN_VOLUME_MODE    = os.getenv("NF_RUN_VOLUME_MODE", "shared")
+RUN_VOLUME_SIZE    = os.getenv("NF_RUN_VOLUME_SIZE", "10Gi")
+RUN_STORAGE_CLASS  = os.getenv("NF_RUN_STORAGE_CLASS")  # None uses the cluster's default storage class
+RUN_VOLUME_ACCESS_MODE = os.getenv("NF_RUN_VOLUME_ACCESS_MODE", "ReadWriteOnce")
+
+# Mount PVC at /workspace to match Nextflow config expectations
+WORK_MOUNT_PATH = "/workspace"
+SCRATCH_MOUNT_PATH = "/scratch"
+# Pipeline assets and resumable work dirs shared between runs (NF_CACHE_ENABLED)
+NF_CACHE_PATH = f"{WORK_MOUNT_PATH}/.nf-cache"
+
+
+def get_run_work_dir(run_id: str) -> str:
+    # Use run-specific subdirectories within /workspace
+    return f"{WORK_MOUNT_PATH}/{run_id}"
+
+
+def get_run_pvc_name(run_id: str) -> str:
+    return f"{run_id}-work"
+
+
+def _run_volume_claim_spec(volume_size: Optional[str]) -> client.V1PersistentVolumeClaimSpec:
+    return client.V1PersistentVolumeClaimSpec(
+        access_modes=[RUN_VOLUME_ACCESS_MODE],
+        storage_class_name=RUN_STORAGE_CLASS,
+        resources=client.V1ResourceRequirements(requests={'storage': volume_size or RUN_VOLUME_SIZE}),
+    )
+
 
+def _resource_requirements(resources: Optional[dict[str, Optional[str]]]) -> Optional[client.V1ResourceRequirements]:
+    if not resources:
+        return None
+    requests = {name: resources[f"{name}_request"] for name in ['cpu', 'memory'] if resources.get(f"{name}_request")}
+    limits = {name: resources[f"{name}_limit"] for name in ['cpu', 'memory'] if resources.get(f"{name}_limit")}
+    if not (requests or limits):
+        return None
+    return client.V1ResourceRequirements(requests=requests or None, limits=limits or None)
 
-def create_nextflow_run(input_data: Any,
+
+def create_run_pvc(run_id: str,
+                   analysis_id: str,
+                   volume_size: Optional[str] = None,
+                   namespace: str = 'default') -> None:
+    pvc = client.V1PersistentVolumeClaim(
+        api_version="v1",
+        kind="PersistentVolumeClaim",
+        metadata=client.V1ObjectMeta(name=get_run_pvc_name(run_id),
+                                     labels={'app': run_id,
+                                             'component': "flame-analysis-nf",
+                                             'analysis-id': analysis_id},
+                                     namespace=namespace),
+        spec=_run_volume_claim_spec(volume_size),
+    )
+    try:
+        core_v1().create_namespaced_persistent_volume_claim(namespace=namespace, body=pvc)
+    except client.exceptions.ApiException as e:
+        if e.status != 409:
+            raise HTTPException(status_code=500, detail=str(e))
+
+
+def create_nextflow_run(input_path: Optional[str],
                         run_id: str,
+                        analysis_id: str,
                         pipeline_name: Optional[str] = None,
                         run_args: Optional[list[str]] = None,
+                        resources: Optional[dict[str, Optional[str]]] = None,
+                        assets_key: Optional[str] = None,
+                        work_cache_key: Optional[str] = None,
+                        executor_config: Optional[str] = None,
                         namespace: str = 'default') -> None:
-    batch = client.BatchV1Api()
+    """
+    Creates the Job of a Nextflow run, and its work dir PVC in 'pvc' volume mode.
+    :param resources: cpu_request, cpu_limit, memory_request, memory_limit of the Nextflow pod and volume_size of its
+                      work dir volume, each optional.
+    :param assets_key: Pipelines are pulled into the shared assets dir of this key instead of the run's NXF_HOME.
+    :param work_cache_key: The run resumes from the shared work dir of this key, unless another run holds it.
+    :param executor_config: Nextflow config of an executor that runs the tasks in pods of their own, which requires the
+                            task work dir on the shared PVC.
+    """
+    batch = batch_v1()
+    resources = resources or {}
+    volume_mode = 'shared' if executor_config else RUN_VOLUME_MODE
 
     job_name = run_id
-    # Mount PVC at /workspace to match Nextflow config expectations
-    work_mount_path = "/workspace"
+    work_mount_path = WORK_MOUNT_PATH
     conf_mount_path = "/conf"
-    # Use run-specific subdirectories within /workspace
-    run_work_dir = f"{work_mount_path}/{run_id}"
+    run_work_dir = get_run_work_dir(run_id)
+    task_work_dir = f"{run_work_dir}/work" if volume_mode == 'shared' else f"{SCRATCH_MOUNT_PATH}/work"
 
-    # Build the nextflow command
+    # Build the nextflow command, WORK_DIR and RESUME are set by the wrapper below
+    # Later configs override earlier ones: the launcher's trace defaults come before the pipeline's config, the
+    # executor config after it. The trace file is given on the command line, which takes precedence over any config.
     pieces = [
         "nextflow", "run", pipeline_name,
+        "-c", '"$NXF_HOME/launcher.config"',
         "-c", f"{conf_mount_path}/{CONFIGMAP_KEY}",
-        "-work-dir", f"{run_work_dir}/work",
     ]
+    if executor_config:
+        pieces.extend(["-c", '"$NXF_HOME/executor.config"'])
+    pieces.extend(["-with-trace", '"$NXF_HOME/trace.txt"', "-work-dir", '"$WORK_DIR"', "$RESUME"])
+    if WEBLOG_ENABLED:
+        pieces.extend(["-with-weblog", '"$WEBLOG_URL"'])
 
-    # Add input_data parameter if needed by the pipeline
-    if input_data:
-        pieces.extend(["--input_data", f"'{run_work_dir}/input'"])
+    # Add input_data parameter if input was staged onto the PVC for the pipeline
+    if input_path:
+        pieces.extend(["--input_data", f"'{input_path}'"])
 
     if run_args:
         # Prevent shell injection by splitting params safely if you pass them as a single string
         pieces.extend(run_args)
 
     command = " ".join(pieces)
+    verbose_header = (f"echo 'Nextflow:' && nextflow -version\n"
+                      f"    echo 'Using config:' && cat {conf_mount_path}/{CONFIGMAP_KEY}") if WRAPPER_VERBOSE else ""
     notify_wrapper = f"""
     set -Eeuo pipefail
 
@@ -55,14 +155,15 @@ def create_nextflow_run(input_data: Any,
       body=$(printf '{{"run_id":"%s","run_status":"%s","storage_location":"%s"}}' \
                    "$RUN_ID" "$status" "$STORAGE_LOCATION")
 
-      # Exponential backoff: 1,2,4,8,16s (tunable)
-      for d in 1 2 4 8 16; do
-        if curl -fsS -X POST "$WEBHOOK_URL" \
+      # Exponential backoff, e.g. 1,2,4,8,16s (tunable), a delay of 0 gives up after that attempt
+      for d in {WEBHOOK_RETRY_DELAYS}; do
+        if curl -fsS --max-time 10 -X POST "$WEBHOOK_URL" \
              -H "Content-Type: application/json" \
              --data "$body"; then
           echo "Conclude webhook delivered: $status"
           return 0
         fi
+        [ "$d" -gt 0 ] || break
         echo "Webhook attempt failed; retrying in $d s..." >&2
         sleep "$d"
       done
@@ -70,8 +171,30 @@ def create_nextflow_run(input_data: Any,
       return 0  # don't block Job termination on notify issues
     }}
 
-    echo 'Nextflow:' && nextflow -version
-    echo 'Using config:' && cat {conf_mount_path}/{CONFIGMAP_KEY}
+    # Read by the launcher: container start, and the trace with task status, times and resource usage
+    mkdir -p "$NXF_HOME"
+    date +%s.%N > "$NXF_HOME/container_started"
+    printf 'trace {{\\n  raw = true\\n  overwrite = true\\n  fields = "%s"\\n}}\\n' "{TRACE_FIELDS}" \
+           > "$NXF_HOME/launcher.config"
+    if [ -n "${{EXECUTOR_CONFIG:-}}" ]; then
+      printf '%s\\n' "$EXECUTOR_CONFIG" > "$NXF_HOME/executor.config"
+    fi
+    {verbose_header}
+
+    WORK_DIR="{task_work_dir}"
+    RESUME=""
+    if [ -n "${{WORK_CACHE_DIR:-}}" ]; then
+      # Resume from the work dir of previous runs, a concurrent run of the same cache key starts fresh instead
+      mkdir -p "$WORK_CACHE_DIR"
+      exec 9>"$WORK_CACHE_DIR/.lock"
+      if command -v flock >/dev/null && flock -n 9; then
+        export NXF_CACHE_DIR="$WORK_CACHE_DIR/.nextflow"
+        WORK_DIR="$WORK_CACHE_DIR/work"
+        RESUME="-resume"
+      else
+        echo "Work dir cache in use; running without -resume." >&2
+      fi
+    fi
 
     # ---- run your existing command; notify on both paths ----
     if {command}; then
@@ -82,61 +205,143 @@ def create_nextflow_run(input_data: Any,
     fi
     """
 
+    env = [
+        client.V1EnvVar(name="NXF_HOME", value=f"{run_work_dir}/.nextflow"),
+        client.V1EnvVar(name="NXF_WORK", value=task_work_dir),
+        client.V1EnvVar(name="RUN_ID", value=run_id),
+        client.V1EnvVar(name="WEBHOOK_URL", value=WEBHOOK_URL),
+        client.V1EnvVar(name="STORAGE_LOCATION", value=run_work_dir),
+    ]
+    if WEBLOG_ENABLED:
+        env.append(client.V1EnvVar(name="WEBLOG_URL", value=f"{WEBLOG_URL}/{run_id}"))
+    if executor_config:
+        env.append(client.V1EnvVar(name="EXECUTOR_CONFIG", value=executor_config))
+    if assets_key is not None:
+        env.append(client.V1EnvVar(name="NXF_ASSETS", value=f"{NF_CACHE_PATH}/assets/{assets_key}"))
+    if work_cache_key is not None:
+        env.append(client.V1EnvVar(name="WORK_CACHE_DIR", value=f"{NF_CACHE_PATH}/work/{work_cache_key}"))
+
     container = client.V1Container(
         name="nf",
         image=NF_IMAGE,
         image_pull_policy="IfNotPresent",
         command=["/bin/bash", "-lc"],
         args=[notify_wrapper],
-        env=[
-            client.V1EnvVar(name="NXF_HOME", value=f"{run_work_dir}/.nextflow"),
-            client.V1EnvVar(name="NXF_WORK", value=f"{run_work_dir}/work"),
-            client.V1EnvVar(name="RUN_ID", value=run_id),
-            client.V1EnvVar(name="WEBHOOK_URL", value=WEBHOOK_URL),
-            client.V1EnvVar(name="STORAGE_LOCATION", value=run_work_dir),
-        ],
+        env=env,
         volume_mounts=[
             client.V1VolumeMount(name="work", mount_path=work_mount_path),
             client.V1VolumeMount(name="config", mount_path=conf_mount_path),
         ],
+        resources=_resource_requirements(resources),
     )
 
+    volumes = [
+        client.V1Volume(
+            name="work",
+            persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(
+                claim_name=PVC_NAME
+            ),
+        ),
+        client.V1Volume(
+            name="config",
+            config_map=client.V1ConfigMapVolumeSource(
+                name=CONFIGMAP_NAME,
+                items=[client.V1KeyToPath(key=CONFIGMAP_KEY, path=CONFIGMAP_KEY)],
+            ),
+        ),
+    ]
+    if volume_mode == 'pvc':
+        create_run_pvc(run_id, analysis_id, resources.get('volume_size'), namespace)
+        volumes.append(client.V1Volume(
+            name="scratch",
+            persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(
+                claim_name=get_run_pvc_name(run_id)
+            ),
+        ))
+    elif volume_mode == 'ephemeral':
+        volumes.append(client.V1Volume(
+            name="scratch",
+            ephemeral=client.V1EphemeralVolumeSource(
+                volume_claim_template=client.V1PersistentVolumeClaimTemplate(
+                    metadata=client.V1ObjectMeta(labels={'component': "flame-analysis-nf",
+                                                         'analysis-id': analysis_id}),
+                    spec=_run_volume_claim_spec(resources.get('volume_size')),
+                )
+            ),
+        ))
+    if volume_mode != 'shared':
+        container.volume_mounts.append(client.V1VolumeMount(name="scratch", mount_path=SCRATCH_MOUNT_PATH))
+
     pod_spec = client.V1PodSpec(
         service_account_name=SERVICE_ACCOUNT,
         restart_policy="Never",
         containers=[container],
-        volumes=[
-            client.V1Volume(
-                name="work",
-                persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(
-                    claim_name=PVC_NAME
-                ),
-            ),
-            client.V1Volume(
-                name="config",
-                config_map=client.V1ConfigMapVolumeSource(
-                    name=CONFIGMAP_NAME,
-                    items=[client.V1KeyToPath(key=CONFIGMAP_KEY, path=CONFIGMAP_KEY)],
-                ),
-            ),
-        ],
+        volumes=volumes,
     )
 
     job_spec = client.V1JobSpec(
         backoff_limit=BACKOFF_LIMIT,
-        template=client.V1PodTemplateSpec(spec=pod_spec),
+        template=client.V1PodTemplateSpec(
+            metadata=client.V1ObjectMeta(labels={'app': job_name,
+                                                 'component': "flame-analysis-nf",
+                                                 'analysis-id': analysis_id}),
+            spec=pod_spec,
+        ),
     )
 
     job = client.V1Job(
         api_version="batch/v1",
         kind="Job",
         metadata=client.V1ObjectMeta(name=job_name,
-                                     labels={'app': job_name, 'component': "flame-analysis-nf"},
+                                     labels={'app': job_name,
+                                             'component': "flame-analysis-nf",
+                                             'analysis-id': analysis_id},
                                      namespace=namespace),
         spec=job_spec,
     )
 
     try:
         batch.create_namespaced_job(namespace=namespace, body=job)
+    except client.exceptions.ApiException as e:
+        if e.status == 409:
+            # Job of a run that was requeued after its launch was interrupted already exists
+            return
+        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def delete_analysis_nextflow_runs(analysis_id: str, namespace: str = 'default') -> list[str]:
+    """
+    Deletes all Nextflow run Jobs labelled with the given analysis_id in a single request.
+    :return: Names of the deleted Jobs.
+    """
+    batch = batch_v1()
+    response = batch.delete_collection_namespaced_job(namespace=namespace,
+                                                      label_selector=f"component=flame-analysis-nf,"
+                                                                     f"analysis-id={analysis_id}",
+                                                      propagation_policy='Background',
+                                                      _preload_content=False)
+    return [job['metadata']['name'] for job in json.loads(response.data).get('items', [])]
+
+
+def delete_analysis_run_pvcs(analysis_id: str, namespace: str = 'default') -> None:
+    # PVCs of 'pvc' volume mode, those still mounted are removed once their pod is gone
+    core_v1().delete_collection_namespaced_persistent_volume_claim(namespace=namespace,
+                                                                   label_selector=f"component=flame-analysis-nf,"
+                                                                                  f"analysis-id={analysis_id}")
+
+
+def delete_nextflow_run(run_id: str, namespace: str = 'default') -> bool:
+    """
+    Deletes the Job of a single Nextflow run.
+    :return: False if the Job did not exist.
+    """
+    batch = batch_v1()
+    try:
+        batch.delete_namespaced_job(name=run_id, namespace=namespace, propagation_policy='Background')
+        return True
+    except client.exceptions.ApiException as e:
+        if e.status == 404:
+            return False
+        raise
@@ -0,0 +1,137 @@
+import os
+import time
+import socket
+import asyncio
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+from kubernetes import client
+
+from src.k8s.api_clients import coordination_v1
+
+# Worker processes per launcher pod
+WORKERS = int(os.getenv("NF_WORKERS", "1"))
+# Background duties (scheduling, Job conclusion, cleanup) run in the one process holding the Lease. Needed as soon as
+# more than one process serves the launcher, i.e. several workers or several replicas.
+LEADER_ELECTION_ENABLED = os.getenv("NF_LEADER_ELECTION", "true" if WORKERS > 1 else "false").lower() == "true"
+LEASE_NAME = os.getenv("NF_LEASE_NAME", "flame-nextflow-launcher")
+LEASE_DURATION = int(os.getenv("NF_LEASE_DURATION", "15"))
+LEASE_RENEW_INTERVAL = float(os.getenv("NF_LEASE_RENEW_INTERVAL", "5"))
+
+
+class LeaderElector:
+    """
+    Kubernetes Lease based leader election between all launcher processes. The holder renews the Lease every
+    renew_interval, the others take it over once it was not renewed for lease_duration as observed on their own
+    clock. on_started_leading and on_stopped_leading are awaited on the event loop on every change.
+    """
+    def __init__(self,
+                 namespace: str,
+                 on_started_leading: Callable[[], Awaitable[None]],
+                 on_stopped_leading: Callable[[], Awaitable[None]],
+                 identity: Optional[str] = None,
+                 lease_name: str = LEASE_NAME,
+                 lease_duration: int = LEASE_DURATION,
+                 renew_interval: float = LEASE_RENEW_INTERVAL) -> None:
+        self.namespace = namespace
+        self.on_started_leading = on_started_leading
+        self.on_stopped_leading = on_stopped_leading
+        self.identity = identity or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_name = lease_name
+        self.lease_duration = lease_duration
+        self.renew_interval = renew_interval
+        self.is_leader = False
+        self._observed: Optional[tuple[Optional[str], Optional[datetime]]] = None
+        self._observed_at = 0.0
+        self._renewed_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            await self._set_leader(False)
+            try:
+                await asyncio.to_thread(self.release)
+            except Exception as e:
+                print(f"Error: Releasing Lease {self.lease_name} failed: {repr(e)}")
+
+    def try_acquire_or_renew(self) -> bool:
+        now = datetime.now(timezone.utc)
+        leases = coordination_v1()
+        try:
+            lease = leases.read_namespaced_lease(self.lease_name, self.namespace)
+        except client.exceptions.ApiException as e:
+            if e.status != 404:
+                raise
+            lease = client.V1Lease(metadata=client.V1ObjectMeta(name=self.lease_name, namespace=self.namespace),
+                                   spec=client.V1LeaseSpec(holder_identity=self.identity,
+                                                           lease_duration_seconds=self.lease_duration,
+                                                           acquire_time=now,
+                                                           renew_time=now,
+                                                           lease_transitions=0))
+            return self._write(leases.create_namespaced_lease, self.namespace, lease)
+
+        spec = lease.spec or client.V1LeaseSpec()
+        if spec.holder_identity != self.identity:
+            # a renewal by the holder shows as a changed record, the Lease expires once the record stands still
+            record = (spec.holder_identity, spec.renew_time)
+            if record != self._observed:
+                self._observed = record
+                self._observed_at = time.monotonic()
+            duration = spec.lease_duration_seconds or self.lease_duration
+            if spec.holder_identity and (time.monotonic() - self._observed_at < duration):
+                return False
+            spec.acquire_time = now
+            spec.lease_transitions = (spec.lease_transitions or 0) + 1
+        spec.holder_identity = self.identity
+        spec.lease_duration_seconds = self.lease_duration
+        spec.renew_time = now
+        lease.spec = spec
+        # the resourceVersion of the read makes concurrent takeovers conflict
+        return self._write(leases.replace_namespaced_lease, self.lease_name, self.namespace, lease)
+
+    @staticmethod
+    def _write(func: Callable[..., client.V1Lease], *args) -> bool:
+        try:
+            func(*args)
+            return True
+        except client.exceptions.ApiException as e:
+            if e.status == 409:
+                return False
+            raise
+
+    def release(self) -> None:
+        # lets the next process take over right away instead of after lease_duration
+        lease = coordination_v1().read_namespaced_lease(self.lease_name, self.namespace)
+        if lease.spec.holder_identity == self.identity:
+            lease.spec.holder_identity = None
+            self._write(coordination_v1().replace_namespaced_lease, self.lease_name, self.namespace, lease)
+
+    async def _set_leader(self, is_leader: bool) -> None:
+        self.is_leader = is_leader
+        print(f"Launcher {self.identity} {'became' if is_leader else 'is no longer'} leader")
+        try:
+            await (self.on_started_leading() if is_leader else self.on_stopped_leading())
+        except Exception as e:
+            print(f"Error: Switching leader duties of {self.identity} failed: {repr(e)}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                acquired = await asyncio.to_thread(self.try_acquire_or_renew)
+                if acquired:
+                    self._renewed_at = time.monotonic()
+            except Exception as e:
+                print(f"Error: Acquiring or renewing Lease {self.lease_name} failed: {repr(e)}")
+                # keep leading through API server hiccups until others may consider the Lease expired
+                acquired = self.is_leader and \
+                    (time.monotonic() - self._renewed_at < self.lease_duration - self.renew_interval)
+            if acquired != self.is_leader:
+                await self._set_leader(acquired)
+            await asyncio.sleep(self.renew_interval)
@@ -0,0 +1,135 @@
+import os
+import asyncio
+import threading
+from collections import deque
+from typing import Optional
+
+from kubernetes import client
+
+from src.k8s.api_clients import core_v1
+
+# Recent log lines replayed to clients that join a running log stream
+LOG_BACKLOG_LINES = int(os.getenv("LOG_BACKLOG_LINES", "1000"))
+# Lines buffered per client, slow clients lose the oldest lines instead of holding back the others
+LOG_SUBSCRIBER_BUFFER = int(os.getenv("LOG_SUBSCRIBER_BUFFER", "1000"))
+LOG_CONTAINER_NAME = "nf"
+
+
+def find_run_pod(run_id: str, namespace: str = 'default') -> Optional[str]:
+    pods = core_v1().list_namespaced_pod(namespace=namespace, label_selector=f"job-name={run_id}").items
+    if not pods:
+        return None
+    return max(pods, key=lambda pod: pod.metadata.creation_timestamp).metadata.name
+
+
+class LogBroadcaster:
+    """
+    Follows the log of one pod with a single API server request and fans the lines out to any number of
+    subscribers on the event loop. The request is closed once the last subscriber left.
+    """
+    def __init__(self, pod_name: str, namespace: str, loop: asyncio.AbstractEventLoop) -> None:
+        self.pod_name = pod_name
+        self.namespace = namespace
+        self.loop = loop
+        self.backlog: deque[str] = deque(maxlen=LOG_BACKLOG_LINES)
+        self.finished = False
+        self._subscribers: set[asyncio.Queue] = set()
+        self._response = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=LOG_SUBSCRIBER_BUFFER)
+        for line in self.backlog:
+            self._offer(queue, line)
+        if self.finished:
+            self._offer(queue, None)
+            return queue
+        self._subscribers.add(queue)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._follow, name=f"log-{self.pod_name}", daemon=True)
+            self._thread.start()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+        if not self._subscribers:
+            self.stop()
+
+    @property
+    def idle(self) -> bool:
+        return not self._subscribers
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._response is not None:
+            self._response.close()
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, line: Optional[str]) -> None:
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(line)
+
+    def _publish(self, line: Optional[str]) -> None:
+        if line is None:
+            self.finished = True
+        else:
+            self.backlog.append(line)
+        for queue in self._subscribers:
+            self._offer(queue, line)
+
+    def _follow(self) -> None:
+        try:
+            self._response = core_v1().read_namespaced_pod_log(name=self.pod_name,
+                                                               namespace=self.namespace,
+                                                               container=LOG_CONTAINER_NAME,
+                                                               follow=True,
+                                                               _preload_content=False)
+            if self._stop_event.is_set():
+                # stopped while the request was being made, stop() found no response to close
+                self._response.close()
+                return
+            pending = b''
+            for chunk in self._response.stream(4096):
+                *lines, pending = (pending + chunk).split(b'\n')
+                for line in lines:
+                    self.loop.call_soon_threadsafe(self._publish, line.decode(errors='replace'))
+            if pending:
+                self.loop.call_soon_threadsafe(self._publish, pending.decode(errors='replace'))
+        except client.exceptions.ApiException as e:
+            self.loop.call_soon_threadsafe(self._publish, f"Error: Reading log of pod {self.pod_name} failed: "
+                                                          f"{e.status} {e.reason}")
+        except Exception as e:
+            if not self._stop_event.is_set():
+                print(f"Error: Following log of pod {self.pod_name} failed: {repr(e)}")
+        finally:
+            self.loop.call_soon_threadsafe(self._publish, None)
+
+
+class LogStreams:
+    """
+    One LogBroadcaster per run, shared by all clients watching the run's log. Clients release the broadcaster they
+    subscribed to, which may have been replaced by one for a newer pod of the run meanwhile.
+    """
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+        self._broadcasters: dict[str, LogBroadcaster] = {}
+
+    def get(self, run_id: str, pod_name: str) -> LogBroadcaster:
+        broadcaster = self._broadcasters.get(run_id)
+        if (broadcaster is None) or (broadcaster.pod_name != pod_name) or (broadcaster.finished and broadcaster.idle):
+            broadcaster = LogBroadcaster(pod_name, self.namespace, asyncio.get_running_loop())
+            self._broadcasters[run_id] = broadcaster
+        return broadcaster
+
+    def release(self, run_id: str, broadcaster: LogBroadcaster, queue: asyncio.Queue) -> None:
+        # stops the broadcaster's request once its last subscriber left
+        broadcaster.unsubscribe(queue)
+        if broadcaster.idle and (self._broadcasters.get(run_id) is broadcaster):
+            self._broadcasters.pop(run_id)
+
+    def close(self) -> None:
+        for broadcaster in self._broadcasters.values():
+            broadcaster.stop()
+        self._broadcasters.clear()
@@ -0,0 +1,114 @@
+import threading
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from kubernetes import client
+
+from src.k8s.api_clients import core_v1
+from src.k8s.watcher import JOB_LABEL_SELECTOR, ResourceWatcher, get_job_run_status
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    return value.timestamp() if value is not None else None
+
+
+def job_state(job: client.V1Job) -> dict[str, Any]:
+    status = job.status or client.V1JobStatus()
+    return {'active': status.active or 0,
+            'succeeded': status.succeeded or 0,
+            'failed': status.failed or 0,
+            'result': get_job_run_status(job),
+            'start_time': _timestamp(status.start_time),
+            'completion_time': _timestamp(status.completion_time)}
+
+
+def pod_state(pod: client.V1Pod) -> dict[str, Any]:
+    status = pod.status or client.V1PodStatus()
+    container = {}
+    for container_status in status.container_statuses or []:
+        state = container_status.state
+        if state is None:
+            continue
+        if state.waiting is not None:
+            container = {'state': 'waiting', 'reason': state.waiting.reason}
+        elif state.running is not None:
+            container = {'state': 'running', 'started_at': _timestamp(state.running.started_at)}
+        elif state.terminated is not None:
+            container = {'state': 'terminated',
+                         'reason': state.terminated.reason,
+                         'exit_code': state.terminated.exit_code}
+    return {'name': pod.metadata.name,
+            'phase': status.phase,
+            'node': pod.spec.node_name if pod.spec else None,
+            'container': container or None}
+
+
+def _pod_run_id(pod: client.V1Pod) -> Optional[str]:
+    labels = pod.metadata.labels or {}
+    return labels.get('job-name') or labels.get('app')
+
+
+class RunStateStore:
+    """
+    Latest Job and Pod state of every Nextflow run, kept current by the Job and Pod watches so that status requests
+    are answered without calls to the API server.
+    """
+    def __init__(self) -> None:
+        self._jobs: dict[str, dict[str, Any]] = {}
+        self._pods: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def set_jobs(self, jobs: list[client.V1Job]) -> None:
+        with self._lock:
+            self._jobs = {job.metadata.name: job_state(job) for job in jobs}
+
+    def update_job(self, event_type: str, job: client.V1Job) -> None:
+        with self._lock:
+            if event_type == 'DELETED':
+                self._jobs.pop(job.metadata.name, None)
+            else:
+                self._jobs[job.metadata.name] = job_state(job)
+
+    def set_pods(self, pods: list[client.V1Pod]) -> None:
+        with self._lock:
+            self._pods = {_pod_run_id(pod): pod_state(pod) for pod in pods if _pod_run_id(pod) is not None}
+
+    def update_pod(self, event_type: str, pod: client.V1Pod) -> None:
+        run_id = _pod_run_id(pod)
+        if run_id is None:
+            return
+        with self._lock:
+            if event_type == 'DELETED':
+                if self._pods.get(run_id, {}).get('name') == pod.metadata.name:
+                    del self._pods[run_id]
+            else:
+                self._pods[run_id] = pod_state(pod)
+
+    def get(self, run_id: str) -> dict[str, Optional[dict[str, Any]]]:
+        with self._lock:
+            return {'job': self._jobs.get(run_id), 'pod': self._pods.get(run_id)}
+
+    def pod_name(self, run_id: str) -> Optional[str]:
+        with self._lock:
+            pod = self._pods.get(run_id)
+            return pod['name'] if pod is not None else None
+
+
+class PodWatcher(ResourceWatcher):
+    """
+    Feeds the Pods of the Nextflow run Jobs into a RunStateStore.
+    """
+    thread_name = "nf-pod-watcher"
+
+    def __init__(self, namespace: str, state_store: RunStateStore) -> None:
+        super().__init__(namespace, JOB_LABEL_SELECTOR)
+        self.state_store = state_store
+
+    def list_func(self) -> Callable[..., Any]:
+        return core_v1().list_namespaced_pod
+
+    def on_list(self, items: list[client.V1Pod]) -> None:
+        self.state_store.set_pods(items)
+
+    def on_event(self, event_type: str, obj: client.V1Pod) -> None:
+        self.state_store.update_pod(event_type, obj)
@@ -2,9 +2,12 @@ from typing import Literal, Optional, Union
 
 from kubernetes import config, client
 
+from src.k8s.api_clients import init_api_client, apps_v1, batch_v1, core_v1, networking_v1
+
 
 def load_cluster_config():
     config.load_incluster_config()
+    init_api_client()
 
 
 def get_current_namespace() -> str:
@@ -36,11 +39,11 @@ def find_k8s_resources(resource_type: str,
         kwargs[f'{selector_type}_selector'] = selector_arg
 
     if resource_type == 'deployment':
-        resources = client.AppsV1Api().list_namespaced_deployment(**kwargs)
+        resources = apps_v1().list_namespaced_deployment(**kwargs)
     elif resource_type == 'networkpolicy':
-        resources = client.NetworkingV1Api().list_namespaced_network_policy(**kwargs)
+        resources = networking_v1().list_namespaced_network_policy(**kwargs)
     elif resource_type in ['pod', 'service', 'configmap']:
-        core_client = client.CoreV1Api()
+        core_client = core_v1()
         if resource_type == 'pod':
             resources = core_client.list_namespaced_pod(**kwargs)
         elif resource_type == 'service':
@@ -48,7 +51,7 @@ def find_k8s_resources(resource_type: str,
         elif resource_type == 'configmap':
             resources = core_client.list_namespaced_config_map(**kwargs)
     elif resource_type == 'job':
-        resources = client.BatchV1Api().list_namespaced_job(**kwargs)
+        resources = batch_v1().list_namespaced_job(**kwargs)
     else:
         raise ValueError(f"Uncaptured resource type discovered! Message the Devs... (found={resource_type})")
 
@@ -73,47 +76,54 @@ def delete_k8s_resource(name: str, resource_type: str, namespace: str = 'default
     """
     Deletes a Kubernetes resource by name and type.
     :param name: Name of the resource to delete.
-    :param resource_type: Type of the resource (e.g., 'deployment', 'service', 'pod', 'configmap', 'job').
+    :param resource_type: Type of the resource (e.g., 'deployment', 'service', 'pod', 'configmap', 'job', 'pvc').
     :param namespace: Namespace in which the resource exists.
     """
     if resource_type == 'deployment':
         try:
-            app_client = client.AppsV1Api()
+            app_client = apps_v1()
             app_client.delete_namespaced_deployment(name=name, namespace=namespace, propagation_policy='Foreground')
         except client.exceptions.ApiException as e:
             if e.reason != 'Not Found':
                 print(f"Error: Not Found {name} deployment")
     elif resource_type == 'service':
         try:
-            core_client = client.CoreV1Api()
+            core_client = core_v1()
             core_client.delete_namespaced_service(name=name, namespace=namespace)
         except client.exceptions.ApiException as e:
             if e.reason != 'Not Found':
                 print(f"Error: Not Found {name} service")
     elif resource_type == 'pod':
         try:
-            core_client = client.CoreV1Api()
+            core_client = core_v1()
             core_client.delete_namespaced_pod(name=name, namespace=namespace)
         except client.exceptions.ApiException as e:
             if e.reason != 'Not Found':
                 print(f"Error: Not Found {name} pod")
     elif resource_type == 'configmap':
         try:
-            core_client = client.CoreV1Api()
+            core_client = core_v1()
             core_client.delete_namespaced_config_map(name=name, namespace=namespace)
         except client.exceptions.ApiException as e:
             if e.reason != 'Not Found':
                 print(f"Error: Not Found {name} configmap")
     elif resource_type == 'networkpolicy':
         try:
-            network_client = client.NetworkingV1Api()
+            network_client = networking_v1()
             network_client.delete_namespaced_network_policy(name=name, namespace=namespace)
         except client.exceptions.ApiException as e:
             if e.reason != 'Not Found':
                 print(f"Error: Not Found {name} networkpolicy")
+    elif resource_type == 'pvc':
+        try:
+            core_client = core_v1()
+            core_client.delete_namespaced_persistent_volume_claim(name=name, namespace=namespace)
+        except client.exceptions.ApiException as e:
+            if e.reason != 'Not Found':
+                print(f"Error: Not Found {name} pvc")
     elif resource_type == 'job':
         try:
-            batch_client = client.BatchV1Api()
+            batch_client = batch_v1()
             batch_client.delete_namespaced_job(name=name, namespace=namespace, propagation_policy='Foreground')
         except client.exceptions.ApiException as e:
             if e.reason != 'Not Found':
@@ -0,0 +1,105 @@
+import os
+import hashlib
+from typing import Optional
+
+from kubernetes import client
+
+from src.k8s.api_clients import apps_v1, batch_v1
+from src.k8s.kubernetes import NF_CACHE_PATH, NF_IMAGE, PVC_NAME, SERVICE_ACCOUNT, WORK_MOUNT_PATH
+
+# Keep NF_IMAGE pulled on every node with a DaemonSet, so run pods start without an image pull
+IMAGE_PREPULL_ENABLED = os.getenv("NF_IMAGE_PREPULL", "false").lower() == "true"
+PREPULL_DAEMONSET_NAME = "nextflow-image-prepull"
+PAUSE_IMAGE = os.getenv("NF_PREPULL_PAUSE_IMAGE", "registry.k8s.io/pause:3.9")
+# Comma separated pipeline[@revision] list pulled into the shared assets dir at startup (requires NF_CACHE_ENABLED)
+PREFETCH_PIPELINES = [pipeline for pipeline in os.getenv("NF_PREFETCH_PIPELINES", "").split(',') if pipeline]
+PREFETCH_COMPONENT = "flame-analysis-nf-prefetch"
+
+
+def parse_prefetch_pipeline(pipeline: str) -> tuple[str, Optional[str]]:
+    pipeline_name, _, revision = pipeline.partition('@')
+    return pipeline_name, revision or None
+
+
+def ensure_image_prepull(namespace: str = 'default') -> None:
+    """
+    Creates or updates the DaemonSet that pulls NF_IMAGE onto every node through an init container and then idles.
+    """
+    labels = {'app': PREPULL_DAEMONSET_NAME, 'component': PREPULL_DAEMONSET_NAME}
+    daemon_set = client.V1DaemonSet(
+        api_version="apps/v1",
+        kind="DaemonSet",
+        metadata=client.V1ObjectMeta(name=PREPULL_DAEMONSET_NAME, labels=labels, namespace=namespace),
+        spec=client.V1DaemonSetSpec(
+            selector=client.V1LabelSelector(match_labels=labels),
+            template=client.V1PodTemplateSpec(
+                metadata=client.V1ObjectMeta(labels=labels),
+                spec=client.V1PodSpec(
+                    init_containers=[client.V1Container(name="prepull",
+                                                        image=NF_IMAGE,
+                                                        image_pull_policy="IfNotPresent",
+                                                        command=["/bin/true"])],
+                    containers=[client.V1Container(name="pause",
+                                                   image=PAUSE_IMAGE,
+                                                   resources=client.V1ResourceRequirements(
+                                                       requests={'cpu': "1m", 'memory': "8Mi"},
+                                                       limits={'cpu': "10m", 'memory': "16Mi"}))],
+                ),
+            ),
+        ),
+    )
+    apps = apps_v1()
+    try:
+        apps.create_namespaced_daemon_set(namespace=namespace, body=daemon_set)
+    except client.exceptions.ApiException as e:
+        if e.status != 409:
+            raise
+        apps.replace_namespaced_daemon_set(name=PREPULL_DAEMONSET_NAME, namespace=namespace, body=daemon_set)
+
+
+def create_pipeline_prefetch_job(pipelines: list[tuple[str, Optional[str], str]], namespace: str = 'default') -> str:
+    """
+    Creates a Job that pulls the given pipelines into their shared assets dirs, unless an identical one exists.
+    :param pipelines: (pipeline_name, revision, assets_key) of each pipeline.
+    :return: Name of the Job.
+    """
+    config_hash = hashlib.sha256(repr(sorted(pipelines, key=repr)).encode()).hexdigest()[:10]
+    job_name = f"nextflow-prefetch-{config_hash}"
+    pulls = [f"NXF_ASSETS='{NF_CACHE_PATH}/assets/{assets_key}' nextflow pull '{pipeline_name}'"
+             + (f" -r '{revision}'" if revision else "")
+             for pipeline_name, revision, assets_key in pipelines]
+
+    job = client.V1Job(
+        api_version="batch/v1",
+        kind="Job",
+        metadata=client.V1ObjectMeta(name=job_name,
+                                     labels={'app': job_name, 'component': PREFETCH_COMPONENT},
+                                     namespace=namespace),
+        spec=client.V1JobSpec(
+            backoff_limit=2,
+            ttl_seconds_after_finished=3600,
+            template=client.V1PodTemplateSpec(spec=client.V1PodSpec(
+                service_account_name=SERVICE_ACCOUNT,
+                restart_policy="Never",
+                containers=[client.V1Container(
+                    name="prefetch",
+                    image=NF_IMAGE,
+                    image_pull_policy="IfNotPresent",
+                    command=["/bin/bash", "-lc"],
+                    args=["set -Eeuo pipefail\n" + "\n".join(pulls)],
+                    env=[client.V1EnvVar(name="NXF_HOME", value=f"{NF_CACHE_PATH}/home")],
+                    volume_mounts=[client.V1VolumeMount(name="work", mount_path=WORK_MOUNT_PATH)],
+                )],
+                volumes=[client.V1Volume(
+                    name="work",
+                    persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(claim_name=PVC_NAME),
+                )],
+            )),
+        ),
+    )
+    try:
+        batch_v1().create_namespaced_job(namespace=namespace, body=job)
+    except client.exceptions.ApiException as e:
+        if e.status != 409:
+            raise
+    return job_name
@@ -0,0 +1,182 @@
+import os
+import abc
+import asyncio
+import threading
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+from kubernetes import client, watch
+
+from src.k8s.api_clients import batch_v1
+
+if TYPE_CHECKING:
+    from src.k8s.run_state import RunStateStore
+
+JOB_LABEL_SELECTOR = "component=flame-analysis-nf"
+WATCH_TIMEOUT = int(os.getenv("K8S_WATCH_TIMEOUT", "300"))
+WATCH_RETRY_DELAY = float(os.getenv("K8S_WATCH_RETRY_DELAY", "5"))
+
+
+def get_job_run_status(job: client.V1Job) -> Optional[str]:
+    for condition in (job.status.conditions or []) if job.status else []:
+        if condition.status == 'True':
+            if condition.type == 'Complete':
+                return 'succeeded'
+            elif condition.type == 'Failed':
+                return 'failed'
+    return None
+
+
+class ResourceWatcher(abc.ABC):
+    """
+    Informer base for namespaced resources: lists the resources once, then follows the watch stream from the last
+    seen resourceVersion (relisting if it expired) in a daemon thread. Subclasses provide the list function and
+    consume the initial list and the subsequent events.
+    """
+    thread_name = "k8s-watcher"
+
+    def __init__(self, namespace: str, label_selector: Optional[str] = None) -> None:
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.resource_version: Optional[str] = None
+        self._watch = watch.Watch()
+        self._stop_event = threading.Event()
+        self._relist_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @abc.abstractmethod
+    def list_func(self) -> Callable[..., Any]:
+        pass
+
+    @abc.abstractmethod
+    def on_list(self, items: list[Any]) -> None:
+        pass
+
+    @abc.abstractmethod
+    def on_event(self, event_type: str, obj: Any) -> None:
+        pass
+
+    @property
+    def watching(self) -> bool:
+        return (self._thread is not None) and self._thread.is_alive() and (self.resource_version is not None)
+
+    def start(self) -> None:
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._watch.stop()
+
+    def request_relist(self) -> None:
+        """
+        Has the watch thread relist once it is done with the current event, or once the current watch request times
+        out after K8S_WATCH_TIMEOUT seconds without events. Lists and events are only ever applied by the watch thread.
+        """
+        self._relist_event.set()
+        self._watch.stop()
+
+    def relist(self) -> None:
+        resources = self.list_func()(**self._list_kwargs())
+        self.on_list(resources.items)
+        self.resource_version = resources.metadata.resource_version
+
+    def _list_kwargs(self) -> dict[str, Any]:
+        kwargs = {'namespace': self.namespace}
+        if self.label_selector is not None:
+            kwargs['label_selector'] = self.label_selector
+        return kwargs
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                if (self.resource_version is None) or self._relist_event.is_set():
+                    self._relist_event.clear()
+                    self.relist()
+                for event in self._watch.stream(self.list_func(),
+                                                resource_version=self.resource_version,
+                                                allow_watch_bookmarks=True,
+                                                timeout_seconds=WATCH_TIMEOUT,
+                                                **self._list_kwargs()):
+                    obj = event['object']
+                    self.resource_version = obj.metadata.resource_version
+                    if event['type'] in ['ADDED', 'MODIFIED', 'DELETED']:
+                        self.on_event(event['type'], obj)
+                    if self._stop_event.is_set() or self._relist_event.is_set():
+                        break
+            except client.exceptions.ApiException as e:
+                if e.status == 410:
+                    # resourceVersion too old, relist
+                    self.resource_version = None
+                else:
+                    print(f"Error: {self.thread_name} watch failed: {repr(e)}")
+                    self._stop_event.wait(WATCH_RETRY_DELAY)
+            except Exception as e:
+                print(f"Error: {self.thread_name} watch failed: {repr(e)}")
+                self._stop_event.wait(WATCH_RETRY_DELAY)
+
+
+class JobWatcher(ResourceWatcher):
+    """
+    Watches the Nextflow run Jobs and hands every Job that reached a Complete or Failed condition to
+    on_job_finished(run_id, run_status) on the given event loop, while dispatch is enabled. All Job states are also fed
+    into the optional state_store.
+    """
+    thread_name = "nf-job-watcher"
+
+    def __init__(self,
+                 namespace: str,
+                 on_job_finished: Callable[[str, str], Awaitable[None]],
+                 loop: asyncio.AbstractEventLoop,
+                 state_store: Optional['RunStateStore'] = None,
+                 dispatch: bool = True) -> None:
+        super().__init__(namespace, JOB_LABEL_SELECTOR)
+        self.on_job_finished = on_job_finished
+        self.loop = loop
+        self.state_store = state_store
+        self.dispatch = dispatch
+        self._dispatched: set[str] = set()
+        self._redispatch = False
+
+    def list_func(self) -> Callable[..., Any]:
+        return batch_v1().list_namespaced_job
+
+    def on_list(self, items: list[client.V1Job]) -> None:
+        if self.state_store is not None:
+            self.state_store.set_jobs(items)
+        if self._redispatch:
+            self._redispatch = False
+            self._dispatched.clear()
+        self._dispatched.intersection_update(job.metadata.name for job in items)
+        for job in items:
+            self._handle(job)
+
+    def on_event(self, event_type: str, obj: client.V1Job) -> None:
+        if self.state_store is not None:
+            self.state_store.update_job(event_type, obj)
+        if event_type == 'DELETED':
+            self._dispatched.discard(obj.metadata.name)
+        else:
+            self._handle(obj)
+
+    def set_dispatch(self, dispatch: bool) -> None:
+        """
+        Switches dispatching of finished Jobs, e.g. with leadership. Once enabled, the watch thread relists the Jobs
+        and dispatches all finished ones, including those dispatched before and those that finished meanwhile.
+        """
+        self.dispatch = dispatch
+        if dispatch:
+            self._redispatch = True
+            self.request_relist()
+
+    def _handle(self, job: client.V1Job) -> None:
+        run_id = job.metadata.name
+        run_status = get_job_run_status(job)
+        if self.dispatch and (run_status is not None) and (run_id not in self._dispatched):
+            self._dispatched.add(run_id)
+            future = asyncio.run_coroutine_threadsafe(self.on_job_finished(run_id, run_status), self.loop)
+
+            def _log_failure(f) -> None:
+                if (not f.cancelled()) and (f.exception() is not None):
+                    print(f"Error: Concluding run_id={run_id} from Job watch failed: {repr(f.exception())}")
+            future.add_done_callback(_log_failure)
@@ -1,21 +1,49 @@
+import sys
+
+import uvicorn
 from dotenv import load_dotenv, find_dotenv
+from fastapi import FastAPI
 
+from src.k8s.leader import WORKERS
 from src.k8s.utils import load_cluster_config, get_current_namespace
 from src.resources.database.entity import Database
 from src.api.api import FlameNextflowAPI
+from src.api.metrics import STARTUP_SECONDS, clear_multiproc_dir, process_uptime
 
 
-def main():
+def create_app() -> FastAPI:
+    """
+    App factory, called once per worker process, e.g. by uvicorn --factory or gunicorn's UvicornWorker.
+    Opens no connections, the database, JWKS and Kubernetes API are warmed up in the background once the app serves.
+    """
     # load env
     load_dotenv(find_dotenv())
 
     # load cluster config
     load_cluster_config()
 
-    # init database
-    database = Database()
-    FlameNextflowAPI(database=database, namespace=get_current_namespace())
+    # init database, the schema is migrated during warm-up
+    database = Database(migrate=False)
+    app = FlameNextflowAPI(database=database, namespace=get_current_namespace()).app
+    STARTUP_SECONDS.observe(process_uptime(), phase='app')
+    return app
+
+
+def migrate():
+    # for running the migrations ahead of the launcher, e.g. in an init container with DB_MIGRATE_ON_STARTUP=false
+    load_dotenv(find_dotenv())
+    Database(migrate=False).migrate()
+    print("Database schema is up to date")
+
+
+def main():
+    # metrics of the workers of a previous start would be summed with those of the new ones
+    clear_multiproc_dir()
+    uvicorn.run("src.main:create_app", factory=True, host="0.0.0.0", port=8000, workers=WORKERS)
 
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:] == ['migrate']:
+        migrate()
+    else:
+        main()
@@ -1,25 +1,28 @@
-from httpx import Client, HTTPStatusError
+from typing import Optional
 
-from src.k8s.utils import find_k8s_resources, get_current_namespace
+from httpx import HTTPStatusError
+
+from src.api.concurrency import run_k8s
+from src.k8s.discovery import get_service_endpoints
+from src.resources.clients.http_pool import get_http_client
 
 
 class AnalysisClient:
-    def __init__(self, analysis_id: str) -> None:
-        analysis_nginx_client_base_url = find_k8s_resources('service',
-                                                            'label',
-                                                            f"component=flame-analysis-nginx",
-                                                            manual_name_selector=analysis_id,
-                                                            namespace=get_current_namespace())
-        if type(analysis_nginx_client_base_url) == list:
-            analysis_nginx_client_base_url = self._find_latest_url(analysis_nginx_client_base_url)
-
-        self.client = Client(base_url=f"http://{analysis_nginx_client_base_url}:80/analysis",
-                             follow_redirects=True)
-
-    def inform_analysis(self, result: dict) -> dict:
-        response = self.client.post(f"/nextflow",
-                                    json=result,
-                                    headers={"Content-Type": "application/json"})
+    def __init__(self, analysis_nginx_service: Optional[str]) -> None:
+        """
+        :param analysis_nginx_service: Name of the analysis' nginx Service, see create().
+        """
+        self.client = get_http_client(f"http://{analysis_nginx_service}:80/analysis")
+
+    @classmethod
+    async def create(cls, analysis_id: str) -> 'AnalysisClient':
+        # the Service lookup may list Services from the API server, so it runs off the event loop
+        return cls(await run_k8s(get_service_endpoints().analysis_nginx_service, analysis_id))
+
+    async def inform_analysis(self, result: dict) -> dict:
+        response = await self.client.post(f"/nextflow",
+                                          json=result,
+                                          headers={"Content-Type": "application/json"})
         try:
             response.raise_for_status()
         except HTTPStatusError as e:
@@ -27,11 +30,3 @@ class AnalysisClient:
 
         return response.json()
 
-    def _find_latest_url(self, urls: list[str]) -> str:
-        nginx_url = ""
-        latest_count = -1
-        for url in urls:
-            count = int(url.rsplit('-', 1)[-1])
-            if count > latest_count:
-                nginx_url = url
-        return nginx_url
@@ -0,0 +1,161 @@
+import os
+import time
+import random
+import asyncio
+from collections import OrderedDict
+from typing import Any, Optional
+
+import httpx
+
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+HTTP_POOL_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "30"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))
+# Number of base URLs (e.g. one nginx Service per analysis) kept pooled, least recently used ones are closed
+HTTP_POOL_MAX_CLIENTS = int(os.getenv("HTTP_POOL_MAX_CLIENTS", "64"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+class PoolStats:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.in_flight = 0
+        self.retries = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def observe_wait(self, seconds: float) -> None:
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, stats: PoolStats) -> None:
+        self._stream = stream
+        self._stats = stats
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._stats.in_flight -= 1
+            await self._stream.aclose()
+
+
+class PooledTransport(httpx.AsyncBaseTransport):
+    """
+    Connection pool transport shared by all requests to one base URL. Retries idempotent requests with full jitter
+    backoff on transport errors and 502/503/504 responses, and measures how long requests wait for a pooled
+    connection (time until the first connection event of the request).
+    """
+    def __init__(self, stats: PoolStats) -> None:
+        self.stats = stats
+        self._transport = httpx.AsyncHTTPTransport(http2=_http2_available(),
+                                                   limits=httpx.Limits(max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                                                                       max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+                                                                       keepalive_expiry=HTTP_POOL_KEEPALIVE_EXPIRY),
+                                                   retries=1)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempts = HTTP_RETRIES + 1 if request.method in IDEMPOTENT_METHODS else 1
+        for attempt in range(1, attempts + 1):
+            start = time.perf_counter()
+            waited = False
+
+            async def trace(name: str, info: dict[str, Any]) -> None:
+                nonlocal waited
+                if not waited and name.endswith('.started'):
+                    waited = True
+                    self.stats.observe_wait(time.perf_counter() - start)
+            request.extensions = {**request.extensions, 'trace': trace}
+
+            self.stats.requests += 1
+            self.stats.in_flight += 1
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError:
+                self.stats.in_flight -= 1
+                if attempt == attempts:
+                    raise
+            else:
+                if (response.status_code not in RETRY_STATUS_CODES) or (attempt == attempts):
+                    return httpx.Response(status_code=response.status_code,
+                                          headers=response.headers,
+                                          stream=_TrackedStream(response.stream, self.stats),
+                                          extensions=response.extensions)
+                self.stats.in_flight -= 1
+                await response.aclose()
+            self.stats.retries += 1
+            await asyncio.sleep(random.uniform(0, HTTP_RETRY_BACKOFF * 2 ** (attempt - 1)))
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+    def connection_counts(self) -> dict[str, int]:
+        connections = getattr(self._transport._pool, 'connections', [])
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {'connections': len(connections), 'idle': idle, 'active': len(connections) - idle}
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("Warning: HTTP2_ENABLED is set but h2 is not installed, falling back to HTTP/1.1")
+        return False
+
+
+_clients: OrderedDict[str, httpx.AsyncClient] = OrderedDict()
+
+
+def get_http_client(base_url: str) -> httpx.AsyncClient:
+    client = _clients.get(base_url)
+    if client is not None:
+        _clients.move_to_end(base_url)
+    else:
+        client = httpx.AsyncClient(base_url=base_url,
+                                   transport=PooledTransport(PoolStats()),
+                                   timeout=httpx.Timeout(HTTP_TIMEOUT,
+                                                         connect=HTTP_CONNECT_TIMEOUT,
+                                                         pool=HTTP_POOL_TIMEOUT),
+                                   follow_redirects=True)
+        _clients[base_url] = client
+        while len(_clients) > HTTP_POOL_MAX_CLIENTS:
+            _, evicted = _clients.popitem(last=False)
+            asyncio.create_task(_close_when_idle(evicted))
+    return client
+
+
+async def _close_when_idle(client: httpx.AsyncClient) -> None:
+    while client._transport.stats.in_flight > 0:
+        await asyncio.sleep(1)
+    await client.aclose()
+
+
+def http_pool_stats() -> dict[str, dict[str, Any]]:
+    stats = {}
+    for base_url, client in _clients.items():
+        transport: PooledTransport = client._transport
+        stats[base_url] = {**vars(transport.stats), **transport.connection_counts()}
+    return stats
+
+
+async def close_http_clients(base_url: Optional[str] = None) -> None:
+    for url in [base_url] if base_url is not None else list(_clients):
+        client = _clients.pop(url, None)
+        if client is not None:
+            await client.aclose()
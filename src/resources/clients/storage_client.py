@@ -1,42 +1,53 @@
-from httpx import Client, HTTPStatusError
+from httpx import HTTPStatusError, Response
 import uuid
 from datetime import datetime
-from typing import Any
-from io import BytesIO
-import pickle
+from typing import AsyncContextManager, AsyncIterator, Optional
 
-from src.k8s.utils import find_k8s_resources, get_current_namespace
+from src.api.concurrency import run_k8s
+from src.k8s.discovery import get_service_endpoints
+from src.resources.clients.http_pool import get_http_client
 
 
 class StorageClient:
-    def __init__(self, keycloak_token: str) -> None:
+    def __init__(self, keycloak_token: str, result_service: Optional[str]) -> None:
+        """
+        :param result_service: Name of the result service's Service, see create().
+        """
         self.keycloak_token = keycloak_token
-        self.result_client_base_url = find_k8s_resources('service',
-                                                         'label',
-                                                         'component=flame-result-service',
-                                                         namespace=get_current_namespace())
-        self.client = Client(base_url=f"http://{self.result_client_base_url}:8080/storage",
-                             headers={"Authorization": f"Bearer {keycloak_token}"},
-                             follow_redirects=True)
-
-    def retrieve_data(self, storage_id: str) -> Any:
-        response = self.client.get(f"/local/{storage_id}")
-        try:
-            response.raise_for_status()
-            return pickle.loads(BytesIO(response.content).read())
-        except HTTPStatusError as e:
-            print("HTTP Error in result client during download:", repr(e))
+        self.result_client_base_url = result_service
+        self.client = get_http_client(f"http://{self.result_client_base_url}:8080/storage")
+        self.headers = {"Authorization": f"Bearer {keycloak_token}"}
+
+    @classmethod
+    async def create(cls, keycloak_token: str) -> 'StorageClient':
+        # the Service lookup may list Services from the API server, so it runs off the event loop
+        return cls(keycloak_token, await run_k8s(get_service_endpoints().result_service))
 
-    def push_result(self, result: BytesIO) -> str:
+    def stream_data(self, storage_id: str, offset: int = 0) -> AsyncContextManager[Response]:
+        headers = {**self.headers, "Range": f"bytes={offset}-"} if offset else self.headers
+        return self.client.stream("GET", f"/local/{storage_id}", headers=headers)
+
+    async def push_result(self, result: AsyncIterator[bytes], extension: str = "") -> str:
         request_path = "/local/"
-        response = self.client.put(request_path,
-                                   files={
-                                       "file": (f"result_{str(uuid.uuid4())[:4]}_{datetime.now().strftime('%y%m%d%H%M%S')}",
-                                                result)},
-                                   headers=[('Connection', 'close')])
+        boundary = uuid.uuid4().hex
+        filename = f"result_{str(uuid.uuid4())[:4]}_{datetime.now().strftime('%y%m%d%H%M%S')}{extension}"
+        response = await self.client.put(request_path,
+                                         content=_multipart_file_body(boundary, filename, result),
+                                         headers={**self.headers,
+                                                  "Content-Type": f"multipart/form-data; boundary={boundary}"})
         try:
             response.raise_for_status()
         except HTTPStatusError as e:
             print("HTTP Error in result client during upload:", repr(e))
 
         return response.json()['id']
+
+
+async def _multipart_file_body(boundary: str, filename: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # Single-part multipart/form-data body, sent with chunked transfer encoding so it never has to be held in memory
+    yield (f'--{boundary}\r\n'
+           f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+           f'Content-Type: application/octet-stream\r\n\r\n').encode()
+    async for chunk in chunks:
+        yield chunk
+    yield f'\r\n--{boundary}--\r\n'.encode()
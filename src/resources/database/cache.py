@@ -0,0 +1,101 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from .db_models import NextflowRunDB
+
+RUN_CACHE_SIZE = int(os.getenv("RUN_CACHE_SIZE", "4096"))
+
+
+class RunCache:
+    """
+    Bounded LRU of NextflowRunDB rows keyed by run_id, with a secondary index by analysis_id.
+    An analysis is only answered from the cache while it is complete, i.e. all of its rows were loaded from the
+    database and none of them has been evicted or invalidated since.
+    """
+    def __init__(self, max_size: int = RUN_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._runs: OrderedDict[str, NextflowRunDB] = OrderedDict()
+        self._by_analysis: dict[str, set[str]] = {}
+        self._complete_analyses: set[str] = set()
+        self._lock = threading.RLock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, run_id: str) -> Optional[NextflowRunDB]:
+        with self._lock:
+            nf_run = self._runs.get(run_id)
+            if nf_run is None:
+                self.stats['misses'] += 1
+                return None
+            self._runs.move_to_end(run_id)
+            self.stats['hits'] += 1
+            return nf_run
+
+    def get_by_analysis_id(self, analysis_id: str) -> Optional[list[NextflowRunDB]]:
+        with self._lock:
+            if analysis_id not in self._complete_analyses:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            return [self._runs[run_id] for run_id in self._by_analysis.get(analysis_id, set())]
+
+    def put(self, nf_run: NextflowRunDB) -> None:
+        with self._lock:
+            self._runs[nf_run.run_id] = nf_run
+            self._runs.move_to_end(nf_run.run_id)
+            self._by_analysis.setdefault(nf_run.analysis_id, set()).add(nf_run.run_id)
+            while len(self._runs) > self.max_size:
+                _, evicted = self._runs.popitem(last=False)
+                self._unindex(evicted)
+                self._complete_analyses.discard(evicted.analysis_id)
+                self.stats['evictions'] += 1
+
+    def put_analysis(self, analysis_id: str, nf_runs: list[NextflowRunDB]) -> None:
+        with self._lock:
+            for nf_run in nf_runs:
+                self.put(nf_run)
+            if all(nf_run.run_id in self._runs for nf_run in nf_runs):
+                self._complete_analyses.add(analysis_id)
+
+    def update(self, run_id: str, **fields) -> None:
+        with self._lock:
+            nf_run = self._runs.get(run_id)
+            if nf_run is not None:
+                for name, value in fields.items():
+                    setattr(nf_run, name, value)
+
+    def invalidate(self, run_id: str) -> None:
+        # row changed elsewhere, it has to be reloaded and so does its analysis
+        with self._lock:
+            nf_run = self._runs.pop(run_id, None)
+            if nf_run is not None:
+                self._complete_analyses.discard(nf_run.analysis_id)
+                self._unindex(nf_run)
+
+    def remove(self, run_id: str) -> None:
+        # row deleted from the database, its analysis stays complete
+        with self._lock:
+            nf_run = self._runs.pop(run_id, None)
+            if nf_run is not None:
+                self._unindex(nf_run)
+
+    def invalidate_analysis(self, analysis_id: str) -> None:
+        with self._lock:
+            self._complete_analyses.discard(analysis_id)
+            for run_id in list(self._by_analysis.get(analysis_id, set())):
+                self.invalidate(run_id)
+            self._by_analysis.pop(analysis_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._runs.clear()
+            self._by_analysis.clear()
+            self._complete_analyses.clear()
+
+    def _unindex(self, nf_run: NextflowRunDB) -> None:
+        run_ids = self._by_analysis.get(nf_run.analysis_id)
+        if run_ids is not None:
+            run_ids.discard(nf_run.run_id)
+            if not run_ids and nf_run.analysis_id not in self._complete_analyses:
+                del self._by_analysis[nf_run.analysis_id]
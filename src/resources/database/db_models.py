@@ -1,5 +1,5 @@
 from typing import Any
-from sqlalchemy import JSON, Column, Integer, String, Float
+from sqlalchemy import JSON, BigInteger, Column, Integer, String, Float
 from sqlalchemy.ext.declarative import as_declarative, declared_attr
 
 
@@ -14,6 +14,21 @@ class Base:
         return cls.__name__.lower()
 
 
+class RunStatus:
+    QUEUED = 'queued'
+    STARTING = 'starting'
+    RUNNING = 'running'
+    # claimed by the launcher process uploading its result and informing the analysis
+    CONCLUDING = 'concluding'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STOPPED = 'stopped'
+
+    ACTIVE = (STARTING, RUNNING, CONCLUDING)
+    CONCLUDABLE = (STARTING, RUNNING)
+    FINISHED = (SUCCEEDED, FAILED, STOPPED)
+
+
 class NextflowRunDB(Base):
     __tablename__ = "nextflow_runs"
     id = Column(Integer, primary_key=True, index=True)
@@ -21,3 +36,44 @@ class NextflowRunDB(Base):
     analysis_id = Column(String, unique=False, index=True)
     keycloak_token =  Column(String, unique=False, nullable=True)
     time_created = Column(Float, nullable=True)
+    status = Column(String, index=True, nullable=True)
+    pipeline_name = Column(String, nullable=True)
+    run_args = Column(JSON, nullable=True)
+    input_location = Column(String, nullable=True)
+    input_checksum = Column(String, nullable=True)
+    resources = Column(JSON, nullable=True)
+    time_started = Column(Float, nullable=True)
+    time_container_started = Column(Float, nullable=True)
+    time_first_task = Column(Float, nullable=True)
+    # set when the run reached a finished status
+    time_finished = Column(Float, nullable=True)
+    executor = Column(String, nullable=True)
+    # Hash of the client supplied key and the analysis_id, unique for good
+    idempotency_key = Column(String, unique=True, index=True, nullable=True)
+    # Hash of what the run computes, kept to tell retries from reuses of an idempotency key
+    payload_hash = Column(String, nullable=True)
+    # Hash of what the run computes, unique while the run is queued or active and cleared once it finished
+    dedup_hash = Column(String, unique=True, index=True, nullable=True)
+    # Launcher process that moved the run to 'starting' or 'concluding', and when
+    claimed_by = Column(String, nullable=True)
+    time_claimed = Column(Float, nullable=True)
+
+
+class NextflowTaskDB(Base):
+    # One row per finished Nextflow task, times in milliseconds and sizes in bytes as reported by the trace
+    __tablename__ = "nextflow_tasks"
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(String, index=True)
+    pipeline_name = Column(String, index=True, nullable=True)
+    process = Column(String, nullable=True)
+    task_id = Column(Integer, nullable=True)
+    status = Column(String, nullable=True)
+    exit = Column(Integer, nullable=True)
+    cpus = Column(Float, nullable=True)
+    memory = Column(BigInteger, nullable=True)
+    realtime = Column(BigInteger, nullable=True)
+    pct_cpu = Column(Float, nullable=True)
+    peak_rss = Column(BigInteger, nullable=True)
+    rchar = Column(BigInteger, nullable=True)
+    wchar = Column(BigInteger, nullable=True)
+    time_completed = Column(Float, nullable=True)
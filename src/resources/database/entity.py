@@ -1,65 +1,375 @@
 import os
+import json
+import time
+import uuid
+import select
+import threading
+from typing import Any, Callable, Optional
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import psycopg2
+import psycopg2.extensions
+from sqlalchemy import create_engine, delete, func, insert, inspect, or_, text, update
+from sqlalchemy.orm import Session, sessionmaker
 
-from .db_models import Base, NextflowRunDB
+from src.k8s.leader import LEADER_ELECTION_ENABLED, WORKERS
+from .cache import RunCache
+from .db_models import Base, NextflowRunDB, NextflowTaskDB, RunStatus
+
+# Keep the run caches of several launcher replicas coherent through Postgres LISTEN/NOTIFY. Always on as soon as
+# several processes serve the launcher, their caches would serve each other's stale runs otherwise.
+RUN_CACHE_NOTIFY = (os.getenv("RUN_CACHE_NOTIFY", "false").lower() == "true") or (WORKERS > 1) \
+    or LEADER_ELECTION_ENABLED
+RUN_CACHE_CHANNEL = "nextflow_runs"
+# Create and migrate the schema in the background after startup, disable when migrations run before the launcher
+# starts (python -m src.main migrate, e.g. in an init container)
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "true").lower() == "true"
 
 
 class Database:
-    def __init__(self) -> None:
-        host = os.getenv('POSTGRES_HOST')
-        port = "5432"
-        user = os.getenv('POSTGRES_USER')
-        password = os.getenv('POSTGRES_PASSWORD')
-        database = os.getenv('POSTGRES_DB')
-        conn_uri = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}"
+    def __init__(self, conn_uri: Optional[str] = None, migrate: bool = True) -> None:
+        """
+        :param migrate: Create and migrate the schema and start the run cache listener right away. Without it, no
+                        connection is opened until first use, migrate() has to be called before the tables are used
+                        and start_listener() once the database is reachable.
+        """
+        if conn_uri is None:
+            host = os.getenv('POSTGRES_HOST')
+            port = "5432"
+            user = os.getenv('POSTGRES_USER')
+            password = os.getenv('POSTGRES_PASSWORD')
+            database = os.getenv('POSTGRES_DB')
+            conn_uri = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}"
         self.engine = create_engine(conn_uri,
                                     pool_pre_ping=True,
                                     pool_recycle=3600)
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-        Base.metadata.create_all(bind=self.engine)
+        self.migrated = False
+        if migrate:
+            self.migrate()
+
+        self.run_cache = RunCache()
+        self.instance_id = str(uuid.uuid4())
+        self.notify = RUN_CACHE_NOTIFY and (self.engine.dialect.name == 'postgresql')
+        # called with every change notified by another launcher process, from the listener thread
+        self.listeners: list[Callable[[dict[str, Any]], None]] = []
+        self._stop_event = threading.Event()
+        self._listener: Optional[threading.Thread] = None
+        if migrate:
+            self.start_listener()
 
     def reset_db(self) -> None:
         Base.metadata.drop_all(bind=self.engine)
         Base.metadata.create_all(bind=self.engine)
+        self.run_cache.clear()
+
+    def migrate(self) -> None:
+        Base.metadata.create_all(bind=self.engine)
+        self._migrate()
+        self.migrated = True
+
+    def start_listener(self) -> None:
+        # keeps a connection of its own open with RUN_CACHE_NOTIFY
+        if self.notify and (self._listener is None):
+            self._listener = threading.Thread(target=self._listen, name="run-cache-listener", daemon=True)
+            self._listener.start()
+
+    def ping(self) -> None:
+        # also leaves an open connection in the pool
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    def _migrate(self) -> None:
+        # create_all does not alter existing tables, add columns introduced after the table was created
+        existing = {column['name'] for column in inspect(self.engine).get_columns(NextflowRunDB.__tablename__)}
+        with self.engine.begin() as connection:
+            for column in NextflowRunDB.__table__.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=self.engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {NextflowRunDB.__tablename__} "
+                                            f"ADD COLUMN {column.name} {column_type}"))
+            for index in NextflowRunDB.__table__.indexes:
+                index.create(bind=connection, checkfirst=True)
 
     def create_nf_run(self,
                       run_id: str,
                       analysis_id: str,
                       keycloak_token: str,
-                      time_created: float) -> NextflowRunDB:
+                      time_created: float,
+                      pipeline_name: Optional[str] = None,
+                      run_args: Optional[list[str]] = None,
+                      input_location: Optional[str] = None,
+                      input_checksum: Optional[str] = None,
+                      resources: Optional[dict[str, Optional[str]]] = None,
+                      executor: Optional[str] = None,
+                      idempotency_key: Optional[str] = None,
+                      dedup_hash: Optional[str] = None,
+                      payload_hash: Optional[str] = None,
+                      status: str = RunStatus.QUEUED) -> NextflowRunDB:
+        """
+        :raises IntegrityError: If a run with the idempotency_key, or an unfinished run with the dedup_hash, exists.
+        """
         nf_run = NextflowRunDB(run_id=run_id,
                                analysis_id=analysis_id,
                                keycloak_token=keycloak_token,
-                               time_created=time_created)
+                               time_created=time_created,
+                               pipeline_name=pipeline_name,
+                               run_args=run_args,
+                               input_location=input_location,
+                               input_checksum=input_checksum,
+                               resources=resources,
+                               executor=executor,
+                               idempotency_key=idempotency_key,
+                               dedup_hash=dedup_hash,
+                               payload_hash=payload_hash,
+                               status=status)
         with self.SessionLocal() as session:
             session.add(nf_run)
+            self._notify(session, 'insert', analysis_id, run_id)
             session.commit()
             session.refresh(nf_run)
+        self.run_cache.put(nf_run)
         return nf_run
 
+    def create_nf_runs(self, nf_runs: list[dict[str, Any]]) -> list[NextflowRunDB]:
+        """
+        Inserts several runs in a single transaction.
+        :param nf_runs: Column values of each run, runs without a status are queued.
+        """
+        rows = [NextflowRunDB(**{'status': RunStatus.QUEUED, **nf_run}) for nf_run in nf_runs]
+        with self.SessionLocal(expire_on_commit=False) as session:
+            session.add_all(rows)
+            for analysis_id in {row.analysis_id for row in rows}:
+                self._notify(session, 'insert', analysis_id)
+            session.commit()
+        for row in rows:
+            self.run_cache.put(row)
+        return rows
+
+    def get_duplicate_nf_runs(self, idempotency_keys: list[str], dedup_hashes: list[str]) -> list[NextflowRunDB]:
+        # served by the unique indexes of both columns
+        with self.SessionLocal() as session:
+            return (session.query(NextflowRunDB)
+                    .filter(or_(NextflowRunDB.idempotency_key.in_(idempotency_keys),
+                                NextflowRunDB.dedup_hash.in_(dedup_hashes)))
+                    .all())
+
     def get_nf_runs(self) -> list[NextflowRunDB]:
-        with self.SessionLocal as session:
+        with self.SessionLocal() as session:
             return session.query(NextflowRunDB).all()
 
     def get_nf_runs_by_analysis_id(self, analysis_id: str) -> list[NextflowRunDB]:
-        with self.SessionLocal as session:
-            return session.query(NextflowRunDB).filter_by(**{"analysis_id": analysis_id}).all()
+        nf_runs = self.run_cache.get_by_analysis_id(analysis_id)
+        if nf_runs is None:
+            with self.SessionLocal() as session:
+                nf_runs = session.query(NextflowRunDB).filter_by(**{"analysis_id": analysis_id}).all()
+            self.run_cache.put_analysis(analysis_id, nf_runs)
+        return nf_runs
 
     def get_nf_run_by_run_id(self, run_id: str) -> NextflowRunDB:
-        with self.SessionLocal as session:
-            return session.query(NextflowRunDB).filter_by(**{"run_id": run_id}).first()
+        nf_run = self.run_cache.get(run_id)
+        if nf_run is None:
+            with self.SessionLocal() as session:
+                nf_run = session.query(NextflowRunDB).filter_by(**{"run_id": run_id}).first()
+            if nf_run is not None:
+                self.run_cache.put(nf_run)
+        return nf_run
+
+    def get_queued_nf_runs(self) -> list[NextflowRunDB]:
+        with self.SessionLocal() as session:
+            return (session.query(NextflowRunDB)
+                    .filter(NextflowRunDB.status == RunStatus.QUEUED)
+                    .order_by(NextflowRunDB.time_created, NextflowRunDB.id)
+                    .all())
+
+    def get_nf_runs_by_status(self, statuses: tuple[str, ...]) -> list[NextflowRunDB]:
+        with self.SessionLocal() as session:
+            return session.query(NextflowRunDB).filter(NextflowRunDB.status.in_(statuses)).all()
+
+    def get_queue_position(self, run_id: str) -> Optional[int]:
+        nf_run = self.get_nf_run_by_run_id(run_id)
+        if (nf_run is None) or (nf_run.status != RunStatus.QUEUED):
+            return None
+        with self.SessionLocal() as session:
+            return (session.query(func.count(NextflowRunDB.id))
+                    .filter(NextflowRunDB.status == RunStatus.QUEUED,
+                            NextflowRunDB.time_created < nf_run.time_created)
+                    .scalar())
+
+    def get_queue_positions(self, run_ids: list[str]) -> dict[str, Optional[int]]:
+        with self.SessionLocal() as session:
+            queued = (session.query(NextflowRunDB.run_id)
+                      .filter(NextflowRunDB.status == RunStatus.QUEUED)
+                      .order_by(NextflowRunDB.time_created, NextflowRunDB.id)
+                      .all())
+        positions = {run_id: position for position, (run_id,) in enumerate(queued)}
+        return {run_id: positions.get(run_id) for run_id in run_ids}
+
+    def count_nf_runs_by_status(self) -> dict[Optional[str], int]:
+        with self.SessionLocal() as session:
+            return dict(session.query(NextflowRunDB.status, func.count(NextflowRunDB.id))
+                        .group_by(NextflowRunDB.status)
+                        .all())
+
+    def count_active_nf_runs(self) -> dict[str, int]:
+        with self.SessionLocal() as session:
+            return dict(session.query(NextflowRunDB.analysis_id, func.count(NextflowRunDB.id))
+                        .filter(NextflowRunDB.status.in_(RunStatus.ACTIVE))
+                        .group_by(NextflowRunDB.analysis_id)
+                        .all())
+
+    def update_nf_run_status(self,
+                             run_id: str,
+                             status: str,
+                             expected_status: Optional[tuple[str, ...]] = None,
+                             expected_claimed_by: Optional[str] = None,
+                             **fields) -> bool:
+        """
+        Sets the status (and further columns) of a run.
+        :param expected_status: Only update if the run currently has one of these statuses, used to claim runs.
+        :param expected_claimed_by: Only update if the run is claimed by this launcher process or scheduler.
+        :return: False if the run does not exist or did not have an expected status or claim.
+        """
+        if status in RunStatus.FINISHED:
+            # identical runs may be submitted again
+            fields['dedup_hash'] = None
+            fields.setdefault('time_finished', time.time())
+        statement = update(NextflowRunDB).where(NextflowRunDB.run_id == run_id).values(status=status, **fields)
+        if expected_status is not None:
+            statement = statement.where(NextflowRunDB.status.in_(expected_status))
+        if expected_claimed_by is not None:
+            statement = statement.where(NextflowRunDB.claimed_by == expected_claimed_by)
+        with self.SessionLocal() as session:
+            updated = session.execute(statement).rowcount == 1
+            if updated:
+                analysis_id = session.query(NextflowRunDB.analysis_id).filter_by(**{"run_id": run_id}).scalar()
+                self._notify(session, 'update', analysis_id, run_id)
+            session.commit()
+        if updated:
+            self.run_cache.update(run_id, status=status, **fields)
+        else:
+            self.run_cache.invalidate(run_id)
+        return updated
+
+    def renew_nf_run_claims(self, claimed_by: str) -> None:
+        # heartbeat of a scheduler that is still launching the runs it claimed
+        with self.SessionLocal() as session:
+            session.execute(update(NextflowRunDB)
+                            .where(NextflowRunDB.status == RunStatus.STARTING,
+                                   NextflowRunDB.claimed_by == claimed_by)
+                            .values(time_claimed=time.time()))
+            session.commit()
+
+    def requeue_starting_nf_runs(self, claimed_before: float) -> int:
+        """
+        Requeues runs claimed by a scheduler that went away before their Job was created, i.e. that did not renew
+        its claims since claimed_before. Runs claimed before claims were recorded count as expired.
+        """
+        with self.SessionLocal() as session:
+            requeued = session.execute(update(NextflowRunDB)
+                                       .where(NextflowRunDB.status == RunStatus.STARTING,
+                                              or_(NextflowRunDB.time_claimed.is_(None),
+                                                  NextflowRunDB.time_claimed < claimed_before))
+                                       .values(status=RunStatus.QUEUED, claimed_by=None, time_claimed=None)).rowcount
+            session.commit()
+        if requeued:
+            self.run_cache.clear()
+        return requeued
+
+    def create_nf_tasks(self, nf_tasks: list[dict[str, Any]]) -> None:
+        # executemany of a single INSERT, the weblog buffer hands over hundreds of tasks at once
+        if not nf_tasks:
+            return
+        with self.SessionLocal() as session:
+            session.execute(insert(NextflowTaskDB), nf_tasks)
+            session.commit()
+
+    def get_nf_tasks_by_pipeline(self, pipeline_name: str, limit: int) -> list[NextflowTaskDB]:
+        with self.SessionLocal() as session:
+            return (session.query(NextflowTaskDB)
+                    .filter(NextflowTaskDB.pipeline_name == pipeline_name)
+                    .order_by(NextflowTaskDB.id.desc())
+                    .limit(limit)
+                    .all())
 
     def delete_nf_run(self, run_id: str) -> None:
-        with self.SessionLocal as session:
+        with self.SessionLocal() as session:
             run = session.query(NextflowRunDB).filter_by(**{"run_id": run_id}).one()
             session.delete(run)
+            self._notify(session, 'delete', run.analysis_id, run_id)
+            session.commit()
+        self.run_cache.remove(run_id)
+
+    def delete_nf_runs(self, run_ids: list[str]) -> list[str]:
+        with self.SessionLocal() as session:
+            deleted = session.execute(delete(NextflowRunDB)
+                                      .where(NextflowRunDB.run_id.in_(run_ids))
+                                      .returning(NextflowRunDB.run_id, NextflowRunDB.analysis_id)).all()
+            for run_id, analysis_id in deleted:
+                self._notify(session, 'delete', analysis_id, run_id)
             session.commit()
+        for run_id, _ in deleted:
+            self.run_cache.remove(run_id)
+        return [run_id for run_id, _ in deleted]
+
+    def delete_all_analysis_nf_runs(self, analysis_id: str) -> list[str]:
+        with self.SessionLocal() as session:
+            run_ids = session.execute(delete(NextflowRunDB)
+                                      .where(NextflowRunDB.analysis_id == analysis_id)
+                                      .returning(NextflowRunDB.run_id)).scalars().all()
+            self._notify(session, 'delete_analysis', analysis_id)
+            session.commit()
+        for run_id in run_ids:
+            self.run_cache.remove(run_id)
+        return run_ids
+
+    def close(self) -> None:
+        self._stop_event.set()
+
+    def _notify(self, session: Session, operation: str, analysis_id: str, run_id: Optional[str] = None) -> None:
+        # sent on commit, so replicas never invalidate before the change is visible to them
+        if self.notify:
+            payload = json.dumps({'source': self.instance_id,
+                                  'operation': operation,
+                                  'analysis_id': analysis_id,
+                                  'run_id': run_id})
+            session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                            {'channel': RUN_CACHE_CHANNEL, 'payload': payload})
+
+    def _on_notification(self, payload: str) -> None:
+        message = json.loads(payload)
+        if message['source'] == self.instance_id:
+            return
+        for listener in list(self.listeners):
+            listener(message)
+        if message['operation'] == 'delete':
+            self.run_cache.remove(message['run_id'])
+        elif message['operation'] == 'delete_analysis':
+            self.run_cache.invalidate_analysis(message['analysis_id'])
+        else:
+            self.run_cache.invalidate_analysis(message['analysis_id'])
+            if message['run_id'] is not None:
+                self.run_cache.invalidate(message['run_id'])
 
-    def delete_all_analysis_nf_runs(self, analysis_id: str):
-        with self.SessionLocal as session:
-            runs = session.query(NextflowRunDB).filter_by(**{"analysis_id": analysis_id}).all()
-            for run in runs:
-                session.delete(run)
-                session.commit()
+    def _listen(self) -> None:
+        dsn = self.engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+        while not self._stop_event.is_set():
+            try:
+                connection = psycopg2.connect(dsn)
+                connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {RUN_CACHE_CHANNEL};")
+                # notifications may have been missed while not listening
+                self.run_cache.clear()
+                try:
+                    while not self._stop_event.is_set():
+                        if select.select([connection], [], [], 5) == ([], [], []):
+                            continue
+                        connection.poll()
+                        while connection.notifies:
+                            self._on_notification(connection.notifies.pop(0).payload)
+                finally:
+                    connection.close()
+            except (psycopg2.Error, OSError) as e:
+                print(f"Error: Run cache listener lost its database connection: {repr(e)}")
+                self.run_cache.clear()
+                self._stop_event.wait(5)
@@ -1,18 +1,35 @@
 import os
+import json
 import uuid
 import time
-from typing import Optional
+import asyncio
+import hashlib
+from typing import Any, Optional
 
 from fastapi import HTTPException
+from kubernetes.client.exceptions import ApiException
 from pydantic import BaseModel
-from io import BytesIO
+from sqlalchemy.exc import IntegrityError
 
+from src.api.concurrency import run_blocking, run_k8s
+from src.api.metrics import RUN_STAGE_SECONDS, run_stage
 from src.resources.clients.analysis_client import AnalysisClient
 from src.resources.clients.storage_client import StorageClient
+from src.resources.database.db_models import NextflowRunDB, RunStatus
 from src.resources.database.entity import Database
-from src.k8s.kubernetes import create_nextflow_run
+from src.resources.nextflow_run.results import stream_result, result_extension, remove_result
+from src.resources.nextflow_run.staging import get_local_run_dir, stage_input
+from src.resources.nextflow_run.work_cache import (NF_CACHE_ENABLED, assets_key, touch_work_cache,
+                                                   work_cache_key)
+from src.k8s.executor import (EXECUTORS, NF_EXECUTOR, delete_analysis_task_pods, delete_run_task_pods,
+                              k8s_executor_config)
+from src.k8s.kubernetes import (RUN_VOLUME_MODE, create_nextflow_run, delete_analysis_nextflow_runs,
+                                delete_analysis_run_pvcs, delete_nextflow_run, get_run_pvc_name)
 from src.k8s.utils import get_current_namespace, delete_k8s_resource
 
+# Submissions identical to a queued or active run return that run instead of starting another
+NF_RUN_DEDUP = os.getenv("NF_RUN_DEDUP", "true").lower() == "true"
+
 
 class NextflowRunEntity:
     def __init__(self,
@@ -21,21 +38,49 @@ class NextflowRunEntity:
                  pipeline_name: Optional[str] = None,
                  run_args: Optional[list[str]] = None,
                  run_id: Optional[str] = None,
-                 time_created: Optional[float] = None) -> None:
+                 time_created: Optional[float] = None,
+                 input_location: Optional[str] = None,
+                 input_checksum: Optional[str] = None,
+                 resources: Optional[dict[str, Optional[str]]] = None,
+                 status: Optional[str] = None,
+                 time_started: Optional[float] = None,
+                 executor: Optional[str] = None,
+                 idempotency_key: Optional[str] = None) -> None:
         self.analysis_id = analysis_id
         self.pipeline_name = pipeline_name
         self.run_args = run_args
+        self.input_location = input_location
+        self.input_checksum = input_checksum
+        self.resources = resources
+        self.status = status
+        self.time_started = time_started
+        self.executor = executor or NF_EXECUTOR
+        self.idempotency_key = idempotency_key
         self.keycloak_token = keycloak_token
         self.run_id = f"nf-run-{str(uuid.uuid4())}" if run_id is None else run_id
         self.time_created: float = time.time() if time_created is None else time_created
 
     @classmethod
-    def from_database(cls, run_id: str, database: Database) -> 'NextflowRunEntity':
-        nf_run = database.get_nf_run_by_run_id(run_id)
+    async def from_database(cls, run_id: str, database: Database) -> 'NextflowRunEntity':
+        nf_run = await run_blocking(database.get_nf_run_by_run_id, run_id)
+        if nf_run is None:
+            raise HTTPException(status_code=404, detail=f"Nextflow run with id={run_id} not found.")
+        return cls.from_row(nf_run)
+
+    @classmethod
+    def from_row(cls, nf_run: NextflowRunDB) -> 'NextflowRunEntity':
         return cls(analysis_id=nf_run.analysis_id,
                    keycloak_token=nf_run.keycloak_token,
+                   pipeline_name=nf_run.pipeline_name,
+                   run_args=nf_run.run_args,
                    run_id=nf_run.run_id,
-                   time_created=nf_run.time_created)
+                   time_created=nf_run.time_created,
+                   input_location=nf_run.input_location,
+                   input_checksum=nf_run.input_checksum,
+                   resources=nf_run.resources,
+                   status=nf_run.status,
+                   time_started=nf_run.time_started,
+                   executor=nf_run.executor)
 
     def __str__(self) -> str:
         return (f"NextflowRunEntity("
@@ -44,52 +89,262 @@ class NextflowRunEntity:
                 f"run_args={self.run_args}, "
                 f"run_id={self.run_id})")
 
-    def start(self, database: Database, input_location: str) -> dict[str, str]:
-        if None not in [self.pipeline_name, self.run_args]:
-            database.create_nf_run(self.run_id,
-                                   self.analysis_id,
-                                   self.keycloak_token,
-                                   self.time_created)
-            # Retrieve and delete data from StorageClient [Step 3]
-            storage_client = StorageClient(self.keycloak_token)
-            input_data = storage_client.retrieve_data(input_location)
-
-            # Execute Nextflow run command using input- and output_location [Step 4]
-            try:
-                create_nextflow_run(input_data=input_data,
-                                    run_id=self.run_id,
-                                    pipeline_name=self.pipeline_name,
-                                    run_args=self.run_args,
-                                    namespace=get_current_namespace())
-                return {"status": "job submitted"}
-            except HTTPException as e:
-                error_message = f"Exception during nextflow run creation with {str(self)}: {e}"
-                print(error_message)
-                raise HTTPException(status_code=500, detail=error_message)
-        else:
+    @property
+    def work_cache_key(self) -> str:
+        return work_cache_key(self.analysis_id, self.pipeline_name, self.run_args)
+
+    @property
+    def payload_hash(self) -> str:
+        payload = json.dumps([self.analysis_id, self.pipeline_name, self.run_args, self.input_location])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @property
+    def dedup_hash(self) -> Optional[str]:
+        return self.payload_hash if NF_RUN_DEDUP else None
+
+    @property
+    def scoped_idempotency_key(self) -> Optional[str]:
+        # keys are chosen by clients, the same key of another analysis is another run
+        if self.idempotency_key is None:
+            return None
+        return hashlib.sha256(json.dumps([self.analysis_id, self.idempotency_key]).encode()).hexdigest()
+
+    def _check_idempotency_key(self, nf_run: NextflowRunDB) -> None:
+        if ((self.idempotency_key is not None) and (nf_run.idempotency_key == self.scoped_idempotency_key)
+                and (nf_run.payload_hash is not None) and (nf_run.payload_hash != self.payload_hash)):
+            raise HTTPException(status_code=422,
+                                detail=f"Idempotency key {self.idempotency_key} was already used for run "
+                                       f"{nf_run.run_id} of analysis_id={self.analysis_id} with a different payload.")
+
+    def validate(self) -> None:
+        if None in [self.pipeline_name, self.run_args, self.input_location]:
             raise HTTPException(status_code=500,
-                                detail=f"Exception during start() function in {str(self)}: "
-                                       f"Missing value for pipeline_name and/or run_args")
+                                detail=f"Exception during submit() function in {str(self)}: "
+                                       f"Missing value for pipeline_name, run_args and/or input_location")
+        if self.executor not in EXECUTORS:
+            raise HTTPException(status_code=400,
+                                detail=f"Unknown executor {self.executor} in {str(self)}, "
+                                       f"must be one of {', '.join(EXECUTORS)}")
+
+    def _row(self) -> dict[str, Any]:
+        return {'run_id': self.run_id,
+                'analysis_id': self.analysis_id,
+                'keycloak_token': self.keycloak_token,
+                'time_created': self.time_created,
+                'pipeline_name': self.pipeline_name,
+                'run_args': self.run_args,
+                'input_location': self.input_location,
+                'input_checksum': self.input_checksum,
+                'resources': self.resources,
+                'executor': self.executor,
+                'idempotency_key': self.scoped_idempotency_key,
+                'dedup_hash': self.dedup_hash,
+                'payload_hash': self.payload_hash,
+                'status': RunStatus.QUEUED}
+
+    async def submit(self, database: Database) -> Optional[NextflowRunDB]:
+        """
+        Queues the run, the RunScheduler launches it once a slot is free [Step 2].
+        :return: The existing run if this one is a duplicate by idempotency_key or dedup_hash, None if it was queued.
+        :raises HTTPException: 422 if the idempotency_key was used for a different run of the analysis.
+        """
+        self.validate()
+        try:
+            with run_stage('db_insert', self.run_id):
+                await run_blocking(database.create_nf_run, **self._row())
+        except IntegrityError:
+            # the unique indexes reject duplicates, the common case of a new run costs no extra lookup
+            duplicates = await run_blocking(database.get_duplicate_nf_runs,
+                                            [self.scoped_idempotency_key] if self.idempotency_key else [],
+                                            [self.dedup_hash] if self.dedup_hash else [])
+            if not duplicates:
+                raise
+            for duplicate in duplicates:
+                self._check_idempotency_key(duplicate)
+            return duplicates[0]
+        self.status = RunStatus.QUEUED
+        return None
+
+    @staticmethod
+    async def submit_all(database: Database,
+                         nf_runs: list['NextflowRunEntity']) -> tuple[dict[str, tuple[str, str]], dict[str, str]]:
+        """
+        Queues several validated runs in one transaction.
+        :return: (run_id, status) of the existing run for each duplicate, by run_id of the duplicate, and the reason
+                 for each run rejected for reusing an idempotency_key with a different payload, by its run_id.
+        """
+        keys = [nf_run.scoped_idempotency_key for nf_run in nf_runs if nf_run.idempotency_key]
+        hashes = [nf_run.dedup_hash for nf_run in nf_runs if nf_run.dedup_hash]
+        with RUN_STAGE_SECONDS.time(stage='db_insert_batch'):
+            existing = await run_blocking(database.get_duplicate_nf_runs, keys, hashes) if keys or hashes else []
+            known = {}
+            for nf_run in existing:
+                for value in [nf_run.idempotency_key, nf_run.dedup_hash]:
+                    if value:
+                        known[value] = nf_run
+            duplicates, rejected, new_runs = {}, {}, []
+            for nf_run in nf_runs:
+                match = next((known[value] for value in [nf_run.scoped_idempotency_key, nf_run.dedup_hash]
+                              if value and value in known), None)
+                if match is not None:
+                    try:
+                        nf_run._check_idempotency_key(match)
+                    except HTTPException as e:
+                        rejected[nf_run.run_id] = e.detail
+                        continue
+                    duplicates[nf_run.run_id] = (match.run_id, match.status)
+                    continue
+                # later runs of the batch identical to this one
+                row = NextflowRunDB(**nf_run._row())
+                for value in [row.idempotency_key, row.dedup_hash]:
+                    if value:
+                        known[value] = row
+                new_runs.append(nf_run)
+            try:
+                await run_blocking(database.create_nf_runs, [nf_run._row() for nf_run in new_runs])
+            except IntegrityError:
+                # a concurrent submission took one of the keys, queue the runs one by one instead
+                for nf_run in new_runs:
+                    try:
+                        duplicate = await nf_run.submit(database)
+                    except HTTPException as e:
+                        rejected[nf_run.run_id] = e.detail
+                        continue
+                    if duplicate is not None:
+                        duplicates[nf_run.run_id] = (duplicate.run_id, duplicate.status)
+        for nf_run in new_runs:
+            if (nf_run.run_id not in duplicates) and (nf_run.run_id not in rejected):
+                nf_run.status = RunStatus.QUEUED
+        return duplicates, rejected
 
-    def stop(self) -> None:
+    async def launch(self) -> None:
+        # Retrieve and delete data from StorageClient, streaming it onto the shared PVC [Step 3]
+        storage_client = await StorageClient.create(self.keycloak_token)
+        with run_stage('storage_download', self.run_id):
+            input_path = await stage_input(storage_client, self.input_location, self.run_id, self.input_checksum)
+
+        # Share pipeline assets between runs and resume from previous runs of the same analysis and pipeline
+        cache_keys = {}
+        if NF_CACHE_ENABLED:
+            cache_keys['assets_key'] = assets_key(self.pipeline_name, self.run_args)
+            if (RUN_VOLUME_MODE == 'shared') or (self.executor == 'k8s'):
+                cache_keys['work_cache_key'] = self.work_cache_key
+                await run_blocking(touch_work_cache, cache_keys['work_cache_key'])
+
+        # Execute Nextflow run command using input- and output_location [Step 4]
+        namespace = get_current_namespace()
+        executor_config = None
+        if self.executor == 'k8s':
+            executor_config = k8s_executor_config(self.run_id, self.analysis_id, namespace)
+        try:
+            with run_stage('job_create', self.run_id):
+                await run_k8s(create_nextflow_run,
+                                   input_path=input_path,
+                                   run_id=self.run_id,
+                                   analysis_id=self.analysis_id,
+                                   pipeline_name=self.pipeline_name,
+                                   run_args=self.run_args,
+                                   resources=self.resources,
+                                   executor_config=executor_config,
+                                   namespace=namespace,
+                                   **cache_keys)
+        except HTTPException as e:
+            error_message = f"Exception during nextflow run creation with {str(self)}: {e}"
+            print(error_message)
+            raise HTTPException(status_code=500, detail=error_message)
+
+    async def stop(self) -> None:
         # Stop Nextflow run, during cleanup [Step 10] or during manual interrupt
-        delete_k8s_resource(name=self.run_id, resource_type='job', namespace=get_current_namespace())
+        await NextflowRunEntity.delete_run_resources(self.run_id, self.executor)
+
+    @staticmethod
+    async def delete_run_resources(run_id: str,
+                                   executor: Optional[str] = None,
+                                   namespace: Optional[str] = None) -> None:
+        """
+        Deletes the Job of a run and what it leaves behind: the task pods of the k8s executor and the work dir PVC of
+        NF_RUN_VOLUME_MODE=pvc.
+        :param executor: Executor of the run, None if unknown (e.g. for a Job without a row) deletes both.
+        """
+        namespace = namespace or get_current_namespace()
+        await run_k8s(delete_k8s_resource,
+                           name=run_id,
+                           resource_type='job',
+                           namespace=namespace)
+        if executor in ('k8s', None):
+            await run_k8s(delete_run_task_pods, run_id, namespace)
+        if (executor != 'k8s') and (RUN_VOLUME_MODE == 'pvc'):
+            await run_k8s(delete_k8s_resource,
+                               name=get_run_pvc_name(run_id),
+                               resource_type='pvc',
+                               namespace=namespace)
 
-    def conclude(self, run_status: str, storage_location: str) -> None:
-        storage_client = StorageClient(self.keycloak_token)
-        analysis_client = AnalysisClient(self.analysis_id)
+    @staticmethod
+    async def stop_all(database: Database, analysis_id: str) -> dict[str, str]:
+        # Stop every run of an analysis with one labelled collection delete, runs whose Job was not matched (e.g.
+        # created before Jobs carried the analysis-id label) are deleted individually and concurrently
+        namespace = get_current_namespace()
+        nf_runs = await run_blocking(database.get_nf_runs_by_analysis_id, analysis_id)
+        try:
+            deleted_jobs = set(await run_k8s(delete_analysis_nextflow_runs, analysis_id, namespace))
+        except ApiException as e:
+            print(f"Error: Collection delete of Jobs for analysis_id={analysis_id} failed, "
+                  f"deleting them one by one: {repr(e)}")
+            deleted_jobs = set()
+        remaining = [nf_run.run_id for nf_run in nf_runs if nf_run.run_id not in deleted_jobs]
+        outcomes = {run_id: 'stopped' for run_id in deleted_jobs}
+        results = await asyncio.gather(*(run_k8s(delete_nextflow_run, run_id, namespace) for run_id in remaining),
+                                       return_exceptions=True)
+        for run_id, result in zip(remaining, results):
+            if isinstance(result, Exception):
+                outcomes[run_id] = f"error: {repr(result)}"
+            else:
+                outcomes[run_id] = 'stopped' if result else 'not found'
+
+        if RUN_VOLUME_MODE == 'pvc':
+            try:
+                await run_k8s(delete_analysis_run_pvcs, analysis_id, namespace)
+            except ApiException as e:
+                print(f"Error: Deleting work dir PVCs of analysis_id={analysis_id} failed: {repr(e)}")
+        if any(NextflowRunEntity.from_row(nf_run).executor == 'k8s' for nf_run in nf_runs):
+            try:
+                await run_k8s(delete_analysis_task_pods, analysis_id, namespace)
+            except ApiException as e:
+                print(f"Error: Deleting task pods of analysis_id={analysis_id} failed: {repr(e)}")
+
+        # runs whose Job could not be deleted keep their row, so that they are still concluded or stopped later
+        await run_blocking(database.delete_nf_runs, [run_id for run_id, outcome in outcomes.items()
+                                                      if outcome in ('stopped', 'not found')])
+        return outcomes
+
+    async def conclude(self, run_status: str) -> None:
+        # The result is the run's own dir, never a location reported by the unauthenticated conclude webhook
+        storage_location = get_local_run_dir(self.run_id)
+        storage_client, analysis_client = await asyncio.gather(StorageClient.create(self.keycloak_token),
+                                                               AnalysisClient.create(self.analysis_id))
 
         # If successful, create result_storage with StorageClient using storage_location  [Step 7]
         storage_id = None
-        if run_status != 'success':
-            with open(storage_location, 'rb') as result_file:
-                storage_id = storage_client.push_result(BytesIO(result_file.read()))
+        if run_status == 'succeeded':
+            with run_stage('result_upload', self.run_id):
+                storage_id = await storage_client.push_result(stream_result(storage_location),
+                                                              await run_blocking(result_extension, storage_location))
 
         # Inform analysis via AnalysisClient about conclusion (deliver result_storage id, if successful)  [Step 8]
-        analysis_client.inform_analysis({"run_status": run_status, "storage_id": storage_id})
-        # Cleanup Nextflow Run and shared PVC [Step 10] # TODO: Consider every run gets its own PVC with resource limits that is created/deleted per run
-        self.stop()
-        os.remove(storage_location)
+        with run_stage('analysis_inform', self.run_id):
+            await analysis_client.inform_analysis({"run_status": run_status, "storage_id": storage_id})
+        # Cleanup Nextflow Run, its work dir PVC (NF_RUN_VOLUME_MODE=pvc) and its directory on the shared PVC [Step 10]
+        with run_stage('job_delete', self.run_id):
+            await self.stop()
+        await run_blocking(remove_result, storage_location)
+
+
+class RunResources(BaseModel):
+    cpu_request: Optional[str] = None
+    cpu_limit: Optional[str] = None
+    memory_request: Optional[str] = None
+    memory_limit: Optional[str] = None
+    volume_size: Optional[str] = None
 
 
 class CreateNextflowRun(BaseModel):
@@ -98,9 +353,24 @@ class CreateNextflowRun(BaseModel):
     run_args: list[str] = []
     keycloak_token: str = 'keycloak_token'
     input_location: str = 'input_location'
+    input_checksum: Optional[str] = None
+    resources: Optional[RunResources] = None
+    # NF_EXECUTOR if not given
+    executor: Optional[str] = None
+    # Retries with the same key and payload return the run of the analysis created first, other payloads are rejected
+    idempotency_key: Optional[str] = None
 
 
 class ConcludeNextflowRun(BaseModel):
     run_id: str = 'analysis_id'
     run_status: str = 'run_status'
-    storage_location: str = 'storage_location'
+    # reported by the Nextflow wrapper but not used, results are always taken from the run's own dir
+    storage_location: Optional[str] = None
+
+
+class NextflowWeblogEvent(BaseModel):
+    # Sent by Nextflow's -with-weblog, trace is only set for process events
+    runName: Optional[str] = None
+    event: str
+    utcTime: Optional[str] = None
+    trace: Optional[dict[str, Any]] = None
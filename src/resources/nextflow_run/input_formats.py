@@ -0,0 +1,125 @@
+import io
+import os
+import shutil
+import tarfile
+from typing import BinaryIO, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Accept pickled payloads of older analyses, they are passed to the pipeline as input.pkl and never unpickled here
+INPUT_ALLOW_PICKLE = os.getenv("NF_INPUT_ALLOW_PICKLE", "true").lower() == "true"
+INPUT_COPY_CHUNK_SIZE = int(os.getenv("STAGING_CHUNK_SIZE", str(1024 * 1024)))
+
+# Raised by materialize_input for payloads that cannot be used, e.g. corrupt archives or compressed data
+INPUT_ERRORS = (ValueError, tarfile.TarError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+PARQUET_MAGIC = b'PAR1'
+ARROW_MAGIC = b'ARROW1'
+
+CONTENT_TYPES = {
+    'application/zstd': 'zstd',
+    'application/x-tar': 'tar',
+    'application/vnd.apache.parquet': 'parquet',
+    'application/x-parquet': 'parquet',
+    'application/vnd.apache.arrow.file': 'arrow',
+    'application/vnd.apache.arrow.stream': 'arrow',
+    'application/python-pickle': 'pickle',
+    'application/x-python-pickle': 'pickle',
+}
+# Name of the materialized input within the run directory, per format
+INPUT_NAMES = {
+    'tar': 'input',
+    'parquet': 'input.parquet',
+    'arrow': 'input.arrow',
+    'pickle': 'input.pkl',
+    'zstd': 'input.zst',
+    'raw': 'input',
+}
+
+
+def _is_tar(header: bytes) -> bool:
+    return header[257:262] == b'ustar'
+
+
+def _is_pickle(header: bytes) -> bool:
+    # protocol 2+ pickles start with the PROTO opcode
+    return (len(header) > 1) and (header[0] == 0x80) and (2 <= header[1] <= 5)
+
+
+def detect_input_format(header: bytes, content_type: Optional[str] = None) -> str:
+    """
+    Determines the format of an input payload from its first 512 bytes, the Content-Type sent by the result service
+    is only used if the payload has no recognizable magic bytes.
+    """
+    if header.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    if header.startswith(PARQUET_MAGIC):
+        return 'parquet'
+    if header.startswith(ARROW_MAGIC):
+        return 'arrow'
+    if _is_tar(header):
+        return 'tar'
+    if _is_pickle(header):
+        return 'pickle'
+    if content_type is not None:
+        return CONTENT_TYPES.get(content_type.split(';')[0].strip().lower(), 'raw')
+    return 'raw'
+
+
+def _extract_tar(stream: BinaryIO, target_dir: str) -> None:
+    os.makedirs(target_dir, exist_ok=True)
+    with tarfile.open(fileobj=stream, mode='r|') as archive:
+        archive.extractall(target_dir, filter='data')
+
+
+def materialize_input(staged_path: str, content_type: Optional[str] = None) -> str:
+    """
+    Moves a verified, staged input payload into the form the pipeline consumes, without deserializing it: tar archives
+    are extracted into an input directory while being read, zstd payloads are decompressed on the fly (and extracted
+    if they contain a tar archive), Arrow/Parquet and all other files are renamed.
+    :return: Name of the materialized input within the run directory.
+    """
+    run_dir = os.path.dirname(staged_path)
+    with open(staged_path, 'rb') as staged_file:
+        input_format = detect_input_format(staged_file.read(512), content_type)
+    if (input_format == 'zstd') and (zstandard is None):
+        print("Warning: zstandard is not installed, zstd compressed input is passed on compressed")
+
+    with open(staged_path, 'rb') as staged_file:
+        stream = staged_file
+        if (input_format == 'zstd') and (zstandard is not None):
+            stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(staged_file),
+                                       buffer_size=INPUT_COPY_CHUNK_SIZE)
+            input_format = detect_input_format(stream.peek(512)[:512])
+            if input_format == 'zstd':
+                input_format = 'raw'
+        if (input_format == 'pickle') and not INPUT_ALLOW_PICKLE:
+            raise ValueError("Pickled input is not accepted (NF_INPUT_ALLOW_PICKLE=false)")
+
+        target_name = INPUT_NAMES[input_format]
+        target_path = os.path.join(run_dir, target_name)
+        _remove(target_path)
+        if input_format == 'tar':
+            _extract_tar(stream, target_path)
+        elif stream is not staged_file:
+            with open(f"{target_path}.tmp", 'wb') as target_file:
+                shutil.copyfileobj(stream, target_file, INPUT_COPY_CHUNK_SIZE)
+            os.replace(f"{target_path}.tmp", target_path)
+
+    if (input_format == 'tar') or (stream is not staged_file):
+        os.remove(staged_path)
+    else:
+        # plain files are passed on as they are
+        os.replace(staged_path, target_path)
+    return target_name
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,214 @@
+import os
+import time
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from kubernetes import client
+
+from src.api.concurrency import run_blocking, run_k8s
+from src.api.metrics import RECONCILE_ACTIONS, RECONCILE_RECLAIMED_BYTES, RECONCILE_SECONDS
+from src.k8s.api_clients import batch_v1
+from src.k8s.watcher import JOB_LABEL_SELECTOR, get_job_run_status
+from src.resources.database.db_models import NextflowRunDB, RunStatus
+from src.resources.database.entity import Database
+from src.resources.nextflow_run.entity import NextflowRunEntity
+from src.resources.nextflow_run.results import remove_result
+from src.resources.nextflow_run.staging import NF_WORKSPACE_PATH, get_local_run_dir
+from src.resources.nextflow_run.work_cache import NF_CACHE_ENABLED, _dir_size, evict_work_caches
+
+# Seconds between reconciler passes, 0 disables the reconciler
+NF_RECONCILE_INTERVAL = float(os.getenv("NF_RECONCILE_INTERVAL", "300"))
+# Only log and count what would be reclaimed
+NF_RECONCILE_DRY_RUN = os.getenv("NF_RECONCILE_DRY_RUN", "false").lower() == "true"
+# Jobs and runs younger than this are left alone, their creation may still be in progress
+NF_RECONCILE_GRACE = float(os.getenv("NF_RECONCILE_GRACE", "600"))
+# Maximum number of items per action and pass
+NF_RECONCILE_BATCH_SIZE = int(os.getenv("NF_RECONCILE_BATCH_SIZE", "100"))
+# Rows of finished runs and work dirs of runs that are not queued or active are removed this long after the run
+# finished and the dir was last touched, 0 keeps them
+NF_RUN_ROW_TTL = float(os.getenv("NF_RUN_ROW_TTL", str(7 * 24 * 3600)))
+NF_WORKDIR_TTL = float(os.getenv("NF_WORKDIR_TTL", str(24 * 3600)))
+# Runs claimed for conclusion longer ago than this are handed back, the process concluding them died
+NF_CONCLUDE_CLAIM_TIMEOUT = float(os.getenv("NF_CONCLUDE_CLAIM_TIMEOUT", "3600"))
+RUN_DIR_PREFIX = "nf-run-"
+
+
+def plan_reconciliation(jobs: list[client.V1Job],
+                        nf_runs: list[NextflowRunDB],
+                        now: float,
+                        grace: float = NF_RECONCILE_GRACE,
+                        row_ttl: float = NF_RUN_ROW_TTL,
+                        conclude_claim_timeout: float = NF_CONCLUDE_CLAIM_TIMEOUT,
+                        batch_size: int = NF_RECONCILE_BATCH_SIZE) -> dict[str, list]:
+    """
+    Diffs the Nextflow run Jobs against the nextflow_runs rows.
+    :return: 'conclude': (run_id, run_status) of active runs whose Job finished or vanished,
+             'delete_job': run_ids of Jobs without a row or of an already finished run,
+             'delete_row': run_ids of runs finished longer than row_ttl ago,
+             'release_conclusion': run_ids of runs claimed for conclusion longer than conclude_claim_timeout ago.
+    """
+    runs = {nf_run.run_id: nf_run for nf_run in nf_runs}
+    plan = {'conclude': [], 'delete_job': [], 'delete_row': [], 'release_conclusion': []}
+    job_names = set()
+    for job in jobs:
+        run_id = job.metadata.name
+        job_names.add(run_id)
+        nf_run = runs.get(run_id)
+        created = job.metadata.creation_timestamp.timestamp() if job.metadata.creation_timestamp else now
+        run_status = get_job_run_status(job)
+        if nf_run is None:
+            if now - created > grace:
+                plan['delete_job'].append(run_id)
+        elif nf_run.status in RunStatus.FINISHED:
+            plan['delete_job'].append(run_id)
+        elif (run_status is not None) and (nf_run.status in RunStatus.CONCLUDABLE):
+            plan['conclude'].append((run_id, run_status))
+
+    for nf_run in nf_runs:
+        if (nf_run.status == RunStatus.RUNNING) and (nf_run.run_id not in job_names) \
+                and (now - (nf_run.time_started or now) > grace):
+            plan['conclude'].append((nf_run.run_id, RunStatus.FAILED))
+        elif (nf_run.status in RunStatus.FINISHED) and (row_ttl > 0) \
+                and (now - (nf_run.time_finished or nf_run.time_created or now) > row_ttl):
+            plan['delete_row'].append(nf_run.run_id)
+        elif (nf_run.status == RunStatus.CONCLUDING) \
+                and (now - (nf_run.time_claimed or 0) > conclude_claim_timeout):
+            plan['release_conclusion'].append(nf_run.run_id)
+    return {action: items[:batch_size] for action, items in plan.items()}
+
+
+def find_stale_work_dirs(in_use: set[str],
+                         now: float,
+                         ttl: float = NF_WORKDIR_TTL,
+                         batch_size: int = NF_RECONCILE_BATCH_SIZE) -> list[str]:
+    # run dirs on the shared PVC of runs that are neither queued nor active, untouched for ttl
+    if (ttl <= 0) or not os.path.isdir(NF_WORKSPACE_PATH):
+        return []
+    stale = []
+    with os.scandir(NF_WORKSPACE_PATH) as entries:
+        for entry in entries:
+            if entry.name.startswith(RUN_DIR_PREFIX) and (entry.name not in in_use) \
+                    and (now - entry.stat(follow_symlinks=False).st_mtime > ttl):
+                stale.append(entry.name)
+                if len(stale) >= batch_size:
+                    break
+    return stale
+
+
+def prune_work_dirs(run_ids: list[str], dry_run: bool = NF_RECONCILE_DRY_RUN) -> int:
+    """
+    :return: Bytes reclaimed, or that would be reclaimed in a dry run.
+    """
+    reclaimed = 0
+    for run_id in run_ids:
+        run_dir = get_local_run_dir(run_id)
+        reclaimed += _dir_size(run_dir)
+        if not dry_run:
+            remove_result(run_dir)
+    return reclaimed
+
+
+class Reconciler:
+    """
+    Periodically cleans up after lost conclude webhooks and launcher crashes: concludes runs whose Job finished or
+    vanished, deletes Jobs without an active run, drops old rows of finished runs and prunes stale run dirs. With
+    NF_CACHE_ENABLED, also evicts work dir caches beyond NF_CACHE_MAX_SIZE.
+    """
+    def __init__(self,
+                 database: Database,
+                 conclude_run: Callable[[str, str], Awaitable[bool]],
+                 namespace: str = 'default',
+                 interval: float = NF_RECONCILE_INTERVAL,
+                 dry_run: bool = NF_RECONCILE_DRY_RUN) -> None:
+        self.database = database
+        self.conclude_run = conclude_run
+        self.namespace = namespace
+        self.interval = interval
+        self.dry_run = dry_run
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    @staticmethod
+    def _count(action: str, amount: int, dry_run: bool) -> None:
+        if amount:
+            RECONCILE_ACTIONS.inc(amount, action=action, dry_run=str(dry_run).lower())
+
+    async def reconcile(self, dry_run: Optional[bool] = None) -> dict[str, int]:
+        """
+        :param dry_run: Overrides the reconciler's dry_run for this pass, e.g. for a pass requested through the API.
+        """
+        dry_run = self.dry_run if dry_run is None else dry_run
+        # passes never overlap, an on demand pass waits for the periodic one
+        async with self._lock:
+            return await self._reconcile(dry_run)
+
+    async def _reconcile(self, dry_run: bool) -> dict[str, int]:
+        with RECONCILE_SECONDS.time():
+            now = time.time()
+            jobs = (await run_k8s(batch_v1().list_namespaced_job,
+                                       namespace=self.namespace,
+                                       label_selector=JOB_LABEL_SELECTOR)).items
+            nf_runs = await run_blocking(self.database.get_nf_runs)
+            runs = {nf_run.run_id: nf_run for nf_run in nf_runs}
+            plan = plan_reconciliation(jobs, nf_runs, now)
+            in_use = {nf_run.run_id for nf_run in nf_runs
+                      if nf_run.status not in RunStatus.FINISHED}
+            plan['prune_work_dir'] = await run_blocking(find_stale_work_dirs, in_use, now)
+            if NF_CACHE_ENABLED:
+                # keeps the work dir caches of queued and active runs
+                cache_keys = {NextflowRunEntity.from_row(nf_run).work_cache_key for nf_run in nf_runs
+                              if nf_run.status not in RunStatus.FINISHED}
+                plan['evict_work_cache'] = await run_blocking(evict_work_caches, cache_keys, dry_run=dry_run)
+
+            if dry_run:
+                for action, items in plan.items():
+                    for item in items:
+                        print(f"Reconciler (dry run): would {action.replace('_', ' ')} {item}")
+            else:
+                results = await asyncio.gather(*(self.conclude_run(run_id, run_status)
+                                                 for run_id, run_status in plan['conclude']),
+                                               *(self._delete_job(run_id, runs.get(run_id))
+                                                 for run_id in plan['delete_job']),
+                                               return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        print(f"Error: Reconciling Nextflow run failed: {repr(result)}")
+                if plan['delete_row']:
+                    await run_blocking(self.database.delete_nf_runs, plan['delete_row'])
+                # concluded by the next pass
+                for run_id in plan['release_conclusion']:
+                    await run_blocking(self.database.update_nf_run_status, run_id, RunStatus.RUNNING,
+                                       expected_status=(RunStatus.CONCLUDING,), claimed_by=None, time_claimed=None)
+            reclaimed = await run_blocking(prune_work_dirs, plan['prune_work_dir'], dry_run)
+
+        summary = {action: len(items) for action, items in plan.items()}
+        for action, amount in summary.items():
+            self._count(action, amount, dry_run)
+        if reclaimed:
+            RECONCILE_RECLAIMED_BYTES.inc(reclaimed, dry_run=str(dry_run).lower())
+        if any(summary.values()):
+            print(f"Reconciler{' (dry run)' if dry_run else ''}: {summary}, {reclaimed} bytes of work dirs")
+        return {**summary, 'reclaimed_bytes': reclaimed}
+
+    async def _delete_job(self, run_id: str, nf_run: Optional[NextflowRunDB]) -> None:
+        # with the task pods and work dir PVC of the run, the executor of a Job without a row is unknown
+        executor = NextflowRunEntity.from_row(nf_run).executor if nf_run is not None else None
+        await NextflowRunEntity.delete_run_resources(run_id, executor, self.namespace)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"Error: Reconciling Nextflow runs failed: {repr(e)}")
+            await asyncio.sleep(self.interval)
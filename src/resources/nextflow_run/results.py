@@ -0,0 +1,133 @@
+import os
+import shutil
+import asyncio
+import tarfile
+from typing import AsyncIterator, Optional
+
+from src.api.concurrency import run_blocking
+from src.api.metrics import PAYLOAD_BYTES
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RESULT_CHUNK_SIZE = int(os.getenv("RESULT_CHUNK_SIZE", str(1024 * 1024)))
+# Number of chunks read (and compressed) ahead of the upload, bounds the memory held per upload
+RESULT_UPLOAD_PREFETCH = int(os.getenv("RESULT_UPLOAD_PREFETCH", "4"))
+RESULT_ARCHIVE_COMPRESSION = os.getenv("RESULT_ARCHIVE_COMPRESSION", "zstd")
+# Top-level entries of a run dir that are not part of the result: NXF_HOME, the staged input and, with the shared
+# volume mode, the task work dir with all Nextflow intermediates
+RESULT_ARCHIVE_EXCLUDES = os.getenv("RESULT_ARCHIVE_EXCLUDES",
+                                    ".nextflow,work,input,input.part,input.parquet,input.arrow,input.pkl,"
+                                    "input.zst").split(',')
+
+
+class _ChunkWriter:
+    """
+    File-like sink for the producer thread, hands fixed-size chunks over to the event loop through a bounded queue.
+    """
+    def __init__(self, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop) -> None:
+        self._queue = queue
+        self._loop = loop
+        self._buffer = bytearray()
+        self.cancelled = False
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= RESULT_CHUNK_SIZE:
+            self._put(bytes(self._buffer[:RESULT_CHUNK_SIZE]))
+            del self._buffer[:RESULT_CHUNK_SIZE]
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def finish(self) -> None:
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _put(self, chunk: Optional[bytes]) -> None:
+        if self.cancelled:
+            raise IOError("Result upload was aborted")
+        asyncio.run_coroutine_threadsafe(self._queue.put(chunk), self._loop).result()
+
+
+def _archive_compression() -> Optional[str]:
+    if RESULT_ARCHIVE_COMPRESSION == 'zstd':
+        if zstandard is not None:
+            return 'zstd'
+        print("Warning: zstandard is not installed, result directories are archived uncompressed")
+    return None
+
+
+def result_extension(storage_location: str) -> str:
+    if not os.path.isdir(storage_location):
+        return ""
+    return ".tar.zst" if _archive_compression() == 'zstd' else ".tar"
+
+
+def _exclude_filter(root_name: str):
+    def _filter(tarinfo: tarfile.TarInfo) -> Optional[tarfile.TarInfo]:
+        parts = tarinfo.name.split('/')
+        if (len(parts) > 1) and (parts[0] == root_name) and (parts[1] in RESULT_ARCHIVE_EXCLUDES):
+            return None
+        return tarinfo
+    return _filter
+
+
+def _produce(storage_location: str, writer: _ChunkWriter) -> None:
+    try:
+        if os.path.isdir(storage_location):
+            root_name = os.path.basename(os.path.normpath(storage_location))
+            compressor = None
+            sink = writer
+            if _archive_compression() == 'zstd':
+                compressor = zstandard.ZstdCompressor().stream_writer(writer, closefd=False)
+                sink = compressor
+            with tarfile.open(fileobj=sink, mode='w|') as archive:
+                archive.add(storage_location, arcname=root_name, filter=_exclude_filter(root_name))
+            if compressor is not None:
+                compressor.close()
+        else:
+            with open(storage_location, 'rb') as result_file:
+                while chunk := result_file.read(RESULT_CHUNK_SIZE):
+                    writer.write(chunk)
+        writer.finish()
+    finally:
+        if not writer.cancelled:
+            writer._put(None)
+
+
+async def stream_result(storage_location: str) -> AsyncIterator[bytes]:
+    """
+    Yields the result at storage_location in chunks of RESULT_CHUNK_SIZE bytes. Files are read as is, directories are
+    packed into a (zstd compressed) tar archive on the fly. Reading and compression run in a worker thread, at most
+    RESULT_UPLOAD_PREFETCH chunks ahead of the consumer.
+    """
+    queue = asyncio.Queue(maxsize=RESULT_UPLOAD_PREFETCH)
+    writer = _ChunkWriter(queue, asyncio.get_running_loop())
+    producer = asyncio.create_task(run_blocking(_produce, storage_location, writer))
+    try:
+        while (chunk := await queue.get()) is not None:
+            PAYLOAD_BYTES.inc(len(chunk), direction='upload')
+            yield chunk
+        await producer
+    finally:
+        if not producer.done():
+            # consumer gave up early, unblock and stop the producer thread
+            writer.cancelled = True
+            while not producer.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.sleep(0.01)
+        if producer.done() and not producer.cancelled():
+            producer.exception()
+
+
+def remove_result(storage_location: str) -> None:
+    if os.path.isdir(storage_location):
+        shutil.rmtree(storage_location, ignore_errors=True)
+    elif os.path.exists(storage_location):
+        os.remove(storage_location)
@@ -0,0 +1,171 @@
+import os
+import time
+import uuid
+import asyncio
+from collections import deque
+from typing import Optional
+
+from src.api.concurrency import run_blocking
+from src.api.metrics import RUN_QUEUE_SECONDS, RUNS_CONCLUDED
+from src.resources.database.db_models import NextflowRunDB, RunStatus
+from src.resources.database.entity import Database
+from src.resources.nextflow_run.entity import NextflowRunEntity
+from src.resources.nextflow_run.results import remove_result
+from src.resources.nextflow_run.staging import get_local_run_dir
+
+# Limits on runs being started or running, 0 disables a limit
+NF_MAX_CONCURRENT_RUNS = int(os.getenv("NF_MAX_CONCURRENT_RUNS", "10"))
+NF_MAX_RUNS_PER_ANALYSIS = int(os.getenv("NF_MAX_RUNS_PER_ANALYSIS", "5"))
+# Queued runs are also picked up periodically, e.g. after another replica freed a slot
+NF_SCHEDULER_POLL_INTERVAL = float(os.getenv("NF_SCHEDULER_POLL_INTERVAL", "10"))
+# Runs being launched are requeued once their scheduler did not renew its claim for this many seconds, needs to exceed
+# NF_SCHEDULER_POLL_INTERVAL as claims are renewed once per scheduling pass
+NF_CLAIM_TIMEOUT = float(os.getenv("NF_CLAIM_TIMEOUT", "60"))
+
+
+def select_runs(queued: list[NextflowRunDB],
+                active: dict[str, int],
+                max_concurrent_runs: int = NF_MAX_CONCURRENT_RUNS,
+                max_runs_per_analysis: int = NF_MAX_RUNS_PER_ANALYSIS) -> list[NextflowRunDB]:
+    """
+    Picks the queued runs to start next. Free slots go one at a time to the analysis with the fewest active runs,
+    ties are broken by the analysis whose oldest queued run waits longest. Runs of one analysis start in FIFO order.
+    :param queued: Queued runs, oldest first.
+    :param active: Number of starting or running runs per analysis_id.
+    """
+    active = dict(active)
+    free = (max_concurrent_runs - sum(active.values())) if max_concurrent_runs > 0 else len(queued)
+    queues: dict[str, deque[NextflowRunDB]] = {}
+    for nf_run in queued:
+        queues.setdefault(nf_run.analysis_id, deque()).append(nf_run)
+
+    selected = []
+    while (free > 0) and queues:
+        analysis_id = min(queues, key=lambda a: (active.get(a, 0), queues[a][0].time_created))
+        if (max_runs_per_analysis > 0) and (active.get(analysis_id, 0) >= max_runs_per_analysis):
+            # the analysis with the fewest active runs is at its limit, so are all others
+            break
+        selected.append(queues[analysis_id].popleft())
+        if not queues[analysis_id]:
+            del queues[analysis_id]
+        active[analysis_id] = active.get(analysis_id, 0) + 1
+        free -= 1
+    return selected
+
+
+class RunScheduler:
+    """
+    Starts queued Nextflow runs from the nextflow_runs table as concurrency slots free up. Runs are claimed by
+    moving them from 'queued' to 'starting' in the database, so several launcher replicas never start a run twice.
+    Claims carry the scheduler's owner id and are renewed while their launch is in progress, only claims that expired
+    are requeued, e.g. those of a previous leader.
+    """
+    def __init__(self,
+                 database: Database,
+                 max_concurrent_runs: int = NF_MAX_CONCURRENT_RUNS,
+                 max_runs_per_analysis: int = NF_MAX_RUNS_PER_ANALYSIS,
+                 poll_interval: float = NF_SCHEDULER_POLL_INTERVAL,
+                 claim_timeout: float = NF_CLAIM_TIMEOUT) -> None:
+        self.database = database
+        self.max_concurrent_runs = max_concurrent_runs
+        self.max_runs_per_analysis = max_runs_per_analysis
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        # per scheduler, claims of an earlier scheduler of the same process expire as well
+        self.owner = str(uuid.uuid4())
+        self._wake_event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._launches: set[asyncio.Task] = set()
+        self._requeued_at = 0.0
+
+    def wake(self) -> None:
+        self._wake_event.set()
+
+    async def start(self) -> None:
+        await self.requeue_expired_claims()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # launches in progress are abandoned as well, their claims expire and the next scheduler requeues them
+        tasks = list(self._launches) + ([self._task] if self._task is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    async def requeue_expired_claims(self) -> int:
+        self._requeued_at = time.monotonic()
+        requeued = await run_blocking(self.database.requeue_starting_nf_runs, time.time() - self.claim_timeout)
+        if requeued:
+            print(f"Requeued {requeued} Nextflow runs whose launch was interrupted")
+        return requeued
+
+    async def schedule(self) -> list[str]:
+        queued = await run_blocking(self.database.get_queued_nf_runs)
+        if not queued:
+            return []
+        active = await run_blocking(self.database.count_active_nf_runs)
+        started = []
+        for nf_run in select_runs(queued, active, self.max_concurrent_runs, self.max_runs_per_analysis):
+            if await run_blocking(self.database.update_nf_run_status,
+                                  nf_run.run_id,
+                                  RunStatus.STARTING,
+                                  expected_status=(RunStatus.QUEUED,),
+                                  claimed_by=self.owner,
+                                  time_claimed=time.time()):
+                task = asyncio.create_task(self._launch(NextflowRunEntity.from_row(nf_run)))
+                self._launches.add(task)
+                task.add_done_callback(self._launches.discard)
+                started.append(nf_run.run_id)
+        return started
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self._launches:
+                    await run_blocking(self.database.renew_nf_run_claims, self.owner)
+                if time.monotonic() - self._requeued_at >= self.poll_interval:
+                    await self.requeue_expired_claims()
+                await self.schedule()
+            except Exception as e:
+                print(f"Error: Scheduling queued Nextflow runs failed: {repr(e)}")
+            try:
+                await asyncio.wait_for(self._wake_event.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake_event.clear()
+
+    async def _launch(self, nf_run: NextflowRunEntity) -> None:
+        try:
+            await nf_run.launch()
+        except Exception as e:
+            print(f"Error: Launch of {str(nf_run)} failed: {repr(e)}")
+            # the claim may have expired meanwhile, and the run been requeued and launched by another scheduler
+            if not await run_blocking(self.database.update_nf_run_status,
+                                      nf_run.run_id,
+                                      RunStatus.FAILED,
+                                      expected_status=(RunStatus.STARTING,),
+                                      expected_claimed_by=self.owner):
+                self.wake()
+                return
+            RUNS_CONCLUDED.inc(status=RunStatus.FAILED)
+            try:
+                await nf_run.conclude(RunStatus.FAILED)
+            except Exception as e:
+                print(f"Error: Reporting failed launch of run_id={nf_run.run_id} failed: {repr(e)}")
+            self.wake()
+            return
+
+        time_started = time.time()
+        if await run_blocking(self.database.update_nf_run_status,
+                              nf_run.run_id,
+                              RunStatus.RUNNING,
+                              expected_status=(RunStatus.STARTING,),
+                              expected_claimed_by=self.owner,
+                              time_started=time_started):
+            RUN_QUEUE_SECONDS.observe(time_started - nf_run.time_created)
+        elif await run_blocking(self.database.get_nf_run_by_run_id, nf_run.run_id) is None:
+            # run was stopped while it was being launched, a run whose Job already finished is being concluded
+            await nf_run.stop()
+            await run_blocking(remove_result, get_local_run_dir(nf_run.run_id))
+            self.wake()
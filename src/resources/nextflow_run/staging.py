@@ -0,0 +1,114 @@
+import os
+import base64
+import random
+import asyncio
+import hashlib
+from typing import BinaryIO, Optional
+
+from fastapi import HTTPException
+from httpx import HTTPStatusError, Response, TransportError
+
+from src.api.concurrency import run_blocking
+from src.api.metrics import PAYLOAD_BYTES
+from src.k8s.kubernetes import get_run_work_dir
+from src.resources.clients.storage_client import StorageClient
+from src.resources.nextflow_run.input_formats import INPUT_ERRORS, materialize_input
+from src.resources.nextflow_run.results import remove_result
+
+# Path at which the shared Nextflow PVC is mounted into the launcher pod
+NF_WORKSPACE_PATH = os.getenv("NF_WORKSPACE_PATH", "/workspace")
+STAGING_CHUNK_SIZE = int(os.getenv("STAGING_CHUNK_SIZE", str(1024 * 1024)))
+STAGING_MAX_ATTEMPTS = int(os.getenv("STAGING_MAX_ATTEMPTS", "5"))
+
+
+def get_local_run_dir(run_id: str) -> str:
+    return os.path.join(NF_WORKSPACE_PATH, run_id)
+
+
+async def stage_input(storage_client: StorageClient,
+                      storage_id: str,
+                      run_id: str,
+                      expected_sha256: Optional[str] = None) -> Optional[str]:
+    """
+    Streams the input data of a run from the result service onto the shared PVC, chunk by chunk.
+    Interrupted downloads are resumed from the already written part file with a range request, the sha256 of the
+    staged file is verified against expected_sha256 or the Digest header sent by the result service. The verified
+    payload is then materialized by its format, see materialize_input.
+    :return: Path of the staged input inside the Nextflow pod, or None if the result service had no data.
+    """
+    local_dir = get_local_run_dir(run_id)
+    target_path = os.path.join(local_dir, 'input')
+    part_path = f"{target_path}.part"
+    await run_blocking(os.makedirs, local_dir, exist_ok=True)
+
+    digest = None
+    content_type = None
+    for attempt in range(1, STAGING_MAX_ATTEMPTS + 1):
+        offset, digest = await run_blocking(_resume_state, part_path)
+        try:
+            async with storage_client.stream_data(storage_id, offset) as response:
+                if offset and (response.status_code == 416):
+                    # part file already holds the complete payload
+                    break
+                response.raise_for_status()
+                if offset and (response.status_code != 206):
+                    # range request not honoured, start over
+                    offset, digest = 0, hashlib.sha256()
+                expected_sha256 = expected_sha256 or _digest_from_headers(response)
+                content_type = response.headers.get('Content-Type')
+
+                part_file = await run_blocking(open, part_path, 'ab' if offset else 'wb')
+                try:
+                    async for chunk in response.aiter_bytes(STAGING_CHUNK_SIZE):
+                        await run_blocking(_write_chunk, part_file, digest, chunk)
+                        PAYLOAD_BYTES.inc(len(chunk), direction='download')
+                finally:
+                    await run_blocking(part_file.close)
+            break
+        except HTTPStatusError as e:
+            print("HTTP Error in result client during download:", repr(e))
+            return None
+        except TransportError as e:
+            if attempt == STAGING_MAX_ATTEMPTS:
+                raise HTTPException(status_code=500,
+                                    detail=f"Staging input for run_id={run_id} failed after {attempt} attempts: "
+                                           f"{repr(e)}")
+            print(f"Download of input for run_id={run_id} interrupted ({repr(e)}), resuming (attempt {attempt})")
+            await asyncio.sleep(random.uniform(0, min(2 ** attempt, 30)))
+
+    if (expected_sha256 is not None) and (digest.hexdigest() != expected_sha256.lower()):
+        await run_blocking(os.remove, part_path)
+        raise HTTPException(status_code=500,
+                            detail=f"Checksum mismatch for input of run_id={run_id}: "
+                                   f"expected={expected_sha256}, found={digest.hexdigest()}")
+    try:
+        input_name = await run_blocking(materialize_input, part_path, content_type)
+    except INPUT_ERRORS as e:
+        await run_blocking(remove_result, part_path)
+        raise HTTPException(status_code=500, detail=f"Unusable input for run_id={run_id}: {repr(e)}")
+    return f"{get_run_work_dir(run_id)}/{input_name}"
+
+
+def _resume_state(part_path: str) -> tuple[int, 'hashlib._Hash']:
+    digest = hashlib.sha256()
+    if not os.path.exists(part_path):
+        return 0, digest
+    with open(part_path, 'rb') as part_file:
+        while chunk := part_file.read(STAGING_CHUNK_SIZE):
+            digest.update(chunk)
+    return os.path.getsize(part_path), digest
+
+
+def _write_chunk(part_file: BinaryIO, digest: 'hashlib._Hash', chunk: bytes) -> None:
+    part_file.write(chunk)
+    digest.update(chunk)
+
+
+def _digest_from_headers(response: Response) -> Optional[str]:
+    if 'X-Checksum-SHA256' in response.headers:
+        return response.headers['X-Checksum-SHA256']
+    for value in response.headers.get('Digest', '').split(','):
+        algorithm, _, encoded = value.strip().partition('=')
+        if algorithm.lower() == 'sha-256' and encoded:
+            return base64.b64decode(encoded).hex()
+    return None
@@ -0,0 +1,170 @@
+import os
+import math
+import asyncio
+from collections import deque
+from typing import Any, Optional
+
+from src.api.concurrency import run_blocking
+from src.api.metrics import TASKS_INGESTED
+from src.resources.database.db_models import NextflowTaskDB
+from src.resources.database.entity import Database
+
+# Task records are buffered and inserted in batches of up to NF_TASK_FLUSH_SIZE, at least every NF_TASK_FLUSH_INTERVAL
+NF_TASK_FLUSH_SIZE = int(os.getenv("NF_TASK_FLUSH_SIZE", "500"))
+NF_TASK_FLUSH_INTERVAL = float(os.getenv("NF_TASK_FLUSH_INTERVAL", "2"))
+# Records kept while the database is unreachable, the oldest are dropped beyond that
+NF_TASK_BUFFER_MAX = int(os.getenv("NF_TASK_BUFFER_MAX", "50000"))
+# Most recent tasks of a pipeline aggregated into its statistics
+NF_TASK_STATS_WINDOW = int(os.getenv("NF_TASK_STATS_WINDOW", "10000"))
+# Suggested memory is the 95th percentile of peak RSS times this factor
+NF_TASK_MEMORY_HEADROOM = float(os.getenv("NF_TASK_MEMORY_HEADROOM", "1.2"))
+
+FINISHED_TASK_STATUSES = ('COMPLETED', 'FAILED', 'ABORTED')
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).rstrip('%'))
+    except ValueError:
+        # '-' for values Nextflow could not collect
+        return None
+
+
+def _integer(value: Any) -> Optional[int]:
+    number = _number(value)
+    return int(number) if number is not None else None
+
+
+def task_row(run_id: str, pipeline_name: Optional[str], trace: dict[str, Any]) -> dict[str, Any]:
+    """
+    Converts a task of a Nextflow trace file or weblog event into a row of the nextflow_tasks table.
+    """
+    complete = _number(trace.get('complete'))
+    return {'run_id': run_id,
+            'pipeline_name': pipeline_name,
+            'process': trace.get('process') or str(trace.get('name', '')).split(' (')[0] or None,
+            'task_id': _integer(trace.get('task_id')),
+            'status': trace.get('status'),
+            'exit': _integer(trace.get('exit')),
+            'cpus': _number(trace.get('cpus')),
+            'memory': _integer(trace.get('memory')),
+            'realtime': _integer(trace.get('realtime')),
+            'pct_cpu': _number(trace.get('%cpu')),
+            'peak_rss': _integer(trace.get('peak_rss')),
+            'rchar': _integer(trace.get('rchar')),
+            'wchar': _integer(trace.get('wchar')),
+            'time_completed': complete / 1000 if complete is not None else None}
+
+
+def finished_task_rows(run_id: str, pipeline_name: Optional[str], trace: list[dict[str, str]]) -> list[dict[str, Any]]:
+    return [task_row(run_id, pipeline_name, task) for task in trace if task.get('status') in FINISHED_TASK_STATUSES]
+
+
+def _percentile(values: list[float], percentile: float) -> Optional[float]:
+    # nearest rank on the sorted values
+    if not values:
+        return None
+    return values[max(0, math.ceil(percentile / 100 * len(values)) - 1)]
+
+
+def summarize_tasks(nf_tasks: list[NextflowTaskDB]) -> dict[str, dict[str, Any]]:
+    """
+    Aggregates task records per process into duration percentiles, peak RSS, the share of requested CPU and memory
+    left unused, and suggested requests for later runs.
+    """
+    processes: dict[str, list[NextflowTaskDB]] = {}
+    for nf_task in nf_tasks:
+        processes.setdefault(nf_task.process or 'unknown', []).append(nf_task)
+
+    summary = {}
+    for process, tasks in sorted(processes.items()):
+        realtimes = sorted(task.realtime for task in tasks if task.realtime is not None)
+        peak_rss = sorted(task.peak_rss for task in tasks if task.peak_rss is not None)
+        cpu_usage = sorted(task.pct_cpu / 100 for task in tasks if task.pct_cpu is not None)
+
+        # requested and used resources, weighted by how long the task held them
+        measured = [task for task in tasks if task.realtime]
+        cpu_requested = sum(task.cpus * task.realtime for task in measured if task.cpus and task.pct_cpu is not None)
+        cpu_used = sum(task.pct_cpu / 100 * task.realtime for task in measured if task.cpus and task.pct_cpu is not None)
+        memory_requested = sum(task.memory * task.realtime for task in measured if task.memory and task.peak_rss)
+        memory_used = sum(task.peak_rss * task.realtime for task in measured if task.memory and task.peak_rss)
+
+        p95_rss = _percentile(peak_rss, 95)
+        p95_cpu = _percentile(cpu_usage, 95)
+        summary[process] = {
+            'tasks': len(tasks),
+            'failed': sum(task.status != 'COMPLETED' for task in tasks),
+            'realtime_ms': {'p50': _percentile(realtimes, 50),
+                            'p90': _percentile(realtimes, 90),
+                            'p99': _percentile(realtimes, 99),
+                            'max': realtimes[-1] if realtimes else None},
+            'peak_rss_bytes': {'p50': _percentile(peak_rss, 50),
+                               'p95': p95_rss,
+                               'max': peak_rss[-1] if peak_rss else None},
+            'cpu_wasted_fraction': 1 - cpu_used / cpu_requested if cpu_requested else None,
+            'cpu_wasted_seconds': max(cpu_requested - cpu_used, 0) / 1000,
+            'memory_wasted_fraction': 1 - memory_used / memory_requested if memory_requested else None,
+            'suggested_cpus': max(1, math.ceil(p95_cpu)) if p95_cpu is not None else None,
+            'suggested_memory_bytes': int(p95_rss * NF_TASK_MEMORY_HEADROOM) if p95_rss is not None else None,
+        }
+    return summary
+
+
+class TaskRecordBuffer:
+    """
+    Collects task records from weblog events and trace files and inserts them in batches, so that bursts of
+    weblog requests cost one INSERT per batch instead of one per task.
+    """
+    def __init__(self,
+                 database: Database,
+                 flush_size: int = NF_TASK_FLUSH_SIZE,
+                 flush_interval: float = NF_TASK_FLUSH_INTERVAL) -> None:
+        self.database = database
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._rows: deque[dict[str, Any]] = deque(maxlen=NF_TASK_BUFFER_MAX)
+        self._flush_event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, rows: list[dict[str, Any]], source: str) -> None:
+        self._rows.extend(rows)
+        TASKS_INGESTED.inc(len(rows), source=source)
+        if len(self._rows) >= self.flush_size:
+            self._flush_event.set()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        flushed = 0
+        while self._rows:
+            batch = [self._rows.popleft() for _ in range(min(self.flush_size, len(self._rows)))]
+            try:
+                await run_blocking(self.database.create_nf_tasks, batch)
+            except Exception:
+                # keep the batch for the next flush, bounded by NF_TASK_BUFFER_MAX
+                self._rows.extendleft(reversed(batch))
+                raise
+            flushed += len(batch)
+        return flushed
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error: Inserting Nextflow task records failed: {repr(e)}")
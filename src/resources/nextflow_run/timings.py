@@ -0,0 +1,51 @@
+import os
+from typing import Optional
+
+from src.resources.nextflow_run.staging import get_local_run_dir
+
+
+def _read_container_started(nxf_home: str) -> Optional[float]:
+    try:
+        with open(os.path.join(nxf_home, 'container_started')) as started_file:
+            return float(started_file.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _read_trace(nxf_home: str) -> list[dict[str, str]]:
+    try:
+        with open(os.path.join(nxf_home, 'trace.txt')) as trace_file:
+            header = trace_file.readline().rstrip('\n').split('\t')
+            return [dict(zip(header, line.rstrip('\n').split('\t'))) for line in trace_file]
+    except OSError:
+        return []
+
+
+def _read_first_task_submitted(nxf_home: str) -> Optional[float]:
+    submits = [int(task['submit']) / 1000 for task in _read_trace(nxf_home) if task.get('submit', '').isdigit()]
+    return min(submits) if submits else None
+
+
+def read_run_timings(run_id: str) -> dict[str, Optional[float]]:
+    """
+    Reads the startup timings the Nextflow wrapper leaves in the run's NXF_HOME on the shared PVC.
+    :return: Epoch seconds at which the run's container started and its first task was submitted, None if unknown.
+    """
+    nxf_home = os.path.join(get_local_run_dir(run_id), '.nextflow')
+    return {'time_container_started': _read_container_started(nxf_home),
+            'time_first_task': _read_first_task_submitted(nxf_home)}
+
+
+def read_run_progress(run_id: str) -> dict[str, int]:
+    """
+    Counts the tasks of a run by status from its Nextflow trace, which lists tasks once they finished.
+    """
+    progress = {}
+    for task in read_run_trace(run_id):
+        status = task.get('status', 'UNKNOWN').lower()
+        progress[status] = progress.get(status, 0) + 1
+    return progress
+
+
+def read_run_trace(run_id: str) -> list[dict[str, str]]:
+    return _read_trace(os.path.join(get_local_run_dir(run_id), '.nextflow'))
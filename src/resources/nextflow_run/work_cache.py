@@ -0,0 +1,91 @@
+import os
+import time
+import shutil
+import hashlib
+from typing import Optional
+
+from src.resources.nextflow_run.staging import NF_WORKSPACE_PATH
+
+# Opt-in: share pipeline assets between runs and resume runs of the same analysis and pipeline
+NF_CACHE_ENABLED = os.getenv("NF_CACHE_ENABLED", "false").lower() == "true"
+# Upper bound for the resumable work dirs on the shared PVC, least recently used ones are evicted beyond it
+NF_CACHE_MAX_SIZE = int(os.getenv("NF_CACHE_MAX_SIZE", str(100 * 1024 ** 3)))
+CACHE_DIR_NAME = ".nf-cache"
+LAST_USED_MARKER = ".last_used"
+
+
+def pipeline_revision(run_args: Optional[list[str]]) -> Optional[str]:
+    run_args = run_args or []
+    for i, arg in enumerate(run_args):
+        if (arg in ['-r', '-revision']) and (i + 1 < len(run_args)):
+            return run_args[i + 1]
+    return None
+
+
+def _key(*parts: Optional[str]) -> str:
+    return hashlib.sha256('\0'.join(part or '' for part in parts).encode()).hexdigest()[:16]
+
+
+def assets_key(pipeline_name: str, run_args: Optional[list[str]]) -> str:
+    return _key(pipeline_name, pipeline_revision(run_args))
+
+
+def work_cache_key(analysis_id: str, pipeline_name: str, run_args: Optional[list[str]]) -> str:
+    return _key(analysis_id, pipeline_name, pipeline_revision(run_args))
+
+
+def get_local_work_cache_dir(key: Optional[str] = None) -> str:
+    work_caches = os.path.join(NF_WORKSPACE_PATH, CACHE_DIR_NAME, 'work')
+    return work_caches if key is None else os.path.join(work_caches, key)
+
+
+def touch_work_cache(key: str) -> None:
+    cache_dir = get_local_work_cache_dir(key)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, LAST_USED_MARKER), 'w') as marker:
+        marker.write(str(time.time()))
+
+
+def _dir_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def _last_used(path: str) -> float:
+    try:
+        return os.path.getmtime(os.path.join(path, LAST_USED_MARKER))
+    except OSError:
+        return os.path.getmtime(path)
+
+
+def evict_work_caches(in_use: set[str], max_size: int = NF_CACHE_MAX_SIZE, dry_run: bool = False) -> list[str]:
+    """
+    Removes least recently used work dir caches until all of them together fit into max_size bytes. Sizes every
+    cache, left to the reconciler's passes.
+    :param in_use: Keys of caches used by queued or active runs, these are never evicted.
+    :return: Keys of the evicted caches, or of those that would be evicted in a dry run.
+    """
+    work_caches = get_local_work_cache_dir()
+    if not os.path.isdir(work_caches):
+        return []
+    caches = [(_last_used(entry.path), entry.name, _dir_size(entry.path))
+              for entry in os.scandir(work_caches) if entry.is_dir()]
+    total = sum(size for _, _, size in caches)
+
+    evicted = []
+    for _, key, size in sorted(caches):
+        if total <= max_size:
+            break
+        if key in in_use:
+            continue
+        if not dry_run:
+            shutil.rmtree(get_local_work_cache_dir(key), ignore_errors=True)
+        total -= size
+        evicted.append(key)
+    return evicted
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+from kubernetes import client
+
+from src.api import concurrency
+from src.k8s.api_clients import MeteredApiClient, RequestStats, TokenBucket, _parse_request
+
+
+def test_parse_request_maps_verbs_and_resources():
+    jobs = '/apis/batch/v1/namespaces/{namespace}/jobs'
+    assert _parse_request(jobs, 'GET', []) == ('list', 'jobs')
+    assert _parse_request(jobs, 'GET', [('watch', True)]) == ('watch', 'jobs')
+    assert _parse_request(jobs, 'POST', []) == ('create', 'jobs')
+    assert _parse_request(jobs, 'DELETE', []) == ('deletecollection', 'jobs')
+    assert _parse_request(jobs + '/{name}', 'DELETE', []) == ('delete', 'jobs')
+    assert _parse_request('/api/v1/namespaces/{namespace}/pods/{name}/log', 'GET', []) == ('get', 'pods')
+
+
+def test_token_bucket_throttles_beyond_burst():
+    bucket = TokenBucket(qps=100, burst=2)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() > 0.0
+
+
+def test_metered_api_client_records_failed_requests():
+    configuration = client.Configuration(host="http://127.0.0.1:9")
+    stats = RequestStats()
+    batch = client.BatchV1Api(MeteredApiClient(configuration, TokenBucket(0, 1), stats))
+    try:
+        batch.list_namespaced_job(namespace='default', _request_timeout=1)
+    except Exception:
+        pass
+    assert stats.snapshot()[('list', 'jobs')]['errors'] == 1
+
+
+def test_throttled_kubernetes_calls_leave_blocking_threads_free(monkeypatch):
+    monkeypatch.setattr(concurrency, '_k8s_limiter', None)
+    monkeypatch.setattr(concurrency, 'K8S_IO_THREADS', 1)
+    released = threading.Event()
+
+    async def scenario() -> str:
+        # every Kubernetes thread waits for the rate limit, database and file I/O still get a thread
+        throttled = asyncio.ensure_future(concurrency.run_k8s(released.wait))
+        result = await asyncio.wait_for(concurrency.run_blocking(lambda: 'done'), timeout=5)
+        released.set()
+        await throttled
+        return result
+
+    assert asyncio.run(scenario()) == 'done'
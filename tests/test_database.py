@@ -0,0 +1,82 @@
+from src.resources.database.db_models import RunStatus
+from src.resources.database.entity import Database
+
+
+def _database() -> Database:
+    return Database("sqlite://")
+
+
+def test_run_lookups_are_served_from_cache():
+    database = _database()
+    database.create_nf_run('nf-run-1', 'analysis-1', 'token', 1.0)
+    database.create_nf_run('nf-run-2', 'analysis-1', 'token', 2.0)
+
+    assert database.get_nf_run_by_run_id('nf-run-1').analysis_id == 'analysis-1'
+    assert database.run_cache.stats['hits'] == 1
+
+    assert {nf_run.run_id for nf_run in database.get_nf_runs_by_analysis_id('analysis-1')} == {'nf-run-1', 'nf-run-2'}
+    assert {nf_run.run_id for nf_run in database.get_nf_runs_by_analysis_id('analysis-1')} == {'nf-run-1', 'nf-run-2'}
+    assert database.run_cache.stats['hits'] == 2
+
+    database.create_nf_run('nf-run-3', 'analysis-1', 'token', 3.0)
+    assert len(database.get_nf_runs_by_analysis_id('analysis-1')) == 3
+
+
+def test_deletes_invalidate_cache():
+    database = _database()
+    database.create_nf_run('nf-run-1', 'analysis-1', 'token', 1.0)
+    database.create_nf_run('nf-run-2', 'analysis-1', 'token', 2.0)
+    database.create_nf_run('nf-run-3', 'analysis-2', 'token', 3.0)
+
+    database.delete_nf_run('nf-run-3')
+    assert database.get_nf_run_by_run_id('nf-run-3') is None
+
+    assert sorted(database.delete_all_analysis_nf_runs('analysis-1')) == ['nf-run-1', 'nf-run-2']
+    assert database.get_nf_run_by_run_id('nf-run-1') is None
+    assert database.get_nf_runs_by_analysis_id('analysis-1') == []
+
+
+def test_cache_eviction_falls_back_to_database():
+    database = _database()
+    database.run_cache.max_size = 2
+    for i in range(3):
+        database.create_nf_run(f'nf-run-{i}', 'analysis-1', 'token', float(i))
+
+    assert database.get_nf_run_by_run_id('nf-run-0').run_id == 'nf-run-0'
+    assert len(database.get_nf_runs_by_analysis_id('analysis-1')) == 3
+
+
+def test_batch_insert_queues_runs_in_order():
+    database = _database()
+    database.create_nf_run('nf-run-0', 'analysis-0', 'token', 0.0)
+    rows = database.create_nf_runs([{'run_id': f'nf-run-{i}', 'analysis_id': 'analysis-1',
+                                     'keycloak_token': 'token', 'time_created': float(i)} for i in range(1, 4)])
+
+    assert [row.status for row in rows] == ['queued'] * 3
+    assert len(database.get_nf_runs_by_analysis_id('analysis-1')) == 3
+    assert database.get_queue_positions(['nf-run-3', 'nf-run-0', 'missing']) == {'nf-run-3': 3, 'nf-run-0': 0,
+                                                                                 'missing': None}
+
+
+def test_delete_nf_runs_removes_rows_and_cache_entries():
+    database = _database()
+    database.create_nf_run('nf-run-1', 'analysis-1', 'token', 1.0)
+    database.create_nf_run('nf-run-2', 'analysis-1', 'token', 2.0)
+
+    assert database.delete_nf_runs(['nf-run-1', 'nf-run-missing']) == ['nf-run-1']
+    assert database.get_nf_run_by_run_id('nf-run-1') is None
+    assert [nf_run.run_id for nf_run in database.get_nf_runs_by_analysis_id('analysis-1')] == ['nf-run-2']
+
+
+def test_conclusion_claim_is_atomic_across_processes(tmp_path):
+    # two launcher processes with their own run cache on one database
+    first, second = Database(f"sqlite:///{tmp_path}/runs.db"), Database(f"sqlite:///{tmp_path}/runs.db")
+    first.create_nf_run('nf-run-1', 'analysis-1', 'token', 1.0, status=RunStatus.RUNNING)
+    assert second.get_nf_run_by_run_id('nf-run-1').status == RunStatus.RUNNING
+
+    assert first.update_nf_run_status('nf-run-1', RunStatus.CONCLUDING, expected_status=RunStatus.CONCLUDABLE,
+                                      claimed_by=first.instance_id, time_claimed=2.0)
+    # the stale cache of the second process does not let it claim the run again
+    assert not second.update_nf_run_status('nf-run-1', RunStatus.CONCLUDING, expected_status=RunStatus.CONCLUDABLE,
+                                           claimed_by=second.instance_id, time_claimed=3.0)
+    assert second.get_nf_run_by_run_id('nf-run-1').claimed_by == first.instance_id
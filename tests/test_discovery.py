@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+from kubernetes import client
+
+from src.k8s.discovery import ServiceEndpointCache
+from src.resources.clients import analysis_client, http_pool, storage_client
+
+
+def _service(name: str, component: str) -> client.V1Service:
+    return client.V1Service(metadata=client.V1ObjectMeta(name=name, labels={'component': component},
+                                                         resource_version='1'))
+
+
+def test_service_endpoint_cache_resolves_newest_nginx_service_per_analysis():
+    cache = ServiceEndpointCache(namespace='default', ttl=1e9)
+    cache.on_list([_service('result-service', 'flame-result-service'),
+                   _service('nginx-analysis-a1-2', 'flame-analysis-nginx'),
+                   _service('nginx-analysis-a1-10', 'flame-analysis-nginx'),
+                   _service('nginx-analysis-b2-1', 'flame-analysis-nginx')])
+
+    assert cache.result_service() == 'result-service'
+    assert cache.analysis_nginx_service('a1') == 'nginx-analysis-a1-10'
+    assert cache.analysis_nginx_service('c3') is None
+
+    cache.on_event('DELETED', _service('nginx-analysis-a1-10', 'flame-analysis-nginx'))
+    assert cache.analysis_nginx_service('a1') == 'nginx-analysis-a1-2'
+    cache.on_event('ADDED', _service('nginx-analysis-c3-1', 'flame-analysis-nginx'))
+    assert cache.analysis_nginx_service('c3') == 'nginx-analysis-c3-1'
+
+
+def test_clients_look_services_up_off_the_event_loop(monkeypatch):
+    lookups = []
+
+    class Endpoints:
+        def result_service(self) -> str:
+            lookups.append(threading.current_thread())
+            return 'result-service'
+
+        def analysis_nginx_service(self, analysis_id: str) -> str:
+            lookups.append(threading.current_thread())
+            return f'nginx-analysis-{analysis_id}-1'
+
+    monkeypatch.setattr(storage_client, 'get_service_endpoints', Endpoints)
+    monkeypatch.setattr(analysis_client, 'get_service_endpoints', Endpoints)
+    monkeypatch.setattr(http_pool, '_clients', http_pool.OrderedDict())
+
+    async def scenario() -> tuple[str, str]:
+        storage = await storage_client.StorageClient.create('token')
+        analysis = await analysis_client.AnalysisClient.create('a1')
+        return str(storage.client.base_url), str(analysis.client.base_url)
+
+    assert asyncio.run(scenario()) == ("http://result-service:8080/storage/",
+                                       "http://nginx-analysis-a1-1/analysis/")
+    assert len(lookups) == 2 and threading.main_thread() not in lookups
@@ -0,0 +1,45 @@
+import asyncio
+
+import httpx
+
+from src.resources.clients import http_pool
+
+
+def _client(handler, monkeypatch) -> httpx.AsyncClient:
+    monkeypatch.setattr(http_pool, 'HTTP_RETRY_BACKOFF', 0)
+    transport = http_pool.PooledTransport(http_pool.PoolStats())
+    transport._transport = httpx.MockTransport(handler)
+    return httpx.AsyncClient(base_url="http://service", transport=transport)
+
+
+def test_pooled_transport_retries_idempotent_requests_only(monkeypatch):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.method)
+        return httpx.Response(503 if (len(calls) < 3) or (request.method == "POST") else 200)
+
+    async def scenario(client: httpx.AsyncClient) -> tuple[int, int]:
+        get_response = await client.get("/data")
+        post_response = await client.post("/nextflow", json={})
+        return get_response.status_code, post_response.status_code
+
+    client = _client(handler, monkeypatch)
+    assert asyncio.run(scenario(client)) == (200, 503)
+    assert calls == ['GET', 'GET', 'GET', 'POST']
+    assert client._transport.stats.retries == 2
+    assert client._transport.stats.in_flight == 0
+
+
+def test_get_http_client_reuses_client_per_base_url(monkeypatch):
+    monkeypatch.setattr(http_pool, '_clients', http_pool.OrderedDict())
+
+    async def scenario() -> None:
+        first = http_pool.get_http_client("http://result-service:8080/storage")
+        assert http_pool.get_http_client("http://result-service:8080/storage") is first
+        assert http_pool.get_http_client("http://nginx-analysis-a1-1:80/analysis") is not first
+        assert set(http_pool.http_pool_stats()) == {"http://result-service:8080/storage",
+                                                     "http://nginx-analysis-a1-1:80/analysis"}
+        await http_pool.close_http_clients()
+
+    asyncio.run(scenario())
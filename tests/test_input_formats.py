@@ -0,0 +1,52 @@
+import io
+import pickle
+import tarfile
+
+import pytest
+import zstandard
+
+from src.resources.nextflow_run import input_formats
+from src.resources.nextflow_run.input_formats import detect_input_format, materialize_input
+
+
+def _tar_bytes() -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as archive:
+        data = b'sample,value\na,1\n'
+        info = tarfile.TarInfo('data/samples.csv')
+        info.size = len(data)
+        archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_detect_input_format_prefers_magic_bytes():
+    assert detect_input_format(b'PAR1' + b'\0' * 100) == 'parquet'
+    assert detect_input_format(b'ARROW1\0\0') == 'arrow'
+    assert detect_input_format(_tar_bytes()[:512]) == 'tar'
+    assert detect_input_format(pickle.dumps({'a': 1})[:512]) == 'pickle'
+    assert detect_input_format(b'plain text', 'application/x-parquet') == 'parquet'
+    assert detect_input_format(b'plain text', 'text/plain') == 'raw'
+
+
+def test_materialize_input_extracts_compressed_tar(tmp_path):
+    staged = tmp_path / 'input.part'
+    staged.write_bytes(zstandard.ZstdCompressor().compress(_tar_bytes()))
+
+    assert materialize_input(str(staged)) == 'input'
+    assert (tmp_path / 'input' / 'data' / 'samples.csv').read_bytes() == b'sample,value\na,1\n'
+    assert not staged.exists()
+
+
+def test_materialize_input_passes_files_through(tmp_path, monkeypatch):
+    staged = tmp_path / 'input.part'
+    staged.write_bytes(b'PAR1' + b'\0' * 100)
+    assert materialize_input(str(staged)) == 'input.parquet'
+    assert (tmp_path / 'input.parquet').read_bytes().startswith(b'PAR1')
+
+    staged.write_bytes(pickle.dumps({'a': 1}))
+    assert materialize_input(str(staged)) == 'input.pkl'
+
+    monkeypatch.setattr(input_formats, 'INPUT_ALLOW_PICKLE', False)
+    staged.write_bytes(pickle.dumps({'a': 1}))
+    with pytest.raises(ValueError):
+        materialize_input(str(staged))
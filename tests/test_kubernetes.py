@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+from src.k8s import executor, kubernetes, warm_pool
+
+
+def _capture(monkeypatch) -> dict:
+    created = {}
+    monkeypatch.setattr(kubernetes, 'batch_v1', lambda: SimpleNamespace(
+        create_namespaced_job=lambda namespace, body: created.setdefault('job', body)))
+    monkeypatch.setattr(kubernetes, 'core_v1', lambda: SimpleNamespace(
+        create_namespaced_persistent_volume_claim=lambda namespace, body: created.setdefault('pvc', body)))
+    return created
+
+
+def test_shared_volume_mode_keeps_work_dir_on_shared_pvc(monkeypatch):
+    monkeypatch.setattr(kubernetes, 'RUN_VOLUME_MODE', 'shared')
+    created = _capture(monkeypatch)
+
+    kubernetes.create_nextflow_run('/workspace/nf-run-1/input', 'nf-run-1', 'analysis-1', 'pipeline', [])
+
+    container = created['job'].spec.template.spec.containers[0]
+    assert 'pvc' not in created
+    assert container.resources is None
+    assert [mount.name for mount in container.volume_mounts] == ['work', 'config']
+    assert 'WORK_DIR="/workspace/nf-run-1/work"' in container.args[0]
+    assert 'WORK_CACHE_DIR' not in [env.name for env in container.env]
+
+
+def test_pvc_volume_mode_creates_sized_pvc_and_sets_resources(monkeypatch):
+    monkeypatch.setattr(kubernetes, 'RUN_VOLUME_MODE', 'pvc')
+    created = _capture(monkeypatch)
+
+    kubernetes.create_nextflow_run(None, 'nf-run-1', 'analysis-1', 'pipeline', [],
+                                   resources={'cpu_request': '500m', 'memory_limit': '2Gi', 'volume_size': '50Gi'})
+
+    assert created['pvc'].metadata.name == 'nf-run-1-work'
+    assert created['pvc'].metadata.labels['analysis-id'] == 'analysis-1'
+    assert created['pvc'].spec.resources.requests == {'storage': '50Gi'}
+
+    pod_spec = created['job'].spec.template.spec
+    container = pod_spec.containers[0]
+    assert container.resources.requests == {'cpu': '500m'}
+    assert container.resources.limits == {'memory': '2Gi'}
+    assert pod_spec.volumes[-1].persistent_volume_claim.claim_name == 'nf-run-1-work'
+    assert 'WORK_DIR="/scratch/work"' in container.args[0]
+
+
+def test_cache_keys_select_shared_assets_and_work_dir(monkeypatch):
+    monkeypatch.setattr(kubernetes, 'RUN_VOLUME_MODE', 'shared')
+    created = _capture(monkeypatch)
+
+    kubernetes.create_nextflow_run(None, 'nf-run-1', 'analysis-1', 'pipeline', [],
+                                   assets_key='assets', work_cache_key='work')
+
+    env = {env.name: env.value for env in created['job'].spec.template.spec.containers[0].env}
+    assert env['NXF_ASSETS'] == '/workspace/.nf-cache/assets/assets'
+    assert env['WORK_CACHE_DIR'] == '/workspace/.nf-cache/work/work'
+
+
+def test_k8s_executor_runs_tasks_from_the_shared_pvc(monkeypatch):
+    monkeypatch.setattr(kubernetes, 'RUN_VOLUME_MODE', 'pvc')
+    created = _capture(monkeypatch)
+    config = executor.k8s_executor_config('nf-run-1', "analysis-'1", 'flame')
+
+    kubernetes.create_nextflow_run(None, 'nf-run-1', "analysis-'1", 'pipeline', [], executor_config=config)
+
+    assert "executor = 'k8s'" in config
+    assert "namespace = 'flame'" in config
+    assert "storageClaimName = 'nextflow-pvc'" in config
+    assert "[label: 'run-id', value: 'nf-run-1']" in config
+    assert "value: 'analysis-\\'1'" in config
+    # task pods mount the shared PVC, so no per-run PVC is created
+    assert 'pvc' not in created
+    container = created['job'].spec.template.spec.containers[0]
+    assert 'WORK_DIR="/workspace/nf-run-1/work"' in container.args[0]
+    assert {env.name: env.value for env in container.env}['EXECUTOR_CONFIG'] == config
+    # the launcher's trace defaults come before the pipeline's config, the executor config after it
+    command = container.args[0][container.args[0].index('nextflow run'):]
+    assert (command.index('"$NXF_HOME/launcher.config"') < command.index('/conf/')
+            < command.index('"$NXF_HOME/executor.config"'))
+    assert '-with-trace "$NXF_HOME/trace.txt"' in command
+
+
+def test_pipeline_prefetch_job_pulls_into_assets_dirs(monkeypatch):
+    created = _capture(monkeypatch)
+    monkeypatch.setattr(warm_pool, 'batch_v1', kubernetes.batch_v1)
+
+    assert warm_pool.parse_prefetch_pipeline('nf-core/demo@1.0') == ('nf-core/demo', '1.0')
+    job_name = warm_pool.create_pipeline_prefetch_job([('nf-core/demo', '1.0', 'key')])
+
+    assert created['job'].metadata.name == job_name
+    assert created['job'].metadata.labels['component'] != 'flame-analysis-nf'
+    script = created['job'].spec.template.spec.containers[0].args[0]
+    assert "NXF_ASSETS='/workspace/.nf-cache/assets/key' nextflow pull 'nf-core/demo' -r '1.0'" in script
@@ -0,0 +1,64 @@
+import copy
+import time
+
+from kubernetes import client
+
+from src.k8s import leader
+from src.k8s.leader import LeaderElector
+
+
+class _FakeCoordinationV1:
+    def __init__(self) -> None:
+        self.lease = None
+        self.version = 0
+
+    def read_namespaced_lease(self, name: str, namespace: str) -> client.V1Lease:
+        if self.lease is None:
+            raise client.exceptions.ApiException(status=404)
+        return copy.deepcopy(self.lease)
+
+    def create_namespaced_lease(self, namespace: str, lease: client.V1Lease) -> client.V1Lease:
+        if self.lease is not None:
+            raise client.exceptions.ApiException(status=409)
+        return self._store(lease)
+
+    def replace_namespaced_lease(self, name: str, namespace: str, lease: client.V1Lease) -> client.V1Lease:
+        if lease.metadata.resource_version != self.lease.metadata.resource_version:
+            raise client.exceptions.ApiException(status=409)
+        return self._store(lease)
+
+    def _store(self, lease: client.V1Lease) -> client.V1Lease:
+        self.version += 1
+        lease.metadata.resource_version = str(self.version)
+        self.lease = copy.deepcopy(lease)
+        return lease
+
+
+async def _noop() -> None:
+    pass
+
+
+def _elector(identity: str) -> LeaderElector:
+    return LeaderElector('default', _noop, _noop, identity=identity, lease_duration=1, renew_interval=0.1)
+
+
+def test_lease_is_held_by_one_process_until_it_expires(monkeypatch):
+    fake = _FakeCoordinationV1()
+    monkeypatch.setattr(leader, 'coordination_v1', lambda: fake)
+    first, second = _elector('launcher-1'), _elector('launcher-2')
+
+    assert first.try_acquire_or_renew()
+    assert not second.try_acquire_or_renew()
+    assert first.try_acquire_or_renew()
+    assert not second.try_acquire_or_renew()
+
+    # first stops renewing, second takes over once it observed the Lease unchanged for lease_duration
+    time.sleep(1.1)
+    assert second.try_acquire_or_renew()
+    assert fake.lease.spec.holder_identity == 'launcher-2'
+    assert fake.lease.spec.lease_transitions == 1
+    assert not first.try_acquire_or_renew()
+
+    # a released Lease is taken over right away
+    second.release()
+    assert first.try_acquire_or_renew()
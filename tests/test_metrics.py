@@ -0,0 +1,47 @@
+import os
+
+from src.api.metrics import Counter, Histogram, MetricsRegistry, gauge_lines
+
+
+def test_registry_renders_prometheus_text_format():
+    registry = MetricsRegistry()
+    stages = registry.register(Histogram("stage_seconds", "Stage durations.", buckets=(0.1, 1)))
+    payload = registry.register(Counter("payload_bytes_total", "Payload bytes."))
+
+    stages.observe(0.05, stage='db_insert')
+    stages.observe(0.5, stage='db_insert')
+    payload.inc(100, direction='download')
+    payload.inc(20, direction='download')
+
+    text = registry.render(gauge_lines("runs", "Runs by status.", {(('status', 'queued'),): 3}))
+    assert '# TYPE nf_launcher_stage_seconds histogram' in text
+    assert 'nf_launcher_stage_seconds_bucket{stage="db_insert",le="0.1"} 1' in text
+    assert 'nf_launcher_stage_seconds_bucket{stage="db_insert",le="1.0"} 2' in text
+    assert 'nf_launcher_stage_seconds_bucket{stage="db_insert",le="+Inf"} 2' in text
+    assert 'nf_launcher_stage_seconds_sum{stage="db_insert"} 0.55' in text
+    assert 'nf_launcher_payload_bytes_total{direction="download"} 120' in text
+    assert 'nf_launcher_runs{status="queued"} 3' in text
+
+
+def test_registry_sums_the_metrics_of_all_workers(tmp_path):
+    registry = MetricsRegistry(multiproc_dir=str(tmp_path))
+    payload = registry.register(Counter("payload_bytes_total", "Payload bytes."))
+    payload.inc(100, direction='download')
+    registry.process_lines = lambda: gauge_lines("http_pool_in_flight", "In flight.", {(): 2})
+
+    # another worker that is still running, and one that exited
+    other = ("# HELP nf_launcher_payload_bytes_total Payload bytes.\n"
+             "# TYPE nf_launcher_payload_bytes_total counter\n"
+             'nf_launcher_payload_bytes_total{direction="download"} 20\n'
+             "# HELP nf_launcher_http_pool_in_flight In flight.\n"
+             "# TYPE nf_launcher_http_pool_in_flight gauge\n"
+             "nf_launcher_http_pool_in_flight 3\n")
+    (tmp_path / f"{os.getppid()}.prom").write_text(other)
+    (tmp_path / "4194305.prom").write_text(other)
+
+    text = registry.render(gauge_lines("runs", "Runs by status.", {(('status', 'queued'),): 3}))
+    assert 'nf_launcher_payload_bytes_total{direction="download"} 140' in text
+    assert 'nf_launcher_http_pool_in_flight 5' in text
+    assert 'nf_launcher_runs{status="queued"} 3' in text
+    assert text.count('# TYPE nf_launcher_payload_bytes_total counter') == 1
+    assert (tmp_path / f"{os.getpid()}.prom").exists()
@@ -0,0 +1,64 @@
+import os
+import time
+
+os.environ.setdefault("KEYCLOAK_URL", "http://keycloak.test")
+
+import jwt
+import pytest
+
+from src.api.oauth import JWKSCache, TokenCache
+
+
+class _StaticJWKSCache(JWKSCache):
+    def __init__(self, kids: list[str]) -> None:
+        super().__init__("http://keycloak.test/certs", min_refetch_interval=0)
+        self.served_kids = kids
+
+    def start(self) -> None:
+        pass
+
+    def _fetch(self) -> None:
+        self._keys = {kid: object() for kid in self.served_kids}
+        self._last_fetch = time.monotonic()
+        self.stats['refetches'] += 1
+
+
+def test_jwks_cache_serves_known_kid_without_refetch():
+    cache = _StaticJWKSCache(['a'])
+    cache.refresh()
+    for _ in range(3):
+        cache.get_signing_key('a')
+    assert cache.stats['refetches'] == 1
+    assert cache.stats['key_hits'] == 3
+
+
+def test_jwks_cache_refetches_once_on_unknown_kid():
+    cache = _StaticJWKSCache(['a'])
+    cache.refresh()
+    cache.served_kids = ['a', 'b']
+    assert cache.get_signing_key('b') is not None
+    assert cache.stats['refetches'] == 2
+    # as valid_access_token does it, each token counts once
+    cache.served_kids = ['a', 'b', 'd']
+    assert cache.lookup('d') is None
+    assert cache.refetch_signing_key('d') is not None
+    assert (cache.stats['key_hits'], cache.stats['key_misses']) == (0, 2)
+
+    cache.min_refetch_interval = 60
+    with pytest.raises(jwt.exceptions.PyJWKClientError):
+        cache.get_signing_key('c')
+    assert cache.stats['refetches'] == 3
+
+
+def test_token_cache_expires_at_exp_and_evicts_lru():
+    cache = TokenCache(max_size=2)
+    cache.put('expired', {'exp': time.time() - 1})
+    assert cache.get('expired') is None
+
+    cache.put('t1', {'exp': time.time() + 60})
+    cache.put('t2', {'exp': time.time() + 60})
+    assert cache.get('t1') is not None
+    cache.put('t3', {'exp': time.time() + 60})
+    assert cache.get('t2') is None
+    assert cache.get('t1') is not None
+    assert cache.get('t3') is not None
@@ -0,0 +1,44 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from benchmarks.offline.fake_k8s import FakeKubernetes, label_selector_matches
+
+JOBS_PATH = "/apis/batch/v1/namespaces/default/jobs"
+
+
+def test_label_selector_matches():
+    labels = {'component': "flame-analysis-nf", 'analysis-id': "a1"}
+    assert label_selector_matches("component=flame-analysis-nf,analysis-id=a1", labels)
+    assert label_selector_matches("component in (flame-result-service,flame-analysis-nf)", labels)
+    assert label_selector_matches("analysis-id,!job-name", labels)
+    assert not label_selector_matches("analysis-id!=a1", labels)
+    assert not label_selector_matches("component notin (flame-analysis-nf)", labels)
+    assert label_selector_matches(None, {})
+
+
+def test_fake_k8s_jobs(tmp_path):
+    fake = FakeKubernetes(str(tmp_path), result_bytes=10, tasks_per_run=2)
+    client = TestClient(fake.app)
+    version = client.get(JOBS_PATH).json()['metadata']['resourceVersion']
+    for name, analysis_id in [("nf-run-1", "a1"), ("nf-run-2", "a2")]:
+        job = {'metadata': {'name': name, 'labels': {'component': "flame-analysis-nf", 'analysis-id': analysis_id}}}
+        assert client.post(JOBS_PATH, json=job).status_code == 201
+    assert client.post(JOBS_PATH, json={'metadata': {'name': "nf-run-1"}}).status_code == 409
+    # Jobs leave their output in the run dir
+    assert (tmp_path / "nf-run-1" / "results" / "output.bin").stat().st_size == 10
+    assert len((tmp_path / "nf-run-1" / ".nextflow" / "trace.txt").read_text().splitlines()) == 3
+
+    jobs = client.get(JOBS_PATH, params={'labelSelector': "analysis-id=a2"}).json()['items']
+    assert [job['metadata']['name'] for job in jobs] == ["nf-run-2"]
+
+    deleted = client.delete(JOBS_PATH, params={'labelSelector': "component=flame-analysis-nf,analysis-id=a1"})
+    assert [job['metadata']['name'] for job in deleted.json()['items']] == ["nf-run-1"]
+    assert client.delete(f"{JOBS_PATH}/nf-run-1").status_code == 404
+    assert set(fake.jobs_deleted) == {"nf-run-1"}
+
+    # a watch from the earlier resourceVersion replays the events since then
+    watch = client.get(JOBS_PATH, params={'watch': "true", 'resourceVersion': version, 'timeoutSeconds': 0})
+    events = [json.loads(line) for line in watch.text.splitlines()]
+    assert [(event['type'], event['object']['metadata']['name']) for event in events] == \
+           [("ADDED", "nf-run-1"), ("ADDED", "nf-run-2"), ("DELETED", "nf-run-1")]
@@ -0,0 +1,53 @@
+import asyncio
+
+import jwt
+import pytest
+from sqlalchemy import inspect
+
+from src.api.oauth import JWKSCache
+from src.api.readiness import DependencyChecks
+from src.resources.database.entity import Database
+
+
+def test_dependency_checks_are_cached_per_dependency():
+    calls = {'database': 0, 'jwks': 0}
+
+    def check_database() -> None:
+        calls['database'] += 1
+
+    def check_jwks() -> None:
+        calls['jwks'] += 1
+        raise ConnectionError("keycloak unreachable")
+
+    async def probe() -> tuple[dict, dict]:
+        readiness = DependencyChecks({'database': check_database, 'jwks': check_jwks}, cache_ttl=60)
+        # concurrent probes share one pass, later ones are served from cache
+        first, _ = await asyncio.gather(readiness.check(), readiness.check())
+        assert not readiness.ready
+        cached = await readiness.check()
+        return first, cached
+
+    first, cached = asyncio.run(probe())
+    assert calls == {'database': 1, 'jwks': 1}
+    assert first['database']['ready'] and first['database']['error'] is None
+    assert not first['jwks']['ready'] and 'keycloak unreachable' in first['jwks']['error']
+    assert cached == first
+
+
+def test_database_migrates_on_demand(tmp_path):
+    database = Database(f"sqlite:///{tmp_path / 'launcher.db'}", migrate=False)
+    database.ping()
+    assert not database.migrated
+    assert not inspect(database.engine).has_table('nextflow_runs')
+
+    database.migrate()
+    assert database.migrated
+    assert inspect(database.engine).has_table('nextflow_runs')
+
+
+def test_jwks_cache_without_keycloak_url(monkeypatch):
+    monkeypatch.delenv("KEYCLOAK_URL", raising=False)
+    cache = JWKSCache()
+    assert cache.jwks_url is None
+    with pytest.raises(jwt.exceptions.PyJWKClientError):
+        cache.ensure_loaded()
@@ -0,0 +1,95 @@
+import os
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from kubernetes import client
+
+from src.resources.database.db_models import NextflowRunDB, RunStatus
+from src.resources.database.entity import Database
+from src.resources.nextflow_run import entity, reconciler, staging
+from src.resources.nextflow_run.reconciler import find_stale_work_dirs, plan_reconciliation, prune_work_dirs
+
+NOW = 1_700_000_000.0
+
+
+def _job(name: str, age: float, condition_type: str = None) -> client.V1Job:
+    conditions = [client.V1JobCondition(type=condition_type, status='True')] if condition_type else None
+    created = datetime.fromtimestamp(NOW - age, tz=timezone.utc)
+    return client.V1Job(metadata=client.V1ObjectMeta(name=name, creation_timestamp=created),
+                        status=client.V1JobStatus(conditions=conditions))
+
+
+def _run(run_id: str, status: str, age: float) -> NextflowRunDB:
+    return NextflowRunDB(run_id=run_id, analysis_id='analysis-1', status=status,
+                         time_created=NOW - age, time_started=NOW - age)
+
+
+def test_plan_reconciliation_diffs_jobs_against_rows():
+    jobs = [_job('nf-run-finished', 60, 'Complete'),
+            _job('nf-run-orphan', 3600),
+            _job('nf-run-new-orphan', 10),
+            _job('nf-run-concluded', 3600, 'Failed'),
+            _job('nf-run-running', 3600),
+            _job('nf-run-concluding', 3600, 'Complete')]
+    nf_runs = [_run('nf-run-finished', RunStatus.RUNNING, 60),
+               _run('nf-run-concluded', RunStatus.FAILED, 3600),
+               _run('nf-run-running', RunStatus.RUNNING, 3600),
+               _run('nf-run-lost', RunStatus.RUNNING, 3600),
+               _run('nf-run-starting', RunStatus.STARTING, 3600),
+               _run('nf-run-old', RunStatus.SUCCEEDED, 30 * 24 * 3600),
+               _run('nf-run-long', RunStatus.SUCCEEDED, 30 * 24 * 3600),
+               _run('nf-run-concluding', RunStatus.CONCLUDING, 3600),
+               _run('nf-run-abandoned', RunStatus.CONCLUDING, 3 * 3600)]
+    # submitted long ago but only just finished
+    nf_runs[6].time_finished = NOW - 60
+    nf_runs[-2].time_claimed = NOW - 60
+    nf_runs[-1].time_claimed = NOW - 2 * 3600
+
+    plan = plan_reconciliation(jobs, nf_runs, NOW, grace=600, row_ttl=7 * 24 * 3600, conclude_claim_timeout=3600)
+
+    assert plan['conclude'] == [('nf-run-finished', 'succeeded'), ('nf-run-lost', 'failed')]
+    assert plan['delete_job'] == ['nf-run-orphan', 'nf-run-concluded']
+    assert plan['delete_row'] == ['nf-run-old']
+    assert plan['release_conclusion'] == ['nf-run-abandoned']
+
+
+def test_stale_work_dirs_are_pruned_unless_in_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(reconciler, 'NF_WORKSPACE_PATH', str(tmp_path))
+    monkeypatch.setattr(staging, 'NF_WORKSPACE_PATH', str(tmp_path))
+    for run_id in ['nf-run-stale', 'nf-run-active', 'nf-run-fresh', '.nf-cache']:
+        (tmp_path / run_id).mkdir()
+        (tmp_path / run_id / 'data').write_bytes(b'x' * 100)
+    for run_id in ['nf-run-stale', 'nf-run-active', '.nf-cache']:
+        os.utime(tmp_path / run_id, (NOW - 7200, NOW - 7200))
+    os.utime(tmp_path / 'nf-run-fresh', (NOW - 60, NOW - 60))
+
+    stale = find_stale_work_dirs({'nf-run-active'}, NOW, ttl=3600)
+    assert stale == ['nf-run-stale']
+
+    assert prune_work_dirs(stale, dry_run=True) == 100
+    assert (tmp_path / 'nf-run-stale').exists()
+    assert prune_work_dirs(stale, dry_run=False) == 100
+    assert not (tmp_path / 'nf-run-stale').exists()
+
+
+def test_reconcile_deletes_jobs_with_their_task_pods_and_work_dir_pvcs(tmp_path, monkeypatch):
+    database = Database(f"sqlite:///{tmp_path}/runs.db")
+    database.create_nf_run('nf-run-done', 'analysis-1', 'token', NOW, status=RunStatus.SUCCEEDED, executor='local')
+    jobs = client.V1JobList(items=[_job('nf-run-done', 60, 'Complete'), _job('nf-run-orphan', 3600)])
+    monkeypatch.setattr(reconciler, 'batch_v1', lambda: SimpleNamespace(list_namespaced_job=lambda **_: jobs))
+    monkeypatch.setattr(reconciler, 'NF_WORKSPACE_PATH', str(tmp_path / 'workspace'))
+    monkeypatch.setattr(entity, 'RUN_VOLUME_MODE', 'pvc')
+    deleted = []
+    monkeypatch.setattr(entity, 'delete_k8s_resource',
+                        lambda name, resource_type, namespace: deleted.append((resource_type, name)))
+    monkeypatch.setattr(entity, 'delete_run_task_pods', lambda run_id, namespace: deleted.append(('pods', run_id)))
+
+    async def conclude_run(run_id: str, run_status: str) -> bool:
+        return True
+
+    summary = asyncio.run(reconciler.Reconciler(database, conclude_run, interval=0).reconcile(dry_run=False))
+
+    assert summary['delete_job'] == 2
+    assert sorted(deleted) == [('job', 'nf-run-done'), ('job', 'nf-run-orphan'), ('pods', 'nf-run-orphan'),
+                               ('pvc', 'nf-run-done-work'), ('pvc', 'nf-run-orphan-work')]
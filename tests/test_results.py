@@ -0,0 +1,67 @@
+import io
+import asyncio
+import tarfile
+
+import httpx
+import zstandard
+
+from src.resources.clients.storage_client import StorageClient
+from src.resources.nextflow_run import results
+
+
+async def _collect(storage_location: str) -> list[bytes]:
+    return [chunk async for chunk in results.stream_result(storage_location)]
+
+
+def test_stream_result_chunks_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(results, 'RESULT_CHUNK_SIZE', 1000)
+    result_file = tmp_path / 'result.bin'
+    result_file.write_bytes(b'x' * 2500)
+
+    chunks = asyncio.run(_collect(str(result_file)))
+
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 500]
+
+
+def test_stream_result_archives_directory_without_excluded_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(results, 'RESULT_CHUNK_SIZE', 64)
+    run_dir = tmp_path / 'nf-run-1'
+    (run_dir / 'results').mkdir(parents=True)
+    (run_dir / 'results' / 'out.vcf').write_text('variants')
+    (run_dir / '.nextflow').mkdir()
+    (run_dir / '.nextflow' / 'assets').write_text('pipeline')
+    (run_dir / 'input').write_text('input')
+    (run_dir / 'work' / 'ab' / 'cdef').mkdir(parents=True)
+    (run_dir / 'work' / 'ab' / 'cdef' / 'intermediate.bam').write_text('reads')
+
+    archive = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(b''.join(asyncio.run(_collect(str(run_dir))))))
+    with tarfile.open(fileobj=archive, mode='r|') as tar:
+        names = tar.getnames()
+
+    assert results.result_extension(str(run_dir)) == '.tar.zst'
+    assert 'nf-run-1/results/out.vcf' in names
+    assert not [name for name in names if name.startswith(('nf-run-1/.nextflow', 'nf-run-1/input', 'nf-run-1/work'))]
+
+
+def test_push_result_streams_multipart_body():
+    received = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        received['content_type'] = request.headers['Content-Type']
+        received['body'] = request.read()
+        return httpx.Response(200, json={'id': 'storage-id'})
+
+    storage_client = StorageClient.__new__(StorageClient)
+    storage_client.client = httpx.AsyncClient(base_url="http://result-service/storage",
+                                              transport=httpx.MockTransport(handler))
+    storage_client.headers = {"Authorization": "Bearer token"}
+
+    async def chunks():
+        yield b'part-1'
+        yield b'part-2'
+
+    assert asyncio.run(storage_client.push_result(chunks(), '.tar')) == 'storage-id'
+    boundary = received['content_type'].split('boundary=')[1]
+    assert received['body'].startswith(f'--{boundary}\r\n'.encode())
+    assert b'.tar"\r\n' in received['body']
+    assert received['body'].endswith(f'part-1part-2\r\n--{boundary}--\r\n'.encode())
@@ -0,0 +1,106 @@
+import asyncio
+
+from kubernetes import client
+
+from src.k8s import logs
+from src.k8s.logs import LogStreams
+from src.k8s.run_state import RunStateStore
+
+
+def _job(name: str, active: int = 1) -> client.V1Job:
+    return client.V1Job(metadata=client.V1ObjectMeta(name=name), status=client.V1JobStatus(active=active))
+
+
+def _pod(name: str, run_id: str, phase: str = 'Running') -> client.V1Pod:
+    running = client.V1ContainerState(running=client.V1ContainerStateRunning())
+    return client.V1Pod(metadata=client.V1ObjectMeta(name=name, labels={'job-name': run_id}),
+                        spec=client.V1PodSpec(containers=[], node_name='node-1'),
+                        status=client.V1PodStatus(phase=phase, container_statuses=[
+                            client.V1ContainerStatus(name='nf', image='nf', image_id='', ready=True,
+                                                     restart_count=0, state=running)]))
+
+
+def test_run_state_store_tracks_jobs_and_pods():
+    store = RunStateStore()
+    store.set_jobs([_job('nf-run-1'), _job('nf-run-2')])
+    store.set_pods([_pod('nf-run-1-abc', 'nf-run-1')])
+
+    state = store.get('nf-run-1')
+    assert state['job']['active'] == 1
+    assert state['pod']['phase'] == 'Running'
+    assert state['pod']['container']['state'] == 'running'
+    assert store.pod_name('nf-run-1') == 'nf-run-1-abc'
+
+    # a deleted pod replaced by a retry must not drop the retry's state
+    store.update_pod('ADDED', _pod('nf-run-1-def', 'nf-run-1', 'Pending'))
+    store.update_pod('DELETED', _pod('nf-run-1-abc', 'nf-run-1'))
+    assert store.pod_name('nf-run-1') == 'nf-run-1-def'
+
+    store.update_job('DELETED', _job('nf-run-2'))
+    assert store.get('nf-run-2') == {'job': None, 'pod': None}
+
+
+class _FakeLogResponse:
+    def __init__(self, chunks: list[bytes]) -> None:
+        self.chunks = chunks
+
+    def stream(self, amt: int):
+        yield from self.chunks
+
+    def close(self) -> None:
+        pass
+
+
+class _FakeCoreV1:
+    def __init__(self) -> None:
+        self.requests = 0
+
+    def read_namespaced_pod_log(self, **kwargs) -> _FakeLogResponse:
+        self.requests += 1
+        return _FakeLogResponse([b'line 1\nli', b'ne 2\n', b'line 3'])
+
+
+def test_log_streams_share_one_upstream_request(monkeypatch):
+    fake = _FakeCoreV1()
+    monkeypatch.setattr(logs, 'core_v1', lambda: fake)
+
+    async def read_all(queue: asyncio.Queue) -> list[str]:
+        lines = []
+        while (line := await queue.get()) is not None:
+            lines.append(line)
+        return lines
+
+    async def scenario() -> list[list[str]]:
+        streams = LogStreams('default')
+        broadcaster = streams.get('nf-run-1', 'nf-run-1-abc')
+        queues = [broadcaster.subscribe(), streams.get('nf-run-1', 'nf-run-1-abc').subscribe()]
+        return await asyncio.gather(*map(read_all, queues))
+
+    results = asyncio.run(scenario())
+    assert results == [['line 1', 'line 2', 'line 3']] * 2
+    assert fake.requests == 1
+
+
+def test_clients_of_a_replaced_pod_release_their_own_broadcaster(monkeypatch):
+    fake = _FakeCoreV1()
+    monkeypatch.setattr(logs, 'core_v1', lambda: fake)
+
+    async def scenario():
+        streams = LogStreams('default')
+        old = streams.get('nf-run-1', 'nf-run-1-abc')
+        old_queue = old.subscribe()
+        # the run's pod was replaced by a retry
+        new = streams.get('nf-run-1', 'nf-run-1-def')
+        new_queue = new.subscribe()
+        assert new is not old
+
+        streams.release('nf-run-1', old, old_queue)
+        assert old.idle and old._stop_event.is_set()
+        assert streams.get('nf-run-1', 'nf-run-1-def') is new
+        assert not new.idle
+        streams.release('nf-run-1', new, new_queue)
+        assert new.idle and 'nf-run-1' not in streams._broadcasters
+        for broadcaster in [old, new]:
+            await asyncio.to_thread(broadcaster._thread.join)
+
+    asyncio.run(scenario())
@@ -0,0 +1,112 @@
+import asyncio
+
+from src.resources.database.db_models import RunStatus
+from src.resources.database.entity import Database
+from src.resources.nextflow_run.entity import NextflowRunEntity
+from src.resources.nextflow_run.scheduler import RunScheduler, select_runs
+
+
+def _queue(database: Database, runs: list[tuple[str, str]]) -> None:
+    for i, (run_id, analysis_id) in enumerate(runs):
+        database.create_nf_run(run_id, analysis_id, 'token', float(i),
+                               pipeline_name='pipeline', run_args=[], input_location='input')
+
+
+def test_select_runs_shares_slots_fairly_across_analyses():
+    database = Database("sqlite://")
+    _queue(database, [('a-1', 'a'), ('a-2', 'a'), ('a-3', 'a'), ('b-1', 'b'), ('c-1', 'c')])
+    queued = database.get_queued_nf_runs()
+
+    selected = select_runs(queued, {}, max_concurrent_runs=4, max_runs_per_analysis=0)
+    assert [nf_run.run_id for nf_run in selected] == ['a-1', 'b-1', 'c-1', 'a-2']
+
+    selected = select_runs(queued, {'a': 1}, max_concurrent_runs=10, max_runs_per_analysis=2)
+    assert [nf_run.run_id for nf_run in selected] == ['b-1', 'c-1', 'a-1']
+
+    assert select_runs(queued, {'x': 3}, max_concurrent_runs=3, max_runs_per_analysis=0) == []
+
+
+def test_scheduler_claims_and_launches_queued_runs(monkeypatch, tmp_path):
+    # file database, in-memory SQLite is per connection and the scheduler queries from worker threads
+    database = Database(f"sqlite:///{tmp_path}/runs.db")
+    _queue(database, [('a-1', 'a'), ('a-2', 'a'), ('b-1', 'b')])
+    launched = []
+
+    async def launch(self) -> None:
+        launched.append(self.run_id)
+    monkeypatch.setattr(NextflowRunEntity, 'launch', launch)
+
+    async def scenario():
+        scheduler = RunScheduler(database, max_concurrent_runs=2)
+        started = await scheduler.schedule()
+        await asyncio.gather(*scheduler._launches)
+        return started, await scheduler.schedule()
+
+    assert database.get_queue_position('b-1') == 2
+    started, started_later = asyncio.run(scenario())
+    assert started == ['a-1', 'b-1']
+    assert started_later == []
+    assert sorted(launched) == ['a-1', 'b-1']
+    assert database.get_nf_run_by_run_id('a-1').status == RunStatus.RUNNING
+    assert database.get_queue_position('a-2') == 0
+
+    database.update_nf_run_status('a-1', RunStatus.SUCCEEDED)
+    assert not database.update_nf_run_status('a-1', RunStatus.STARTING, expected_status=(RunStatus.QUEUED,))
+
+
+def test_stop_abandons_launches_and_only_expired_claims_are_requeued(monkeypatch, tmp_path):
+    database = Database(f"sqlite:///{tmp_path}/runs.db")
+    _queue(database, [('a-1', 'a'), ('b-1', 'b')])
+    staging = asyncio.Event()
+
+    async def launch(self) -> None:
+        staging.set()
+        await asyncio.sleep(3600)
+    monkeypatch.setattr(NextflowRunEntity, 'launch', launch)
+
+    async def scenario():
+        old_leader = RunScheduler(database, claim_timeout=60)
+        await old_leader.schedule()
+        await staging.wait()
+        launches = list(old_leader._launches)
+        await old_leader.stop()
+        assert all(task.cancelled() for task in launches)
+
+        # the claims of the old leader are still valid when the next one starts
+        new_leader = RunScheduler(database, claim_timeout=60)
+        assert await new_leader.requeue_expired_claims() == 0
+        assert await new_leader.schedule() == []
+        # and are requeued once they expired
+        new_leader.claim_timeout = -1
+        assert await new_leader.requeue_expired_claims() == 2
+
+    asyncio.run(scenario())
+    assert database.get_nf_run_by_run_id('a-1').status == RunStatus.QUEUED
+    assert database.get_nf_run_by_run_id('a-1').claimed_by is None
+
+
+def test_failed_launch_leaves_a_run_claimed_by_another_scheduler_alone(monkeypatch, tmp_path):
+    database = Database(f"sqlite:///{tmp_path}/runs.db")
+    _queue(database, [('a-1', 'a'), ('b-1', 'b')])
+    concluded = []
+
+    async def launch(self) -> None:
+        if self.run_id == 'a-1':
+            # the claim expired meanwhile, another scheduler requeued and claimed the run
+            database.update_nf_run_status('a-1', RunStatus.STARTING, claimed_by='other-scheduler')
+        raise RuntimeError("launch failed")
+
+    async def conclude(self, run_status: str) -> None:
+        concluded.append((self.run_id, run_status))
+    monkeypatch.setattr(NextflowRunEntity, 'launch', launch)
+    monkeypatch.setattr(NextflowRunEntity, 'conclude', conclude)
+
+    async def scenario():
+        scheduler = RunScheduler(database)
+        await scheduler.schedule()
+        await asyncio.gather(*scheduler._launches)
+
+    asyncio.run(scenario())
+    assert database.get_nf_run_by_run_id('a-1').status == RunStatus.STARTING
+    assert database.get_nf_run_by_run_id('b-1').status == RunStatus.FAILED
+    assert concluded == [('b-1', RunStatus.FAILED)]
@@ -0,0 +1,70 @@
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from src.resources.clients.storage_client import StorageClient
+from src.resources.nextflow_run import staging
+
+PAYLOAD = bytes(range(256)) * 4096
+
+
+def _storage_client(handler) -> StorageClient:
+    storage_client = StorageClient.__new__(StorageClient)
+    storage_client.client = httpx.AsyncClient(base_url="http://result-service/storage",
+                                              transport=httpx.MockTransport(handler))
+    storage_client.headers = {"Authorization": "Bearer token"}
+    return storage_client
+
+
+def _range_handler(request: httpx.Request) -> httpx.Response:
+    range_header = request.headers.get('Range')
+    if range_header:
+        offset = int(range_header.removeprefix('bytes=').rstrip('-'))
+        return httpx.Response(206, content=PAYLOAD[offset:])
+    return httpx.Response(200, content=PAYLOAD)
+
+
+def test_stage_input_resumes_partial_download(tmp_path, monkeypatch):
+    monkeypatch.setattr(staging, 'NF_WORKSPACE_PATH', str(tmp_path))
+    (tmp_path / 'nf-run-1').mkdir()
+    (tmp_path / 'nf-run-1' / 'input.part').write_bytes(PAYLOAD[:1000])
+    requested_ranges = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested_ranges.append(request.headers.get('Range'))
+        return _range_handler(request)
+
+    input_path = asyncio.run(staging.stage_input(_storage_client(handler),
+                                                 'storage-id',
+                                                 'nf-run-1',
+                                                 hashlib.sha256(PAYLOAD).hexdigest()))
+
+    assert input_path == "/workspace/nf-run-1/input"
+    assert requested_ranges == ['bytes=1000-']
+    assert (tmp_path / 'nf-run-1' / 'input').read_bytes() == PAYLOAD
+    assert not (tmp_path / 'nf-run-1' / 'input.part').exists()
+
+
+def test_stage_input_rejects_checksum_mismatch(tmp_path, monkeypatch):
+    monkeypatch.setattr(staging, 'NF_WORKSPACE_PATH', str(tmp_path))
+
+    with pytest.raises(HTTPException):
+        asyncio.run(staging.stage_input(_storage_client(_range_handler), 'storage-id', 'nf-run-2', '0' * 64))
+    assert not (tmp_path / 'nf-run-2' / 'input').exists()
+    assert not (tmp_path / 'nf-run-2' / 'input.part').exists()
+
+
+def test_stage_input_reports_corrupt_zstd_input(tmp_path, monkeypatch):
+    monkeypatch.setattr(staging, 'NF_WORKSPACE_PATH', str(tmp_path))
+    corrupt = b'\x28\xb5\x2f\xfd' + b'\xff' * 64
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=corrupt)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(staging.stage_input(_storage_client(handler), 'storage-id', 'nf-run-3'))
+    assert 'Unusable input' in error.value.detail
+    assert not (tmp_path / 'nf-run-3' / 'input.part').exists()
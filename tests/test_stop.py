@@ -0,0 +1,56 @@
+import asyncio
+
+from kubernetes.client.exceptions import ApiException
+
+from src.resources.database.db_models import RunStatus
+from src.resources.database.entity import Database
+from src.resources.nextflow_run import entity
+from src.resources.nextflow_run.entity import NextflowRunEntity
+
+
+def _database(tmp_path) -> Database:
+    database = Database(f"sqlite:///{tmp_path}/runs.db")
+    for i, run_id in enumerate(['nf-run-labelled', 'nf-run-unlabelled', 'nf-run-gone', 'nf-run-stuck']):
+        database.create_nf_run(run_id, 'analysis-1', 'token', float(i), status=RunStatus.RUNNING)
+    return database
+
+
+def _delete_nextflow_run(run_id: str, namespace: str) -> bool:
+    if run_id == 'nf-run-stuck':
+        raise ApiException(status=500, reason="Internal Server Error")
+    return run_id != 'nf-run-gone'
+
+
+def test_stop_all_deletes_labelled_jobs_at_once_and_keeps_runs_whose_job_survived(tmp_path, monkeypatch):
+    database = _database(tmp_path)
+    monkeypatch.setattr(entity, 'delete_analysis_nextflow_runs', lambda analysis_id, namespace: ['nf-run-labelled'])
+    monkeypatch.setattr(entity, 'delete_nextflow_run', _delete_nextflow_run)
+
+    outcomes = asyncio.run(NextflowRunEntity.stop_all(database, 'analysis-1'))
+
+    assert {run_id: outcome.split(':')[0] for run_id, outcome in outcomes.items()} == {
+        'nf-run-labelled': 'stopped', 'nf-run-unlabelled': 'stopped', 'nf-run-gone': 'not found',
+        'nf-run-stuck': 'error'}
+    assert [nf_run.run_id for nf_run in database.get_nf_runs()] == ['nf-run-stuck']
+
+
+def test_stop_all_falls_back_to_single_deletes_when_collection_delete_fails(tmp_path, monkeypatch):
+    database = _database(tmp_path)
+    deleted = []
+
+    def delete_analysis_nextflow_runs(analysis_id: str, namespace: str) -> list[str]:
+        raise ApiException(status=403, reason="Forbidden")
+
+    def delete_nextflow_run(run_id: str, namespace: str) -> bool:
+        deleted.append(run_id)
+        return _delete_nextflow_run(run_id, namespace)
+
+    monkeypatch.setattr(entity, 'delete_analysis_nextflow_runs', delete_analysis_nextflow_runs)
+    monkeypatch.setattr(entity, 'delete_nextflow_run', delete_nextflow_run)
+
+    outcomes = asyncio.run(NextflowRunEntity.stop_all(database, 'analysis-1'))
+
+    assert sorted(deleted) == ['nf-run-gone', 'nf-run-labelled', 'nf-run-stuck', 'nf-run-unlabelled']
+    assert outcomes['nf-run-labelled'] == 'stopped'
+    assert outcomes['nf-run-stuck'].startswith('error: ')
+    assert [nf_run.run_id for nf_run in database.get_nf_runs()] == ['nf-run-stuck']
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from src.resources.database.db_models import RunStatus
+from src.resources.database.entity import Database
+from src.resources.nextflow_run.entity import NextflowRunEntity
+
+
+def _run(input_location: str = 'input', idempotency_key: str = None,
+         analysis_id: str = 'analysis-1') -> NextflowRunEntity:
+    return NextflowRunEntity(analysis_id=analysis_id, keycloak_token='token', pipeline_name='pipeline',
+                             run_args=['--x', '1'], input_location=input_location, idempotency_key=idempotency_key)
+
+
+def test_duplicate_submissions_return_the_unfinished_run(tmp_path):
+    database = Database(f"sqlite:///{tmp_path}/runs.db")
+
+    async def scenario():
+        first = _run()
+        assert await first.submit(database) is None
+        duplicate = await _run().submit(database)
+        assert duplicate.run_id == first.run_id
+        assert await _run('other-input').submit(database) is None
+
+        # a finished run may be repeated, a run with the same idempotency key never
+        database.update_nf_run_status(first.run_id, RunStatus.SUCCEEDED)
+        assert await _run().submit(database) is None
+        keyed = _run('keyed', idempotency_key='key-1')
+        assert await keyed.submit(database) is None
+        database.update_nf_run_status(keyed.run_id, RunStatus.FAILED)
+        assert (await _run('keyed', idempotency_key='key-1').submit(database)).run_id == keyed.run_id
+
+    asyncio.run(scenario())
+
+
+def test_idempotency_keys_are_scoped_to_the_analysis_and_payload(tmp_path):
+    database = Database(f"sqlite:///{tmp_path}/runs.db")
+
+    async def scenario():
+        keyed = _run('keyed', idempotency_key='key-1')
+        assert await keyed.submit(database) is None
+        # the same key of another analysis is another run
+        other = _run('keyed', idempotency_key='key-1', analysis_id='analysis-2')
+        assert await other.submit(database) is None
+        with pytest.raises(HTTPException) as error:
+            await _run('changed', idempotency_key='key-1').submit(database)
+        assert error.value.status_code == 422
+
+        batch = [_run('changed', idempotency_key='key-1'), _run('new', idempotency_key='key-2'),
+                 _run('changed', idempotency_key='key-2')]
+        duplicates, rejected = await NextflowRunEntity.submit_all(database, batch)
+        assert duplicates == {}
+        assert set(rejected) == {batch[0].run_id, batch[2].run_id}
+        assert len(database.get_queued_nf_runs()) == 3
+
+    asyncio.run(scenario())
+
+
+def test_batch_submission_deduplicates_within_and_across_batches(tmp_path):
+    database = Database(f"sqlite:///{tmp_path}/runs.db")
+
+    async def scenario():
+        existing = _run('a')
+        await existing.submit(database)
+        batch = [_run('a'), _run('b'), _run('b'), _run('c', idempotency_key='key-1')]
+        duplicates, rejected = await NextflowRunEntity.submit_all(database, batch)
+        assert rejected == {}
+        assert duplicates == {batch[0].run_id: (existing.run_id, RunStatus.QUEUED),
+                              batch[2].run_id: (batch[1].run_id, RunStatus.QUEUED)}
+        assert len(database.get_queued_nf_runs()) == 3
+
+    asyncio.run(scenario())
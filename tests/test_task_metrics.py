@@ -0,0 +1,49 @@
+import asyncio
+
+from src.resources.database.entity import Database
+from src.resources.nextflow_run.task_metrics import TaskRecordBuffer, finished_task_rows, summarize_tasks, task_row
+
+GiB = 1024 ** 3
+
+
+def _trace_task(task_id: int, realtime: int, pct_cpu: str, peak_rss: int, status: str = 'COMPLETED') -> dict:
+    # as read from a raw trace file
+    return {'task_id': str(task_id), 'name': f'ALIGN ({task_id})', 'process': 'ALIGN', 'status': status,
+            'exit': '0', 'complete': '1700000060000', 'cpus': '4', 'memory': str(8 * GiB),
+            'realtime': str(realtime), '%cpu': pct_cpu, 'peak_rss': str(peak_rss), 'rchar': '-', 'wchar': '10'}
+
+
+def test_task_row_parses_raw_trace_values():
+    row = task_row('nf-run-1', 'nf-core/rnaseq', _trace_task(1, 60000, '150.0%', 2 * GiB))
+    assert row['process'] == 'ALIGN'
+    assert row['memory'] == 8 * GiB
+    assert row['pct_cpu'] == 150.0
+    assert row['rchar'] is None
+    assert row['time_completed'] == 1700000060
+
+    trace = [_trace_task(1, 60000, '100.0', GiB), _trace_task(2, 0, '-', 0, status='CACHED')]
+    assert len(finished_task_rows('nf-run-1', None, trace)) == 1
+
+
+def test_task_stats_from_batched_inserts(tmp_path):
+    database = Database(f"sqlite:///{tmp_path / 'launcher.db'}")
+    tasks = [_trace_task(i, 1000 * i, '100.0', i * GiB // 10) for i in range(1, 11)]
+
+    async def ingest() -> int:
+        buffer = TaskRecordBuffer(database, flush_size=4)
+        buffer.add([task_row('nf-run-1', 'nf-core/rnaseq', task) for task in tasks], source='trace')
+        return await buffer.flush()
+
+    assert asyncio.run(ingest()) == 10
+    nf_tasks = database.get_nf_tasks_by_pipeline('nf-core/rnaseq', limit=100)
+    assert len(nf_tasks) == 10
+
+    stats = summarize_tasks(nf_tasks)['ALIGN']
+    assert stats['tasks'] == 10
+    assert stats['realtime_ms']['p50'] == 5000
+    assert stats['realtime_ms']['max'] == 10000
+    assert stats['peak_rss_bytes']['max'] == GiB
+    # one of four requested CPUs used
+    assert stats['cpu_wasted_fraction'] == 0.75
+    assert stats['suggested_cpus'] == 1
+    assert stats['memory_wasted_fraction'] > 0.9
@@ -0,0 +1,15 @@
+import os
+
+from src.resources.nextflow_run import staging
+from src.resources.nextflow_run.timings import read_run_timings
+
+
+def test_read_run_timings_from_wrapper_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(staging, 'NF_WORKSPACE_PATH', str(tmp_path))
+    nxf_home = tmp_path / 'nf-run-1' / '.nextflow'
+    os.makedirs(nxf_home)
+    (nxf_home / 'container_started').write_text("1700000010.5\n")
+    (nxf_home / 'trace.txt').write_text("task_id\tsubmit\n2\t1700000030000\n1\t1700000020000\n3\t-\n")
+
+    assert read_run_timings('nf-run-1') == {'time_container_started': 1700000010.5, 'time_first_task': 1700000020.0}
+    assert read_run_timings('nf-run-2') == {'time_container_started': None, 'time_first_task': None}
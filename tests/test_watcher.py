@@ -0,0 +1,55 @@
+import asyncio
+
+from kubernetes import client
+
+from src.k8s.watcher import JobWatcher, get_job_run_status
+
+
+def _job(name: str, condition_type: str = None) -> client.V1Job:
+    conditions = [client.V1JobCondition(type=condition_type, status='True')] if condition_type else None
+    return client.V1Job(metadata=client.V1ObjectMeta(name=name, resource_version='1'),
+                        status=client.V1JobStatus(conditions=conditions))
+
+
+def test_get_job_run_status():
+    assert get_job_run_status(_job('nf-run-1')) is None
+    assert get_job_run_status(_job('nf-run-1', 'Complete')) == 'succeeded'
+    assert get_job_run_status(_job('nf-run-1', 'Failed')) == 'failed'
+
+
+def test_job_watcher_dispatches_each_finished_job_once():
+    concluded = []
+
+    async def on_job_finished(run_id: str, run_status: str) -> None:
+        concluded.append((run_id, run_status))
+
+    async def scenario() -> None:
+        watcher = JobWatcher('default', on_job_finished, asyncio.get_running_loop())
+        for job in [_job('nf-run-1'), _job('nf-run-1', 'Complete'), _job('nf-run-1', 'Complete'),
+                    _job('nf-run-2', 'Failed')]:
+            await asyncio.to_thread(watcher._handle, job)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert concluded == [('nf-run-1', 'succeeded'), ('nf-run-2', 'failed')]
+
+
+def test_enabling_dispatch_leaves_the_relist_to_the_watch_thread():
+    concluded = []
+    lists = []
+
+    async def on_job_finished(run_id: str, run_status: str) -> None:
+        concluded.append((run_id, run_status))
+
+    async def scenario() -> None:
+        watcher = JobWatcher('default', on_job_finished, asyncio.get_running_loop(), dispatch=False)
+        watcher.list_func = lambda: lambda **kwargs: lists.append(kwargs)
+        await asyncio.to_thread(watcher.on_list, [_job('nf-run-1', 'Complete')])
+        watcher.set_dispatch(True)
+        assert lists == [] and watcher._relist_event.is_set()
+        # as relisted by the watch thread
+        await asyncio.to_thread(watcher.on_list, [_job('nf-run-1', 'Complete'), _job('nf-run-2', 'Failed')])
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert sorted(concluded) == [('nf-run-1', 'succeeded'), ('nf-run-2', 'failed')]
@@ -0,0 +1,29 @@
+import os
+
+from src.resources.nextflow_run import work_cache
+
+
+def test_cache_keys_depend_on_pipeline_revision():
+    assert work_cache.pipeline_revision(['--foo', 'bar', '-r', '1.2.0']) == '1.2.0'
+    assert work_cache.pipeline_revision(['--foo', 'bar']) is None
+
+    assert work_cache.assets_key('nf-core/demo', ['-r', '1.0']) == work_cache.assets_key('nf-core/demo', ['-r', '1.0'])
+    assert work_cache.assets_key('nf-core/demo', ['-r', '1.0']) != work_cache.assets_key('nf-core/demo', ['-r', '2.0'])
+    assert (work_cache.work_cache_key('analysis-1', 'nf-core/demo', [])
+            != work_cache.work_cache_key('analysis-2', 'nf-core/demo', []))
+
+
+def test_evict_work_caches_removes_least_recently_used_first(monkeypatch, tmp_path):
+    monkeypatch.setattr(work_cache, 'NF_WORKSPACE_PATH', str(tmp_path))
+    for i, key in enumerate(['old', 'busy', 'recent']):
+        work_cache.touch_work_cache(key)
+        with open(os.path.join(work_cache.get_local_work_cache_dir(key), 'task.out'), 'wb') as task_file:
+            task_file.write(b'x' * 100)
+        marker = os.path.join(work_cache.get_local_work_cache_dir(key), work_cache.LAST_USED_MARKER)
+        os.utime(marker, (1000 + i, 1000 + i))
+
+    assert work_cache.evict_work_caches({'busy'}, max_size=150, dry_run=True) == ['old', 'recent']
+    assert len(os.listdir(work_cache.get_local_work_cache_dir())) == 3
+    assert work_cache.evict_work_caches({'busy'}, max_size=150) == ['old', 'recent']
+    assert os.listdir(work_cache.get_local_work_cache_dir()) == ['busy']
+    assert work_cache.evict_work_caches(set(), max_size=1000) == []